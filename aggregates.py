@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Running per-(Øl, Navn) aggregates for the charts.
+
+The index keeps sums of every score component and a rating count for each
+(Øl, Navn) pair. New ratings are folded in as they arrive, so building a
+chart costs O(beers x connoisseurs) no matter how many ratings exist.
+
+Ratings are keyed by (Dato, Øl, Navn) (ratings.KEY). The index remembers
+the scores it counted for each key, so a rating that replaces an older
+one (or a tombstone that deletes it) first takes the old scores back out
+of the sums; nothing is recomputed from scratch.
+
+The same sums are also indexed by Navn, so one connoisseur's breakdown
+(`breakdown`, for the navn_detail chart) is a lookup of their Øl, not a
+filter over every pair.
+
+TotalScore is also summed per (Dato, Øl) (`day_totals`), the input of the
+day-by-day standings in timeline.py.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ratings import KEY, frame_keys, is_tombstone, rating_key
+
+COMPONENTS = ['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+METRICS = COMPONENTS + ['TotalScore']
+KEYS = ['Øl', 'Navn']
+# Columns of a connoisseur's breakdown (see navn_breakdown)
+BREAKDOWN = ['Øl'] + COMPONENTS + ['Total']
+# Columns of AggregateIndex.day_totals
+DAY_TOTALS = ['Dato', 'Øl', 'TotalScore', 'Count']
+
+
+def navn_breakdown(agg: pd.DataFrame, navn) -> pd.DataFrame:
+    """One connoisseur's components per Øl and their Total, best Øl first.
+
+    agg is an aggregate frame (AggregateIndex.frame()); ties keep the Øl
+    order. AggregateIndex.breakdown returns the same without the frame.
+    """
+    part = agg.loc[agg['Navn'] == navn, ['Øl'] + COMPONENTS]
+    part = part.assign(Total=part[COMPONENTS].sum(axis=1))
+    return part.sort_values('Total', ascending=False, kind='stable').reset_index(drop=True)
+
+
+class AggregateIndex:
+    """Per-(Øl, Navn) sums of Smag, Duft, Helhedsoplevelse, Booster and TotalScore."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (øl, navn) -> [Smag, Duft, Helhedsoplevelse, Booster, TotalScore, Count]
+        self._sums = {}
+        # navn -> {øl: the same sums list as in _sums}
+        self._by_navn = {}
+        # (dato, øl) -> [TotalScore, Count]
+        self._days = {}
+        # (dato, øl, navn) -> [Smag, Duft, Helhedsoplevelse, Booster] counted for it
+        self._ratings = {}
+        self._cursor = None
+        # Bumped whenever the aggregates change
+        self.version = 0
+        # Number of current ratings (including ones without Øl/Navn)
+        self.rows = 0
+        # Store version token of the data seen by the last sync()
+        self.store_version = None
+
+    def __len__(self):
+        return len(self._sums)
+
+    # ---------- Updating ----------
+    def add(self, row: dict):
+        """Fold a single rating (or tombstone) into the index in O(1)."""
+        with self._lock:
+            self._add(row)
+            self.version += 1
+
+    def add_frame(self, df: pd.DataFrame):
+        """Fold a batch of ratings into the index (one groupby over the new keys)."""
+        if df.empty:
+            return
+        with self._lock:
+            self._add_frame(df)
+            self.version += 1
+
+    def sync(self, store) -> bool:
+        """Catch up with ratings written to store since the last sync.
+
+        Only the new rows are read, unless the store was rewritten, in
+        which case the index is rebuilt. Returns True if anything changed.
+        """
+        with self._lock:
+            df, cursor, reset = store.changes_since(self._cursor)
+            self._cursor = cursor
+            self.store_version = store.version_of(cursor)
+            if reset:
+                self._sums = {}
+                self._by_navn = {}
+                self._days = {}
+                self._ratings = {}
+                self.rows = 0
+            elif df.empty:
+                return False
+            self._add_frame(df)
+            self.version += 1
+            return True
+
+    # ---------- Reading ----------
+    def count(self, ol, navn) -> int:
+        """Number of ratings of ol by navn."""
+        sums = self._sums.get((ol, navn))
+        return int(sums[-1]) if sums else 0
+
+    def sums(self, ol, navn) -> list:
+        """[*METRICS, Count] for (ol, navn); zeros if never rated."""
+        with self._lock:
+            return list(self._sums.get((ol, navn), [0] * (len(METRICS) + 1)))
+
+    def breakdown(self, navn) -> pd.DataFrame:
+        """navn_breakdown for one connoisseur, from the Navn index (O(beers))."""
+        with self._lock:
+            items = sorted((ol, sums[:len(COMPONENTS)])
+                           for ol, sums in self._by_navn.get(navn, {}).items())
+        rows = [[ol, *values, sum(values)] for ol, values in items]
+        rows.sort(key=lambda r: -r[-1])  # stable, like navn_breakdown
+        return pd.DataFrame(rows, columns=BREAKDOWN)
+
+    def day_totals(self) -> pd.DataFrame:
+        """TotalScore and Count per (Dato, Øl) (columns DAY_TOTALS, sorted)."""
+        with self._lock:
+            items = sorted(self._days.items())
+        return pd.DataFrame([[dato, ol, *sums] for (dato, ol), sums in items],
+                            columns=DAY_TOTALS)
+
+    def frame(self) -> pd.DataFrame:
+        """Aggregates as a DataFrame: Øl, Navn, METRICS..., Count (sorted by Øl, Navn)."""
+        with self._lock:
+            items = sorted(self._sums.items())
+        return pd.DataFrame(
+            [[ol, navn, *sums] for (ol, navn), sums in items],
+            columns=KEYS + METRICS + ['Count'])
+
+    # ---------- Internals ----------
+    def _add(self, row: dict):
+        key = rating_key(row)
+        self._remove(key)
+        if all(pd.isna(row.get(c)) for c in COMPONENTS):
+            return  # tombstone
+        values = [0 if pd.isna(row.get(c)) else row.get(c) for c in COMPONENTS]
+        self._ratings[key] = values
+        self._fold(key, values, 1)
+
+    def _add_frame(self, df: pd.DataFrame):
+        # Only the last row per key in the batch matters
+        df = df.loc[~df.duplicated(KEY, keep='last').to_numpy()]
+        keys = frame_keys(df)
+        if self._ratings:
+            for key in keys:
+                self._remove(key)
+        live = ~is_tombstone(df)
+        df = df.loc[live]
+        if df.empty:
+            return
+        keys = [k for k, keep in zip(keys, live) if keep]
+        values = np.column_stack(
+            [pd.to_numeric(df[c], errors='coerce').fillna(0).to_numpy() for c in COMPONENTS])
+        # Score columns of a log with tombstones are read as float; whole
+        # scores are summed as ints either way (like ratings.restore_ints)
+        if values.dtype.kind == 'f' and (values == np.round(values)).all():
+            values = values.astype(np.int64)
+        elif values.dtype.kind in 'iub':
+            values = values.astype(np.int64)  # int8 columns would overflow when summed
+        self._ratings.update(zip(keys, values.tolist()))
+        self.rows += len(df)
+
+        has_pair = df[KEYS].notna().all(axis=1).to_numpy()
+        part = df.loc[has_pair, ['Dato'] + KEYS].copy()
+        values = values[has_pair]
+        for i, c in enumerate(COMPONENTS):
+            part[c] = values[:, i]
+        part['TotalScore'] = values.sum(axis=1)
+        part['Count'] = 1
+        grouped = part.groupby(KEYS, sort=False, observed=True)[METRICS + ['Count']].sum()
+        for key, values in zip(grouped.index, grouped.to_numpy().tolist()):
+            sums = self._pair(*key)
+            for i, v in enumerate(values):
+                sums[i] += v
+        grouped = part.groupby(['Dato', 'Øl'], sort=False, observed=True)[
+            ['TotalScore', 'Count']].sum()
+        for key, (total, count) in zip(grouped.index, grouped.to_numpy().tolist()):
+            sums = self._days.setdefault(key, [0, 0])
+            sums[0] += total
+            sums[1] += count
+
+    def _remove(self, key):
+        """Take the rating counted for key (if any) back out of the sums."""
+        values = self._ratings.pop(key, None)
+        if values is not None:
+            self._fold(key, values, -1)
+
+    def _fold(self, key, values, sign):
+        self.rows += sign
+        dato, ol, navn = key
+        if pd.isna(ol) or pd.isna(navn):
+            return
+        total = sum(values)
+        sums = self._pair(ol, navn)
+        for i, v in enumerate(values):
+            sums[i] += sign * v
+        sums[len(COMPONENTS)] += sign * total
+        sums[-1] += sign
+        if sums[-1] == 0:
+            del self._sums[(ol, navn)]
+            del self._by_navn[navn][ol]
+            if not self._by_navn[navn]:
+                del self._by_navn[navn]
+        if pd.isna(dato):
+            return
+        day = self._days.setdefault((dato, ol), [0, 0])
+        day[0] += sign * total
+        day[1] += sign
+        if day[1] == 0:
+            del self._days[(dato, ol)]
+
+    def _pair(self, ol, navn) -> list:
+        """The sums list of (ol, navn), created (and indexed by Navn) if new."""
+        sums = self._sums.get((ol, navn))
+        if sums is None:
+            sums = self._sums[(ol, navn)] = [0] * (len(METRICS) + 1)
+            self._by_navn.setdefault(navn, {})[ol] = sums
+        return sums
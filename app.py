@@ -6,331 +6,624 @@ Created on Sun Nov 23 13:24:19 2025
 @author: mikkel
 """
 import os
-import pandas as pd
-import plotly.express as px
+import time
 import dash
-from dash import html, dcc
-from dash.dependencies import Input, Output, State
+import flask
+from dash import html, dcc, ctx, Patch
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash.dash_table as dt
 
+from bulk import blueprint as bulk_blueprint
+from calendars import Calendar, CalendarConfig, CalendarRegistry, chart_key, load_calendars
+from figures import (LEADERBOARDS, NAVN_DETAIL, STATS_CHART, STATS_MODES, TIMELINE_CHART,
+                     build_patches, leaderboard_figure, navn_detail_figure, ol_orders,
+                     stats_figure, timeline_figure)
+from instrumentation import Timing
+from leaderboards import blueprint as leaderboard_blueprint
+from ratings import COLUMNS, Rating
+from stats import ol_statistics
+from storage import open_store
+from tablequery import page_count
+from writebehind import WriteBehindStore
+
+# --------- Hardcoded allowed values (choices) ---------
+# The built-in calendar, used when BEER_CALENDARS is not set
+Date = list(range(1, 25))
+Øl = ['Øl1', 'Øl2', 'Øl3', 'Øl4']
+Navn = ['Tejl', 'Stein', 'Ems', 'Miks']
+Smag = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+Duft = [1, 2, 3, 4, 5]
+Helhedsoplevelse = [1, 2, 3, 4, 5]
+Booster = [0, 2]
+
+# Allowed values per column, used to validate and to type the data
+DOMAINS = {
+    'Dato': Date,
+    'Øl': Øl,
+    'Navn': Navn,
+    'Smag': Smag,
+    'Duft': Duft,
+    'Helhedsoplevelse': Helhedsoplevelse,
+    'Booster': Booster,
+}
+
 # ---------- File storage settings ----------
 # This will create/use beer_ratings.csv in the same folder as this .py file
 DATA_FILE = os.path.join(os.path.dirname(__file__), "beer_ratings.csv")
 
-COLUMNS = ['Dato', 'Øl', 'Navn', 'Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+# "csv": append-only log, fine for a single process; a binary snapshot
+#        (beer_ratings.csv.snap) next to it makes cold starts fast.
+# "sqlite": WAL database, safe with several gunicorn workers/threads;
+#        beer_ratings.db, seeded from DATA_FILE on first use.
+STORAGE_BACKEND = os.environ.get("BEER_STORAGE", "csv")
+
+# "on": per-callback and per-stage timings on /metrics and in Server-Timing
+# response headers. "off" (default): TIMING.time() is a no-op.
+TIMING = Timing(enabled=os.environ.get("BEER_METRICS", "off") == "on")
+
+# "on": add_row only queues the rating and a background thread stores the
+# queue in one group commit every BEER_FLUSH_SECONDS (sooner once
+# BEER_FLUSH_BATCH ratings wait). The page shows the rating with the next
+# live update. BEER_FLUSH_ON_EXIT: "flush" (default) or "drop" the queue
+# when the process exits.
+WRITE_BEHIND = os.environ.get("BEER_WRITE_BEHIND", "off") == "on"
+
+# ---------- Calendars ----------
+# BEER_CALENDARS: JSON file defining the calendars (see calendars.py), each
+# served under /<name>/ with its own storage in BEER_DATA_DIR (default:
+# next to the file). Without it, the choices above are the one calendar.
+# At most BEER_MAX_CALENDARS calendars are kept open (least recently used
+# ones are closed).
+BUILTIN_CALENDAR = CalendarConfig(
+    slug='2025',
+    title="Øl Julekalender 2025!",
+    description=(
+        "Hvem løber med sejren, bliver det en sød julebryg, en hidsig stout, måske en mærkelig sour, eller en skøn IPA. "
+        "Bliver det noget surt stads som Ems så godt kan lide. Og har Tejl ændret smagsløg. Hvad siger Spicy Stein til det hele, "
+        "og vinder Mikkels øl med gran - følg med hele December!"),
+    domains=DOMAINS,
+    file=os.path.splitext(DATA_FILE)[0],
+)
+
+if os.environ.get("BEER_CALENDARS"):
+    CALENDAR_CONFIGS, DEFAULT_CALENDAR = load_calendars(
+        os.environ["BEER_CALENDARS"], data_dir=os.environ.get("BEER_DATA_DIR"),
+        defaults=DOMAINS)
+else:
+    CALENDAR_CONFIGS, DEFAULT_CALENDAR = {BUILTIN_CALENDAR.slug: BUILTIN_CALENDAR}, '2025'
 
 
-def load_data():
-    """Load ratings from CSV, or return empty DataFrame if file does not exist."""
-    if os.path.exists(DATA_FILE):
-        df = pd.read_csv(DATA_FILE)
-        # Make sure all expected columns exist
-        missing = [c for c in COLUMNS if c not in df.columns]
-        for c in missing:
-            df[c] = None
-        return df[COLUMNS]
+def open_calendar(config):
+    """Open one calendar's storage partition (BEER_STORAGE, BEER_WRITE_BEHIND)."""
+    data_file = f"{config.file}.csv"
+    if STORAGE_BACKEND == "sqlite":
+        store = open_store("sqlite", f"{config.file}.db", COLUMNS, seed_csv=data_file,
+                           domains=config.domains)
     else:
-        # No file yet -> start empty
-        return pd.DataFrame(columns=COLUMNS)
+        store = open_store(STORAGE_BACKEND, data_file, COLUMNS, domains=config.domains,
+                           snapshot=True)
+    if WRITE_BEHIND:
+        store = WriteBehindStore(
+            store,
+            flush_interval=float(os.environ.get("BEER_FLUSH_SECONDS", "0.05")),
+            batch_size=int(os.environ.get("BEER_FLUSH_BATCH", "256")),
+            on_shutdown=os.environ.get("BEER_FLUSH_ON_EXIT", "flush"),
+            timer=TIMING.time)
+    return Calendar(config, store, timing=TIMING)
 
 
-def save_data(df: pd.DataFrame):
-    """Save ratings to CSV."""
-    df.to_csv(DATA_FILE, index=False)
+CALENDARS = CalendarRegistry(CALENDAR_CONFIGS, open_calendar, default=DEFAULT_CALENDAR,
+                             max_open=int(os.environ.get("BEER_MAX_CALENDARS", "16")))
 
 
-# --------- Hardcoded allowed values (choices) ---------
-Date = list(range(1, 25))
-Øl = ['Øl1', 'Øl2', 'Øl3', 'Øl4']
-Navn = ['Tejl', 'Stein', 'Ems', 'Miks']
-Smag = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-Duft = [1, 2, 3, 4, 5]
-Helhedsoplevelse = [1, 2, 3, 4, 5]
-Booster = [0, 2]
+def open_calendars_total(read):
+    """Sum of read(calendar) ({name: number}) over the open calendars, for /metrics."""
+    total = {}
+    for calendar in CALENDARS.open_calendars():
+        for name, value in read(calendar).items():
+            total[name] = total.get(name, 0) + value
+    return total
+
+
+TIMING.gauge('beer_calendars', 'Calendars defined, open, opened and evicted.', 'stat',
+             lambda: CALENDARS.stats())
+TIMING.gauge('beer_figure_cache', 'Figure cache counters (open calendars).', 'stat',
+             lambda: open_calendars_total(lambda c: c.figure_cache.stats()))
+if WRITE_BEHIND:
+    TIMING.gauge('beer_write_behind', 'Write-behind queue counters (open calendars).', 'stat',
+                 lambda: open_calendars_total(lambda c: c.store.stats()))
+
+# "server": figures are built (and cached) in update_charts.
+# "clientside": the server only sends the aggregates (chart_data) and the
+# browser groups, sorts and stacks them (assets/charts.js).
+CHART_MODE = os.environ.get("BEER_CHARTS", "server")
+
+# Open pages check /api/version this often and refresh when it changed
+# (assets/live.js); 0 turns live updates off.
+POLL_SECONDS = float(os.environ.get("BEER_POLL_SECONDS", "5"))
+
+
+def request_calendar(slug):
+    """The open calendar for slug (or None), held open until the request ends.
+
+    An evicted calendar is only closed once no request holds it, so a
+    write that started before the eviction still finds its store open.
+    """
+    calendar = CALENDARS.acquire(slug)
+    if calendar is not None:
+        flask.g.setdefault('calendars', []).append((CALENDARS, calendar))
+    return calendar
+
+
+def calendar_for(slug):
+    """The open calendar for a page's calendar store; stops the callback if unknown."""
+    calendar = request_calendar(slug)
+    if calendar is None:
+        raise PreventUpdate
+    return calendar
+
 
 # --------- Build Dash app ---------
-app = dash.Dash(__name__)
+# The page content depends on the URL (render_page), so the callbacks
+# refer to components that are not in the initial layout
+app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # <- this is what PythonAnywhere will use
+TIMING.install(app)
+
+
+@server.teardown_request
+def release_calendars(exc):
+    for registry, calendar in flask.g.pop('calendars', []):
+        registry.release(calendar)
+
+
+def leaderboards_for(slug):
+    calendar = request_calendar(slug)
+    return calendar.leaderboards if calendar is not None else None
+
+
+# JSON leaderboards on [/<calendar>]/api/leaderboard...
+server.register_blueprint(leaderboard_blueprint(leaderboards_for))
+
+# Streaming export on [/<calendar>]/api/export.csv|jsonl; bulk import on
+# [/<calendar>]/api/import, only with BEER_IMPORT_TOKEN as bearer token
+server.register_blueprint(bulk_blueprint(request_calendar,
+                                         token=os.environ.get("BEER_IMPORT_TOKEN")))
+
+
+@server.route('/api/version', defaults={'calendar': None})
+@server.route('/<calendar>/api/version')
+def version_endpoint(calendar):
+    """Current data version, polled by every open page (see assets/live.js)."""
+    cal = request_calendar(calendar)
+    if cal is None:
+        flask.abort(404)
+    version = cal.data_version()
+    response = flask.jsonify(version=version)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(version)
+    return response.make_conditional(flask.request)
+
+
+def value_range(values):
+    return f"{min(values)}–{max(values)}"
+
+
+def serve_layout(calendar):
+    """Build a calendar's page per page load, so a new session starts from current data."""
+    version = calendar.data_version()
+    domains = calendar.domains
+    return html.Div(
+        style={
+            "fontFamily": "Arial, sans-serif",
+            "backgroundColor": "#f5f5f5",
+            "minHeight": "100vh",
+            "padding": "20px"
+        },
+        children=[
+            # Header
+            html.Div(
+                style={
+                    "backgroundColor": "white",
+                    "padding": "15px 25px",
+                    "borderRadius": "10px",
+                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)",
+                    "marginBottom": "20px"
+                },
+                children=[
+                    html.H1(calendar.config.title, style={"margin": 0}),
+                    html.P(
+                        calendar.config.description,
+                        style={"marginTop": "5px", "color": "#555"}
+                    )
+                ]
+            ),
+
+            # Main content: left = inputs, right = table + charts
+            html.Div(
+                style={
+                    "display": "flex",
+                    "gap": "20px",
+                    "alignItems": "flex-start"
+                },
+                children=[
+                    # LEFT: Input panel
+                    html.Div(
+                        style={
+                            "flex": "0 0 320px",
+                            "backgroundColor": "white",
+                            "padding": "20px",
+                            "borderRadius": "10px",
+                            "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                        },
+                        children=[
+                            html.H3("Giv bedømmelse", style={"marginTop": 0}),
+
+                            html.Div([
+                                html.Label("Dato", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='dato-input',
+                                    options=[{'label': x, 'value': x} for x in domains['Dato']],
+                                    placeholder='Vælg dato',
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Div([
+                                html.Label("Øl", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='ol-input',
+                                    options=[{'label': x, 'value': x} for x in domains['Øl']],
+                                    placeholder='Vælg øl',
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Div([
+                                html.Label("Connoisseur", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='navn-input',
+                                    options=[{'label': str(x), 'value': x} for x in domains['Navn']],
+                                    placeholder='Vælg connoisseur',
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Hr(),
 
-app.layout = html.Div(
-    style={
-        "fontFamily": "Arial, sans-serif",
-        "backgroundColor": "#f5f5f5",
-        "minHeight": "100vh",
-        "padding": "20px"
-    },
-    children=[
-        # Header
-        html.Div(
-            style={
-                "backgroundColor": "white",
-                "padding": "15px 25px",
-                "borderRadius": "10px",
-                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)",
-                "marginBottom": "20px"
-            },
-            children=[
-                html.H1("Øl Julekalender 2025!", style={"margin": 0}),
-                html.P(
-                    "Hvem løber med sejren, bliver det en sød julebryg, en hidsig stout, måske en mærkelig sour, eller en skøn IPA. "
-                    "Bliver det noget surt stads som Ems så godt kan lide. Og har Tejl ændret smagsløg. Hvad siger Spicy Stein til det hele, "
-                    "og vinder Mikkels øl med gran - følg med hele December!",
-                    style={"marginTop": "5px", "color": "#555"}
-                )
-            ]
-        ),
-
-        # Main content: left = inputs, right = table + charts
-        html.Div(
-            style={
-                "display": "flex",
-                "gap": "20px",
-                "alignItems": "flex-start"
-            },
-            children=[
-                # LEFT: Input panel
-                html.Div(
-                    style={
-                        "flex": "0 0 320px",
-                        "backgroundColor": "white",
-                        "padding": "20px",
-                        "borderRadius": "10px",
-                        "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                    },
-                    children=[
-                        html.H3("Giv bedømmelse", style={"marginTop": 0}),
-
-                        html.Div([
-                            html.Label("Dato", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='dato-input',
-                                options=[{'label': x, 'value': x} for x in Date],
-                                placeholder='Vælg dato',
-                                style={"marginBottom": "12px"}
+                            html.Div([
+                                html.Label("Smag", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='smag-input',
+                                    options=[{'label': str(x), 'value': x} for x in domains['Smag']],
+                                    placeholder=f"Vælg smag ({value_range(domains['Smag'])})",
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Div([
+                                html.Label("Duft", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='duft-input',
+                                    options=[{'label': str(x), 'value': x} for x in domains['Duft']],
+                                    placeholder=f"Vælg duft ({value_range(domains['Duft'])})",
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Div([
+                                html.Label("Helhedsoplevelse", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='helhedsoplevelse-input',
+                                    options=[{'label': str(x), 'value': x} for x in domains['Helhedsoplevelse']],
+                                    placeholder=f"Vælg helhedsoplevelse ({value_range(domains['Helhedsoplevelse'])})",
+                                    style={"marginBottom": "12px"}
+                                ),
+                            ]),
+
+                            html.Hr(),
+
+                            html.Div([
+                                html.Label("BeerLicious Booster", style={"fontWeight": "bold"}),
+                                dcc.Dropdown(
+                                    id='booster-input',
+                                    options=[{'label': str(x), 'value': x} for x in domains['Booster']],
+                                    placeholder='Skal den have en beerlicious booster?',
+                                    style={"marginBottom": "16px"}
+                                ),
+                            ]),
+
+                            html.Button(
+                                "Giv bedømmelse",
+                                id='add-row',
+                                n_clicks=0,
+                                style={
+                                    "width": "100%",
+                                    "backgroundColor": "#2c7be5",
+                                    "color": "white",
+                                    "border": "none",
+                                    "padding": "10px 0",
+                                    "borderRadius": "6px",
+                                    "fontWeight": "bold",
+                                    "cursor": "pointer"
+                                }
                             ),
-                        ]),
-
-                        html.Div([
-                            html.Label("Øl", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='ol-input',
-                                options=[{'label': x, 'value': x} for x in Øl],
-                                placeholder='Vælg øl',
-                                style={"marginBottom": "12px"}
+                            html.Div(id="feedback", style={"marginTop": "8px", "color": "#b00020"})
+                        ]
+                    ),
+
+                    # RIGHT: Table + charts STACKED
+                    html.Div(
+                        style={
+                            "flex": "1",
+                            "display": "flex",
+                            "flexDirection": "column",
+                            "gap": "30px"
+                        },
+                        children=[
+
+                            # ---- TABLE CARD ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "15px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    html.H3("Bedømmelser:", style={"marginTop": 0}),
+                                    # Changes whenever a rating is stored; drives
+                                    # the table and chart callbacks
+                                    dcc.Store(id='data-version', data=version),
+                                    # Version the table and charts in this
+                                    # browser currently show (see add_row)
+                                    dcc.Store(id='view-version', data=version),
+                                    # Version the charts were last drawn from
+                                    dcc.Store(id='charts-version'),
+                                    # Aggregates for BEER_CHARTS=clientside
+                                    dcc.Store(id='chart-data'),
+                                    # The calendar this page shows (callbacks look it up)
+                                    dcc.Store(id='calendar', data=calendar.slug),
+                                    # Live updates from other tasters' ratings
+                                    dcc.Store(id='version-url',
+                                              data=app.get_relative_path(
+                                                  f'/{calendar.slug}/api/version')),
+                                    dcc.Interval(id='live-poll',
+                                                 interval=max(POLL_SECONDS, 1) * 1000,
+                                                 disabled=POLL_SECONDS <= 0),
+                                    dt.DataTable(
+                                        id='table',
+                                        columns=[
+                                            {'name': 'Dato', 'id': 'Dato'},
+                                            {'name': 'Øl', 'id': 'Øl'},
+                                            {'name': 'Navn', 'id': 'Navn'},
+                                            {'name': 'Smag', 'id': 'Smag'},
+                                            {'name': 'Duft', 'id': 'Duft'},
+                                            {'name': 'Helhedsoplevelse', 'id': 'Helhedsoplevelse'},
+                                            {'name': 'Booster', 'id': 'Booster'},
+                                        ],
+                                        # Paging, sorting and filtering run on the
+                                        # server (update_table), so only the
+                                        # visible page is sent to the browser
+                                        data=[],
+                                        row_deletable=False,
+                                        page_current=0,
+                                        page_size=10,
+                                        page_action='custom',
+                                        sort_action='custom',
+                                        sort_mode='multi',
+                                        sort_by=[],
+                                        filter_action='custom',
+                                        filter_query='',
+                                        style_table={'overflowX': 'auto'},
+                                        style_cell={
+                                            'textAlign': 'center',
+                                            'padding': '4px'
+                                        },
+                                        style_header={
+                                            'backgroundColor': '#f0f0f0',
+                                            'fontWeight': 'bold'
+                                        }
+                                    )
+                                ]
                             ),
-                        ]),
-
-                        html.Div([
-                            html.Label("Connoisseur", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='navn-input',
-                                options=[{'label': str(x), 'value': x} for x in Navn],
-                                placeholder='Vælg connoisseur',
-                                style={"marginBottom": "12px"}
+
+                            # ---- CHART 1: Total Rating ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.Graph(id='samlede_rating')
+                                ]
                             ),
-                        ]),
 
-                        html.Hr(),
+                            # ---- CHART 1b: Statistics (stats.py) ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.RadioItems(
+                                        id='stats-mode',
+                                        options=[
+                                            {'label': 'Bayesiansk gennemsnit', 'value': 'bayes'},
+                                            {'label': 'Normaliseret pr. connoisseur',
+                                             'value': 'normaliseret'},
+                                        ],
+                                        value='bayes',
+                                        inline=True,
+                                        inputStyle={"marginRight": "4px", "marginLeft": "12px"}
+                                    ),
+                                    dcc.Graph(id=STATS_CHART)
+                                ]
+                            ),
 
-                        html.Div([
-                            html.Label("Smag", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='smag-input',
-                                options=[{'label': str(x), 'value': x} for x in Smag],
-                                placeholder='Vælg smag (1–10)',
-                                style={"marginBottom": "12px"}
+                            # ---- CHART 1c: Standings day by day (timeline.py) ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.Graph(id=TIMELINE_CHART)
+                                ]
                             ),
-                        ]),
-
-                        html.Div([
-                            html.Label("Duft", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='duft-input',
-                                options=[{'label': str(x), 'value': x} for x in Duft],
-                                placeholder='Vælg duft (1–5)',
-                                style={"marginBottom": "12px"}
+
+                            # ---- CHART 2: Smag ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.Graph(id='smag_rating')
+                                ]
                             ),
-                        ]),
-
-                        html.Div([
-                            html.Label("Helhedsoplevelse", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='helhedsoplevelse-input',
-                                options=[{'label': str(x), 'value': x} for x in Helhedsoplevelse],
-                                placeholder='Vælg helhedsoplevelse (1–5)',
-                                style={"marginBottom": "12px"}
+
+                            # ---- CHART 3: Duft ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.Graph(id='duft_rating')
+                                ]
                             ),
-                        ]),
 
-                        html.Hr(),
+                            # ---- CHART 4: Helhedsoplevelse ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    dcc.Graph(id='helhedsoplevelse_rating')
+                                ]
+                            ),
 
-                        html.Div([
-                            html.Label("BeerLicious Booster", style={"fontWeight": "bold"}),
-                            dcc.Dropdown(
-                                id='booster-input',
-                                options=[{'label': str(x), 'value': x} for x in Booster],
-                                placeholder='Skal den have en beerlicious booster?',
-                                style={"marginBottom": "16px"}
+                            # ---- CHART 5: Person details ----
+                            html.Div(
+                                style={
+                                    "backgroundColor": "white",
+                                    "padding": "20px",
+                                    "borderRadius": "10px",
+                                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                                },
+                                children=[
+                                    html.H3("Vurderinger fra valgt øl connoisseur",
+                                            style={"marginTop": 0, "marginBottom": "10px"}),
+
+                                    html.Div(
+                                        style={"maxWidth": "250px", "marginBottom": "10px"},
+                                        children=[                                    
+                                            dcc.Dropdown(
+                                                id='navn-filter',
+                                                options=[{'label': str(x), 'value': x} for x in domains['Navn']],
+                                                placeholder='Vælg øl connoisseur',
+                                                clearable=True
+                                            ),
+                                        ]
+                                    ),
+
+                                    dcc.Graph(id='navn_detail')
+                                ]
                             ),
-                        ]),
-
-                        html.Button(
-                            "Giv bedømmelse",
-                            id='add-row',
-                            n_clicks=0,
-                            style={
-                                "width": "100%",
-                                "backgroundColor": "#2c7be5",
-                                "color": "white",
-                                "border": "none",
-                                "padding": "10px 0",
-                                "borderRadius": "6px",
-                                "fontWeight": "bold",
-                                "cursor": "pointer"
-                            }
-                        ),
-                        html.Div(id="feedback", style={"marginTop": "8px", "color": "#b00020"})
-                    ]
-                ),
-
-                # RIGHT: Table + charts STACKED
-                html.Div(
-                    style={
-                        "flex": "1",
-                        "display": "flex",
-                        "flexDirection": "column",
-                        "gap": "30px"
-                    },
-                    children=[
-
-                        # ---- TABLE CARD ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "15px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                html.H3("Bedømmelser:", style={"marginTop": 0}),
-                                dt.DataTable(
-                                    id='table',
-                                    columns=[
-                                        {'name': 'Dato', 'id': 'Dato'},
-                                        {'name': 'Øl', 'id': 'Øl'},
-                                        {'name': 'Navn', 'id': 'Navn'},
-                                        {'name': 'Smag', 'id': 'Smag'},
-                                        {'name': 'Duft', 'id': 'Duft'},
-                                        {'name': 'Helhedsoplevelse', 'id': 'Helhedsoplevelse'},
-                                        {'name': 'Booster', 'id': 'Booster'},
-                                    ],
-                                    data=load_data().to_dict("records"),
-                                    row_deletable=False,
-                                    page_size=10,
-                                    style_table={'overflowX': 'auto'},
-                                    style_cell={
-                                        'textAlign': 'center',
-                                        'padding': '4px'
-                                    },
-                                    style_header={
-                                        'backgroundColor': '#f0f0f0',
-                                        'fontWeight': 'bold'
-                                    }
-                                )
-                            ]
-                        ),
-
-                        # ---- CHART 1: Total Rating ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "20px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                dcc.Graph(id='samlede_rating')
-                            ]
-                        ),
-
-                        # ---- CHART 2: Smag ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "20px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                dcc.Graph(id='smag_rating')
-                            ]
-                        ),
-
-                        # ---- CHART 3: Duft ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "20px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                dcc.Graph(id='duft_rating')
-                            ]
-                        ),
-
-                        # ---- CHART 4: Helhedsoplevelse ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "20px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                dcc.Graph(id='helhedsoplevelse_rating')
-                            ]
-                        ),
-
-                        # ---- CHART 5: Person details ----
-                        html.Div(
-                            style={
-                                "backgroundColor": "white",
-                                "padding": "20px",
-                                "borderRadius": "10px",
-                                "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
-                            },
-                            children=[
-                                html.H3("Vurderinger fra valgt øl connoisseur",
-                                        style={"marginTop": 0, "marginBottom": "10px"}),
-
-                                html.Div(
-                                    style={"maxWidth": "250px", "marginBottom": "10px"},
-                                    children=[                                    
-                                        dcc.Dropdown(
-                                            id='navn-filter',
-                                            options=[{'label': str(x), 'value': x} for x in Navn],
-                                            placeholder='Vælg øl connoisseur',
-                                            clearable=True
-                                        ),
-                                    ]
-                                ),
+                        ]
+                    )
+                ]
+            )
+        ]
+    )
+
+
+def calendar_list(message=None):
+    """Page listing the calendars, for / without a default calendar and unknown names."""
+    return html.Div(
+        style={
+            "fontFamily": "Arial, sans-serif",
+            "backgroundColor": "#f5f5f5",
+            "minHeight": "100vh",
+            "padding": "20px"
+        },
+        children=[
+            html.Div(
+                style={
+                    "backgroundColor": "white",
+                    "padding": "15px 25px",
+                    "borderRadius": "10px",
+                    "boxShadow": "0 2px 6px rgba(0,0,0,0.1)"
+                },
+                children=[
+                    html.H1("Øl Julekalendere", style={"margin": 0}),
+                    html.P(message, style={"color": "#b00020"}) if message else None,
+                    html.Ul([
+                        html.Li(dcc.Link(config.title,
+                                         href=app.get_relative_path(f'/{config.slug}/')))
+                        for config in CALENDARS.configs.values()
+                    ])
+                ]
+            )
+        ]
+    )
+
+
+# The page is picked by the URL: /<calendar>/ (or / for the default one)
+app.layout = html.Div([
+    dcc.Location(id='url'),
+    html.Div(id='page'),
+])
 
-                                dcc.Graph(id='navn_detail')
-                            ]
-                        ),
-                    ]
-                )
-            ]
-        )
-    ]
+
+@app.callback(
+    Output('page', 'children'),
+    Input('url', 'pathname'),
 )
+def render_page(pathname):
+    path = app.strip_relative_path(pathname or '/') or ''
+    slug = path.split('/')[0] or None
+    calendar = request_calendar(slug)
+    if calendar is None:
+        return calendar_list(f"Ukendt kalender: {slug}" if slug else None)
+    return serve_layout(calendar)
+
 
 # --- Callback: add a row when button is clicked ---
+# Only the new rating goes up. If the browser's view is current (its
+# view-version is the version right before this write) and the rating is
+# not a correction of an earlier one, only patches come back: one extra
+# bar segment per leaderboard, a row appended to the last table page.
+# Otherwise data-version changes and the table and charts are refreshed
+# from the server.
 @app.callback(
-    Output('table', 'data'),
+    Output('data-version', 'data'),
+    Output('view-version', 'data'),
+    Output('table', 'data', allow_duplicate=True),
+    Output('table', 'page_count', allow_duplicate=True),
+    Output('samlede_rating', 'figure', allow_duplicate=True),
+    Output('smag_rating', 'figure', allow_duplicate=True),
+    Output('duft_rating', 'figure', allow_duplicate=True),
+    Output('helhedsoplevelse_rating', 'figure', allow_duplicate=True),
+    Output('navn_detail', 'figure', allow_duplicate=True),
+    Output('chart-data', 'data', allow_duplicate=True),
+    Output('feedback', 'children'),
     Input('add-row', 'n_clicks'),
-    State('table', 'data'),
     State('dato-input', 'value'),
     State('ol-input', 'value'),
     State('navn-input', 'value'),
@@ -338,275 +631,256 @@ app.layout = html.Div(
     State('duft-input', 'value'),
     State('helhedsoplevelse-input', 'value'),
     State('booster-input', 'value'),
+    State('view-version', 'data'),
+    State('table', 'page_current'),
+    State('table', 'page_size'),
+    State('table', 'page_count'),
+    State('table', 'sort_by'),
+    State('table', 'filter_query'),
+    State('navn-filter', 'value'),
+    State('calendar', 'data'),
     prevent_initial_call=True
 )
-def add_row(n_clicks, current_rows, dato,
-            ol, navn, smag, duft, helhed, booster):
-
-    rows = current_rows or []
+def add_row(n_clicks, dato,
+            ol, navn, smag, duft, helhed, booster,
+            view_version, page_current, page_size, n_pages,
+            sort_by, filter_query, selected_navn, calendar):
 
     # Enforce: nothing may be NULL
     if not all(v is not None for v in [dato, ol, navn, smag, duft, helhed, booster]):
-        return rows
-
-    new_row = {
-        'Dato': dato,
-        'Øl': ol,
-        'Navn': navn,
-        'Smag': smag,
-        'Duft': duft,
-        'Helhedsoplevelse': helhed,
-        'Booster': booster
-    }
-
-    rows.append(new_row)
-
-    df = pd.DataFrame(rows, columns=COLUMNS)
-    save_data(df)
-
-    return rows
-
-
-# --- Graph 1: Total rating (stacked by Navn, ordered by total) ---
-@app.callback(
-    Output('samlede_rating', 'figure'),
-    Input('table', 'data')
-)
-def update_bar_chart_1(rows):
-    if not rows:
-        fig = px.bar()
-        fig.update_layout(template='simple_white',
-                          title='Den samlede vurdering')
-        return fig
-
-    df = pd.DataFrame(rows)
-
-    # Compute total score per row
-    df['TotalScore'] = df[['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']].sum(axis=1)
-
-    # Sum total score per øl + navn
-    grouped = df.groupby(['Øl', 'Navn'], as_index=False)['TotalScore'].sum()
-
-    # Total per øl for sorting
-    total_per_ol = grouped.groupby('Øl', as_index=False)['TotalScore'].sum()
-    total_per_ol = total_per_ol.sort_values('TotalScore', ascending=False)
-    ol_order = total_per_ol['Øl'].tolist()
-
-    fig = px.bar(
-        grouped,
-        x='Øl',
-        y='TotalScore',
-        color='Navn',
-        barmode='stack',
-        category_orders={'Øl': ol_order},
-        labels={'TotalScore': 'Samlet vurdering', 'Øl': 'Øl', 'Navn': 'Navn'},
-        color_discrete_sequence=px.colors.qualitative.Pastel1
-    )
-
-    fig.update_layout(
-        title='Den samlede vurdering',
-        template='simple_white',
-        margin=dict(t=60, l=40, r=20, b=60),
-        legend_title_text=''
-    )
-
-    return fig
-
-
-# --- Graph 2: Smag (stacked by Navn, ordered by total Smag) ---
-@app.callback(
-    Output('smag_rating', 'figure'),
-    Input('table', 'data')
+        return [dash.no_update] * 11
+
+    cal = calendar_for(calendar)
+    rating = Rating(dato, ol, navn, smag, duft, helhed, booster)
+
+    # The dropdowns limit the choices, but the request can carry anything
+    invalid = rating.invalid_fields(cal.domains)
+    if invalid:
+        return [dash.no_update] * 10 + [f"Ugyldig værdi: {', '.join(invalid)}"]
+
+    new_row = rating.as_dict()
+
+    if WRITE_BEHIND:
+        # Only queued: live updates bring it in once the group commit is done
+        cal.upsert_rating(new_row)
+        return [dash.no_update] * 10 + ['']
+
+    # A correction replaces the earlier rating instead of adding a second one
+    replaces = cal.store.lookup(dato, ol, navn) is not None
+    before, after = cal.upsert_rating(new_row)
+    agg = cal.aggregate_frame()
+    with TIMING.time('leaderboards'):
+        cal.leaderboards.refresh(cal.agg.store_version, agg)
+
+    # The store is the source of truth: if the browser missed other writes,
+    # this is a brand-new (Øl, Navn) bar or it replaced a rating, re-read
+    # everything
+    if view_version != before or replaces or cal.agg.count(ol, navn) <= 1:
+        return [after, after] + [dash.no_update] * 8 + ['']
+
+    # Table: the new row lands at the end of the unsorted, unfiltered list
+    table_data, table_pages = dash.no_update, dash.no_update
+    if sort_by or filter_query:
+        with TIMING.time('query'):
+            rows, total = cal.store.query(page_current, page_size, sort_by, filter_query)
+        table_data, table_pages = rows, page_count(total, page_size)
+    else:
+        # The browser's view was current, so it shows the rows before this
+        # one: append if the new row lands on the page it shows
+        total = cal.agg.rows
+        if (total - 1) // page_size == (page_current or 0):
+            table_data = Patch()
+            table_data.append(new_row)
+        if page_count(total, page_size) != n_pages:
+            table_pages = page_count(total, page_size)
+
+    # Clientside charts redraw themselves from the one updated aggregate
+    if CHART_MODE == "clientside":
+        sums = Patch()
+        sums['sums'][chart_key(ol, navn)] = cal.agg.sums(ol, navn)
+        return [dash.no_update, after, table_data, table_pages,
+                *[dash.no_update] * 5, sums, '']
+
+    with TIMING.time('figure'):
+        detail = (navn_detail_figure(cal.agg.breakdown(navn), navn)
+                  if selected_navn == navn else dash.no_update)
+        patches = build_patches(agg, new_row)
+
+    return [dash.no_update, after, table_data, table_pages,
+            *patches, detail, dash.no_update, '']
+
+
+# --- Live updates: pick up ratings stored by other sessions ---
+# Runs in the browser: a tiny version check per tick, and only when the
+# version moved does data-version change (and the table page and charts
+# get fetched).
+app.clientside_callback(
+    ClientsideFunction(namespace='live', function_name='poll'),
+    Output('data-version', 'data', allow_duplicate=True),
+    Output('view-version', 'data', allow_duplicate=True),
+    Input('live-poll', 'n_intervals'),
+    State('version-url', 'data'),
+    State('view-version', 'data'),
+    prevent_initial_call=True
 )
-def update_bar_chart_2(rows):
-    if not rows:
-        fig = px.bar()
-        fig.update_layout(template='simple_white',
-                          title='Smags-vurdering')
-        return fig
-
-    df = pd.DataFrame(rows)
-
-    # Sum Smag per øl + navn
-    grouped = df.groupby(['Øl', 'Navn'], as_index=False)['Smag'].sum()
-
-    # Total Smag per øl for sorting
-    total_smag = grouped.groupby('Øl', as_index=False)['Smag'].sum()
-    total_smag = total_smag.sort_values('Smag', ascending=False)
-    ol_order = total_smag['Øl'].tolist()
-
-    fig = px.bar(
-        grouped,
-        x='Øl',
-        y='Smag',
-        color='Navn',
-        barmode='stack',
-        category_orders={'Øl': ol_order},
-        labels={'Smag': 'Smag', 'Øl': 'Øl'},
-        color_discrete_sequence=px.colors.qualitative.Pastel1
-    )
-
-    fig.update_layout(
-        title='Smags-vurdering',
-        template='simple_white',
-        margin=dict(t=60, l=40, r=20, b=60),
-        legend_title_text=''
-    )
-
-    return fig
 
 
-# --- Graph 3: Duft (stacked by Navn, ordered by total Duft) ---
+# --- Table: one page at a time, filtered and sorted on the server ---
 @app.callback(
-    Output('duft_rating', 'figure'),
-    Input('table', 'data')
+    Output('table', 'data'),
+    Output('table', 'page_count'),
+    Input('table', 'page_current'),
+    Input('table', 'page_size'),
+    Input('table', 'sort_by'),
+    Input('table', 'filter_query'),
+    Input('data-version', 'data'),
+    State('calendar', 'data')
 )
-def update_bar_chart_3(rows):
-    if not rows:
-        fig = px.bar()
-        fig.update_layout(template='simple_white',
-                          title='Duft-vurdering')
-        return fig
-
-    df = pd.DataFrame(rows)
-
-    # Sum Duft per øl + navn
-    grouped = df.groupby(['Øl', 'Navn'], as_index=False)['Duft'].sum()
-
-    # Total Duft per øl for sorting
-    total_duft = grouped.groupby('Øl', as_index=False)['Duft'].sum()
-    total_duft = total_duft.sort_values('Duft', ascending=False)
-    ol_order = total_duft['Øl'].tolist()
-
-    fig = px.bar(
-        grouped,
-        x='Øl',
-        y='Duft',
-        color='Navn',
-        barmode='stack',
-        category_orders={'Øl': ol_order},
-        labels={'Duft': 'Duft', 'Øl': 'Øl'},
-        color_discrete_sequence=px.colors.qualitative.Pastel1
-    )
-
-    fig.update_layout(
-        title='Duft-vurdering',
-        template='simple_white',
-        margin=dict(t=60, l=40, r=20, b=60),
-        legend_title_text=''
-    )
-
-    return fig
-
-
-# --- Graph 4: Helhedsoplevelse (stacked by Navn, ordered by total) ---
+def update_table(page_current, page_size, sort_by, filter_query, version, calendar):
+    cal = calendar_for(calendar)
+    with TIMING.time('query'):
+        rows, total = cal.store.query(page_current, page_size, sort_by, filter_query)
+    return rows, page_count(total, page_size)
+
+
+# --- Charts: all five figures from one callback ---
+# One request and one pass over the aggregates instead of five callbacks
+# that each rebuild and regroup the same data. Figures come from
+# the calendar's figure cache when this data version has been drawn before, and nothing
+# is sent if the browser already shows it (charts-version).
+# With BEER_CHARTS=clientside, update_chart_data and assets/charts.js
+# take over (registered below).
+def update_charts(version, selected_navn, charts_version, calendar):
+    cal = calendar_for(calendar)
+    index = cal.agg
+    with TIMING.time('sync'):
+        index.sync(cal.store)
+    current = index.store_version
+
+    # Same data as already on screen and the connoisseur did not change
+    if ctx.triggered_id == 'data-version' and charts_version == current:
+        return [dash.no_update] * 6
+
+    frame, orders = None, None
+
+    def agg():
+        nonlocal frame
+        if frame is None:
+            with TIMING.time('frame'):
+                frame = index.frame()
+        return frame
+
+    def leaderboard(graph_id):
+        nonlocal orders
+        df = agg()
+        with TIMING.time('figure'):
+            if orders is None:
+                orders = ol_orders(df) if len(index) else {}
+            metric = LEADERBOARDS[graph_id][0]
+            return leaderboard_figure(df, graph_id, orders.get(metric))
+
+    def navn_detail():
+        # A lookup in the Navn index, not a filter over the aggregate frame
+        with TIMING.time('frame'):
+            breakdown = index.breakdown(selected_navn)
+        with TIMING.time('figure'):
+            return navn_detail_figure(breakdown, selected_navn, has_data=len(index) > 0)
+
+    detail = cal.figure_cache.get((current, NAVN_DETAIL, selected_navn), navn_detail)
+
+    # Only the connoisseur changed -> leave the leaderboards alone
+    if ctx.triggered_id == 'navn-filter' and charts_version == current:
+        return [dash.no_update] * 4 + [detail, dash.no_update]
+
+    figs = [cal.figure_cache.get((current, graph_id, None),
+                                  lambda graph_id=graph_id: leaderboard(graph_id))
+            for graph_id in LEADERBOARDS]
+    return figs + [detail, current]
+
+
+# --- Statistics chart: averages that do not reward more or kinder ratings ---
+# Follows view-version, which also moves on the patch path of add_row.
 @app.callback(
-    Output('helhedsoplevelse_rating', 'figure'),
-    Input('table', 'data')
+    Output(STATS_CHART, 'figure'),
+    Input('view-version', 'data'),
+    Input('stats-mode', 'value'),
+    State('calendar', 'data')
 )
-def update_bar_chart_4(rows):
-    if not rows:
-        fig = px.bar()
-        fig.update_layout(template='simple_white',
-                          title='Helhedsvurdering')
-        return fig
-
-    df = pd.DataFrame(rows)
-
-    # Sum Helhedsoplevelse per øl + navn
-    grouped = df.groupby(['Øl', 'Navn'], as_index=False)['Helhedsoplevelse'].sum()
-
-    # Total Helhedsoplevelse per øl for sorting
-    total_helhed = grouped.groupby('Øl', as_index=False)['Helhedsoplevelse'].sum()
-    total_helhed = total_helhed.sort_values('Helhedsoplevelse', ascending=False)
-    ol_order = total_helhed['Øl'].tolist()
-
-    fig = px.bar(
-        grouped,
-        x='Øl',
-        y='Helhedsoplevelse',
-        color='Navn',
-        barmode='stack',
-        category_orders={'Øl': ol_order},
-        labels={'Helhedsoplevelse': 'Helhedsoplevelse', 'Øl': 'Øl'},
-        color_discrete_sequence=px.colors.qualitative.Pastel1
-    )
+def update_stats_chart(version, mode, calendar):
+    cal = calendar_for(calendar)
+    mode = mode if mode in STATS_MODES else 'bayes'
 
-    fig.update_layout(
-        title='Helhedsvurdering',
-        template='simple_white',
-        margin=dict(t=60, l=40, r=20, b=60),
-        legend_title_text=''
-    )
+    def build():
+        df = cal.load_data()
+        with TIMING.time('stats'):
+            stats = ol_statistics(df, normalize=STATS_MODES[mode][0])
+        with TIMING.time('figure'):
+            return stats_figure(stats, mode)
 
-    return fig
+    return cal.figure_cache.get((cal.data_version(), STATS_CHART, mode), build)
 
 
-# --- Graph 5: Detaljer for valgt ekspert ---
+# --- Timeline: cumulative score and rank after every day ---
+# Built from the index's per-(Dato, Øl) sums, not from the ratings.
 @app.callback(
-    Output('navn_detail', 'figure'),
-    Input('table', 'data'),
-    Input('navn-filter', 'value')
+    Output(TIMELINE_CHART, 'figure'),
+    Input('view-version', 'data'),
+    State('calendar', 'data')
 )
-def update_navn_detail(rows, selected_navn):
-    # No data or no name selected -> empty-ish figure
-    if not rows or selected_navn is None:
-        fig = px.bar()
-        fig.update_layout(
-            template='simple_white',
-            title='Vælg en øl connoisseur'
-        )
-        return fig
-
-    df = pd.DataFrame(rows)
-
-    # Filter for the chosen name
-    df = df[df['Navn'] == selected_navn]
-
-    if df.empty:
-        fig = px.bar()
-        fig.update_layout(
-            template='simple_white',
-            title=f'Ingen data for connoisseur {selected_navn}'
-        )
-        return fig
-
-    # Sum components per øl for this person
-    grouped = df.groupby('Øl', as_index=False)[['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']].sum()
-
-    # Total per øl for ordering
-    grouped['Total'] = grouped[['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']].sum(axis=1)
-    grouped = grouped.sort_values('Total', ascending=False)
-    ol_order = grouped['Øl'].tolist()
-
-    # Long format for stacked bar
-    plot_df = grouped.melt(
-        id_vars='Øl',
-        value_vars=['Smag', 'Duft', 'Helhedsoplevelse', 'Booster'],
-        var_name='Kategori',
-        value_name='Score'
+def update_timeline_chart(version, calendar):
+    cal = calendar_for(calendar)
+    with TIMING.time('sync'):
+        cal.agg.sync(cal.store)
+
+    def build():
+        timeline = cal.timeline()
+        with TIMING.time('figure'):
+            return timeline_figure(timeline)
+
+    return cal.figure_cache.get((cal.agg.store_version, TIMELINE_CHART, None), build)
+
+
+def update_chart_data(version, calendar):
+    return calendar_for(calendar).chart_data()
+
+
+if CHART_MODE == "clientside":
+    app.callback(
+        Output('chart-data', 'data'),
+        Input('data-version', 'data'),
+        State('calendar', 'data')
+    )(update_chart_data)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='charts', function_name='render'),
+        Output('samlede_rating', 'figure'),
+        Output('smag_rating', 'figure'),
+        Output('duft_rating', 'figure'),
+        Output('helhedsoplevelse_rating', 'figure'),
+        Output('navn_detail', 'figure'),
+        Input('chart-data', 'data'),
+        Input('navn-filter', 'value')
     )
-
-    fig = px.bar(
-        plot_df,
-        x='Øl',
-        y='Score',
-        color='Kategori',
-        barmode='stack',
-        category_orders={'Øl': ol_order},
-        labels={'Score': 'Vurdering', 'Øl': 'Øl', 'Kategori': 'Bidrag'},
-        color_discrete_sequence=px.colors.qualitative.Pastel1
-    )
-
-    fig.update_layout(
-        title=f'Vurderinger fra øl connoisseur {selected_navn}',
-        template='simple_white',
-        margin=dict(t=60, l=40, r=20, b=60),
-        legend_title_text=''
-    )
-
-    return fig
-
+else:
+    app.callback(
+        Output('samlede_rating', 'figure'),
+        Output('smag_rating', 'figure'),
+        Output('duft_rating', 'figure'),
+        Output('helhedsoplevelse_rating', 'figure'),
+        Output('navn_detail', 'figure'),
+        Output('charts-version', 'data'),
+        Input('data-version', 'data'),
+        Input('navn-filter', 'value'),
+        State('charts-version', 'data'),
+        State('calendar', 'data')
+    )(update_charts)
+
+
+# CPU time the process took to get here (mostly imports), for /metrics.
+# plotly's template is only loaded with the first figure (figures.template).
+STARTUP_SECONDS = time.process_time()
+TIMING.gauge('beer_startup_seconds', 'CPU seconds from process start until the app was built.',
+             'stat', lambda: {'cpu': STARTUP_SECONDS})
 
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -0,0 +1,153 @@
+/*
+ * Clientside chart rendering (BEER_CHARTS=clientside).
+ *
+ * The server only puts the per-(Øl, Navn) sums into the `chart-data`
+ * store; the grouping, ordering and stacking of the five charts happens
+ * here, mirroring figures.py.
+ */
+(function () {
+    // px.colors.qualitative.Pastel1
+    var PASTEL1 = [
+        'rgb(251,180,174)', 'rgb(179,205,227)', 'rgb(204,235,197)',
+        'rgb(222,203,228)', 'rgb(254,217,166)', 'rgb(255,255,204)',
+        'rgb(229,216,189)', 'rgb(253,218,236)', 'rgb(242,242,242)'
+    ];
+
+    // The parts of the 'simple_white' template the charts rely on
+    var AXIS = {
+        showgrid: false, showline: true, zeroline: false, ticks: 'outside',
+        linecolor: 'rgb(36,36,36)', automargin: true
+    };
+
+    var COMPONENTS = ['Smag', 'Duft', 'Helhedsoplevelse', 'Booster'];
+
+    // Same graphs, metrics, titles and labels as figures.LEADERBOARDS
+    var LEADERBOARDS = [
+        ['TotalScore', 'Den samlede vurdering', 'Samlet vurdering'],
+        ['Smag', 'Smags-vurdering', 'Smag'],
+        ['Duft', 'Duft-vurdering', 'Duft'],
+        ['Helhedsoplevelse', 'Helhedsvurdering', 'Helhedsoplevelse']
+    ];
+
+    function layout(title, extra) {
+        var out = {
+            title: {text: title},
+            plot_bgcolor: 'white',
+            paper_bgcolor: 'white',
+            font: {color: 'rgb(36,36,36)'},
+            xaxis: Object.assign({}, AXIS),
+            yaxis: Object.assign({}, AXIS),
+            margin: {t: 60, l: 40, r: 20, b: 60},
+            legend: {title: {text: ''}}
+        };
+        return Object.assign(out, extra || {});
+    }
+
+    function emptyFigure(title) {
+        return {data: [], layout: layout(title)};
+    }
+
+    function cmp(a, b) {
+        return a < b ? -1 : (a > b ? 1 : 0);
+    }
+
+    // Øl sorted by descending total, ties in Øl order
+    function order(totals) {
+        return Object.keys(totals).sort(function (a, b) {
+            return (totals[b] - totals[a]) || cmp(a, b);
+        });
+    }
+
+    // {columns, sums: {"Øl\tNavn": [..]}} -> rows sorted by (Øl, Navn)
+    function toRows(data) {
+        var rows = [];
+        Object.keys(data.sums).forEach(function (key) {
+            var parts = key.split('\t');
+            var row = {Øl: parts[0], Navn: parts[1]};
+            data.columns.forEach(function (c, i) { row[c] = data.sums[key][i]; });
+            rows.push(row);
+        });
+        return rows.sort(function (a, b) {
+            return cmp(a.Øl, b.Øl) || cmp(a.Navn, b.Navn);
+        });
+    }
+
+    function leaderboard(rows, metric, title, label) {
+        if (!rows.length) {
+            return emptyFigure(title);
+        }
+        var totals = {}, traces = {}, names = [];
+        rows.forEach(function (r) {
+            totals[r.Øl] = (totals[r.Øl] || 0) + r[metric];
+            if (!(r.Navn in traces)) {
+                names.push(r.Navn);
+                traces[r.Navn] = {
+                    type: 'bar', x: [], y: [], name: r.Navn,
+                    legendgroup: r.Navn, showlegend: true,
+                    marker: {color: PASTEL1[(names.length - 1) % PASTEL1.length]},
+                    hovertemplate: 'Navn=' + r.Navn + '<br>Øl=%{x}<br>' + label +
+                                   '=%{y}<extra></extra>'
+                };
+            }
+            traces[r.Navn].x.push(r.Øl);
+            traces[r.Navn].y.push(r[metric]);
+        });
+        var fig = layout(title, {barmode: 'stack'});
+        fig.xaxis.categoryorder = 'array';
+        fig.xaxis.categoryarray = order(totals);
+        fig.xaxis.title = {text: 'Øl'};
+        fig.yaxis.title = {text: label};
+        return {data: names.map(function (n) { return traces[n]; }), layout: fig};
+    }
+
+    function navnDetail(rows, navn) {
+        if (navn === null || navn === undefined) {
+            return emptyFigure('Vælg en øl connoisseur');
+        }
+        var mine = rows.filter(function (r) { return r.Navn === navn; });
+        if (!mine.length) {
+            return emptyFigure(rows.length ? 'Ingen data for connoisseur ' + navn
+                                           : 'Vælg en øl connoisseur');
+        }
+        var totals = {};
+        mine.forEach(function (r) {
+            totals[r.Øl] = COMPONENTS.reduce(function (s, c) { return s + r[c]; }, 0);
+        });
+        var ols = order(totals);
+        var data = COMPONENTS.map(function (c, i) {
+            var byOl = {};
+            mine.forEach(function (r) { byOl[r.Øl] = r[c]; });
+            return {
+                type: 'bar', x: ols, y: ols.map(function (o) { return byOl[o]; }),
+                name: c, legendgroup: c, showlegend: true,
+                marker: {color: PASTEL1[i]},
+                hovertemplate: 'Bidrag=' + c + '<br>Øl=%{x}<br>Vurdering=%{y}<extra></extra>'
+            };
+        });
+        var fig = layout('Vurderinger fra øl connoisseur ' + navn, {barmode: 'stack'});
+        fig.xaxis.categoryorder = 'array';
+        fig.xaxis.categoryarray = ols;
+        fig.xaxis.title = {text: 'Øl'};
+        fig.yaxis.title = {text: 'Vurdering'};
+        return {data: data, layout: fig};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        charts: {
+            render: function (data, selectedNavn) {
+                var dc = window.dash_clientside;
+                var rows = data && data.sums ? toRows(data) : [];
+                var triggered = (dc.callback_context.triggered || []).map(function (t) {
+                    return t.prop_id;
+                });
+                // Only the connoisseur changed -> leave the leaderboards alone
+                var onlyNavn = triggered.length === 1 && triggered[0] === 'navn-filter.value';
+                var figs = LEADERBOARDS.map(function (lb) {
+                    return onlyNavn ? dc.no_update : leaderboard(rows, lb[0], lb[1], lb[2]);
+                });
+                figs.push(navnDetail(rows, selectedNavn));
+                return figs;
+            }
+        }
+    });
+})();
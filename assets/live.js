@@ -0,0 +1,30 @@
+/*
+ * Live updates: every few seconds (dcc.Interval 'live-poll') ask the
+ * server for its data version (GET api/version, a few bytes, revalidated
+ * with ETag). Only when it differs from what this page shows is
+ * data-version set, which makes the table fetch its current page and the
+ * charts their (server-cached) figures.
+ */
+(function () {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        live: {
+            poll: function (nIntervals, url, viewVersion) {
+                var dc = window.dash_clientside;
+                var unchanged = [dc.no_update, dc.no_update];
+                // Background tabs catch up once they are visible again
+                if (document.hidden || !url) {
+                    return unchanged;
+                }
+                return fetch(url, {cache: 'no-cache', credentials: 'same-origin'})
+                    .then(function (r) { return r.ok ? r.json() : null; })
+                    .then(function (body) {
+                        if (!body || body.version === viewVersion) {
+                            return unchanged;
+                        }
+                        return [body.version, body.version];
+                    })
+                    .catch(function () { return unchanged; });
+            }
+        }
+    });
+})();
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the app's storage, table and chart paths as the data grows.
+
+For every N it generates N synthetic ratings across M beers and K
+connoisseurs (scores drawn from the domains in app.py), points the app at
+a temporary store and times:
+- save_data, cold load_data (CSV parse and snapshot) and cached load_data
+- add_row through /_dash-update-component, both the patch path (the
+  browser is up to date) and the refresh path (it missed other writes)
+- update_table (first page; sorted and filtered)
+- update_charts with an empty and a warm figure cache, and a Navn change
+  (from the figure cache and built anew)
+- update_stats_chart in every stats mode (statistics and figure built anew)
+- update_timeline_chart (timeline and figure built anew from the index)
+- chart_data (the BEER_CHARTS=clientside payload)
+- bulk export (CSV), and bulk import of the export (all unchanged) and of
+  a file with new scores for every rating
+- building each figure from the warm aggregate index (no cache, no request)
+- process start: importing app in a fresh interpreter, then the first
+  figure (which loads the plotly template); recorded with rows = 0
+
+Every rating has its own (Dato, Øl, Navn) key, so K is raised when N
+needs more keys than M beers x K connoisseurs x 24 days.
+
+Callbacks go through the Flask test client, so the recorded sizes are the
+serialized JSON responses the browser would get, per request and per
+figure. Results are written as JSON (see --out), with the git commit, so
+runs can be compared; --compare prints the change against an older file.
+
+Usage:
+    python benchmarks/bench_app.py --rows 1000 10000 100000 --beers 24 --raters 8
+    python benchmarks/bench_app.py --compare benchmarks/results/bench_app-<commit>.json
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import app  # noqa: E402
+from aggregates import AggregateIndex  # noqa: E402
+from bulk import export_chunks, import_ratings  # noqa: E402
+from calendars import Calendar, CalendarConfig, CalendarRegistry  # noqa: E402
+from figures import (FIGURE_IDS, LEADERBOARDS, STATS_CHART, STATS_MODES,  # noqa: E402
+                     TIMELINE_CHART, FigureCache, leaderboard_figure, navn_detail_figure,
+                     ol_orders, stats_figure, timeline_figure)
+from ratings import COLUMNS, KEY, SCORES  # noqa: E402
+from stats import ol_statistics  # noqa: E402
+from storage import open_store  # noqa: E402
+from writebehind import WriteBehindStore  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Run in a fresh interpreter by startup(): seconds to import app, then to
+# build the first figure
+STARTUP_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+import figures
+figures.empty_figure('')
+print(t1 - t0, time.perf_counter() - t1)
+"""
+
+
+# ---------- Synthetic data ----------
+def make_domains(beers, raters):
+    """app.DOMAINS with M beers and K connoisseurs (extra ones named like the real ones)."""
+    ol = list(app.Øl[:beers]) + [f'Øl{i}' for i in range(len(app.Øl) + 1, beers + 1)]
+    navn = list(app.Navn[:raters]) + [f'Navn{i}' for i in range(len(app.Navn) + 1, raters + 1)]
+    return dict(app.DOMAINS, Øl=ol, Navn=navn)
+
+
+def raters_for(n, beers, raters):
+    """Connoisseurs needed so that n ratings all get their own (Dato, Øl, Navn) key."""
+    return max(raters, -(-n // (len(app.Date) * beers)))
+
+
+def rating_keys(domains, seed=0):
+    """Every (Dato, Øl, Navn) of domains, in a fixed random order."""
+    keys = list(itertools.product(*(domains[c] for c in KEY)))
+    random.Random(seed).shuffle(keys)
+    return keys
+
+
+def make_ratings(n, domains, seed=0, offset=0):
+    """n ratings with distinct keys (rating_keys()[offset:offset + n]), scores from domains."""
+    keys = rating_keys(domains, seed)[offset:offset + n]
+    if len(keys) < n:
+        raise ValueError(f'not enough (Dato, Øl, Navn) keys for {n} ratings')
+    rnd = random.Random(seed + offset)
+    return pd.DataFrame([{**dict(zip(KEY, key)), **{c: rnd.choice(domains[c]) for c in SCORES}}
+                         for key in keys], columns=COLUMNS)
+
+
+# ---------- Dash requests ----------
+def callback_key(first_output):
+    """callback_map key of the callback whose first output is first_output."""
+    for key in app.app.callback_map:
+        if key.strip('.').split('...')[0].split('@')[0] == first_output:
+            return key
+    raise KeyError(first_output)
+
+
+def callback_body(first_output, inputs, state=(), changed=None):
+    """Request body for /_dash-update-component, as the browser sends it."""
+    key = callback_key(first_output)
+    spec = app.app.callback_map[key]
+    outputs = [dict(zip(('id', 'property'), o.split('.', 1)))
+               for o in key.strip('.').split('...')]
+    return {
+        'output': key,
+        'outputs': outputs if key.startswith('..') else outputs[0],
+        'inputs': [dict(i, value=v) for i, v in zip(spec['inputs'], inputs)],
+        'state': [dict(s, value=v) for s, v in zip(spec.get('state', []), state)],
+        'changedPropIds': changed or ['{id}.{property}'.format(**spec['inputs'][0])],
+    }
+
+
+def post(client, body):
+    """(response JSON, response size in bytes); raises on an error status."""
+    r = client.post('/_dash-update-component', json=body)
+    if r.status_code not in (200, 204):
+        raise RuntimeError(f'{body["output"][:40]}: HTTP {r.status_code}')
+    return (r.get_json() if r.status_code == 200 else {}), len(r.data)
+
+
+def add_row_body(row, view_version, selected_navn=None):
+    values = [row[c] for c in COLUMNS]
+    return callback_body('data-version.data', [1],
+                         values + [view_version, 0, 10, 1, [], '', selected_navn, None])
+
+
+# The calendar state is None: the default calendar (see use_store)
+def table_body(version, sort_by=(), filter_query=''):
+    return callback_body('table.data', [0, 10, list(sort_by), filter_query, version], [None])
+
+
+def charts_body(version, selected_navn=None, charts_version=None, changed='data-version.data'):
+    return callback_body('samlede_rating.figure', [version, selected_navn],
+                         [charts_version, None], changed=[changed])
+
+
+def stats_body(version, mode):
+    return callback_body(f'{STATS_CHART}.figure', [version, mode], [None])
+
+
+def timeline_body(version):
+    return callback_body(f'{TIMELINE_CHART}.figure', [version], [None])
+
+
+# ---------- Measuring ----------
+def timed(fn, repeat):
+    """Run fn repeat times; (timings in seconds, last result)."""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def record(results, n, name, times, size=None, **extra):
+    entry = {'rows': n, 'name': name,
+             'min_s': min(times), 'median_s': statistics.median(times),
+             'repeat': len(times)}
+    if size is not None:
+        entry['bytes'] = size
+    entry.update(extra)
+    results.append(entry)
+    size_text = f'{size / 1e3:10.1f} kB' if size is not None else ''
+    print(f'{name:28s} {entry["median_s"] * 1e3:10.2f} ms {size_text}')
+
+
+def use_store(path, backend, domains, write_behind=None):
+    """Make a fresh store at path the app's only (and default) calendar.
+
+    write_behind: WriteBehindStore keyword arguments, to queue the writes.
+    """
+    app.CALENDARS.close()
+    if backend == 'sqlite':
+        store = open_store('sqlite', path, COLUMNS, domains=domains)
+    else:
+        store = open_store('csv', path, COLUMNS, domains=domains, snapshot=True)
+    app.WRITE_BEHIND = write_behind is not None
+    if app.WRITE_BEHIND:
+        store = WriteBehindStore(store, **write_behind)
+    config = CalendarConfig('bench', 'Benchmark', '', domains, os.path.splitext(path)[0])
+    app.CALENDARS = CalendarRegistry(
+        {config.slug: config},
+        lambda config: Calendar(config, store, timing=app.TIMING, figure_cache_size=128),
+        default=config.slug)
+
+
+def calendar():
+    """The calendar set up by use_store."""
+    return app.CALENDARS.get()
+
+
+def clear_caches(index=False):
+    """Empty the calendar's figure cache (and its aggregate index)."""
+    cal = calendar()
+    if index:
+        cal.agg = AggregateIndex()
+    cal.figure_cache = FigureCache(maxsize=128)
+
+
+def run(n, args, results):
+    raters = raters_for(n + args.repeat * 2, args.beers, args.raters)
+    domains = make_domains(args.beers, raters)
+    df = make_ratings(n, domains, seed=args.seed)
+    # New keys for add_row
+    extra = make_ratings(args.repeat * 2, domains, seed=args.seed, offset=n)
+    client = app.server.test_client()
+    print(f'--- {n} ratings, {args.beers} beers, {raters} connoisseurs '
+          f'({args.backend}) ---')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ratings.db' if args.backend == 'sqlite' else 'ratings.csv')
+        use_store(path, args.backend, domains)
+
+        times, _ = timed(lambda: calendar().save_data(df), args.repeat)
+        record(results, n, 'save_data', times)
+
+        def cold_load(drop_snapshot):
+            if drop_snapshot and os.path.exists(f'{path}.snap'):
+                os.remove(f'{path}.snap')
+            use_store(path, args.backend, domains)
+            return calendar().load_data()
+
+        times, _ = timed(lambda: cold_load(True), args.repeat)
+        record(results, n, 'load_data cold', times)
+        if args.backend == 'csv':
+            cold_load(True)  # leaves a snapshot behind
+            times, _ = timed(lambda: cold_load(False), args.repeat)
+            record(results, n, 'load_data cold snapshot', times)
+        times, _ = timed(lambda: calendar().load_data(), args.repeat)
+        record(results, n, 'load_data cached', times)
+
+        # Charts: empty cache, then the same version again from the cache
+        version = calendar().data_version()
+
+        def charts_cold():
+            clear_caches(index=True)
+            return post(client, charts_body(version))
+
+        times, (payload, size) = timed(charts_cold, args.repeat)
+        figure_bytes = {graph_id: len(json.dumps(payload['response'][graph_id]['figure']))
+                        for graph_id in FIGURE_IDS if graph_id in payload['response']}
+        record(results, n, 'update_charts cold', times, size, figures=figure_bytes)
+        times, (_, size) = timed(lambda: post(client, charts_body(version)), args.repeat)
+        record(results, n, 'update_charts cached', times, size)
+        navn = domains['Navn'][0]
+        times, (_, size) = timed(lambda: post(client, charts_body(
+            version, navn, version, changed='navn-filter.value')), args.repeat)
+        record(results, n, 'update_charts navn', times, size)
+
+        def navn_cold():
+            clear_caches()
+            return post(client, charts_body(version, navn, version, changed='navn-filter.value'))
+
+        times, (_, size) = timed(navn_cold, args.repeat)
+        record(results, n, 'update_charts navn cold', times, size)
+
+        def stats_cold(mode):
+            clear_caches()
+            return post(client, stats_body(version, mode))
+
+        for mode in STATS_MODES:
+            times, (_, size) = timed(lambda: stats_cold(mode), args.repeat)
+            record(results, n, f'update_stats {mode}', times, size)
+
+        def timeline_cold():
+            clear_caches()
+            return post(client, timeline_body(version))
+
+        times, (_, size) = timed(timeline_cold, args.repeat)
+        record(results, n, 'update_timeline', times, size)
+
+        times, (_, size) = timed(lambda: post(client, table_body(version)), args.repeat)
+        record(results, n, 'update_table', times, size)
+        times, (_, size) = timed(lambda: post(client, table_body(
+            version, [{'column_id': 'Smag', 'direction': 'desc'}],
+            '{Duft} >= 3 && {Øl} = ' + domains['Øl'][0])), args.repeat)
+        record(results, n, 'update_table sort+filter', times, size)
+
+        times, data = timed(lambda: calendar().chart_data(), args.repeat)
+        record(results, n, 'chart_data', times, len(json.dumps(data)))
+
+        # Figure building alone, from the aggregates the charts use
+        index = calendar().agg
+        frame = index.frame()
+        orders = ol_orders(frame)
+        for graph_id, (metric, _, _) in LEADERBOARDS.items():
+            times, _ = timed(lambda: leaderboard_figure(frame, graph_id, orders[metric]),
+                             args.repeat)
+            record(results, n, f'figure {graph_id}', times)
+        breakdown = index.breakdown(navn)
+        times, _ = timed(lambda: navn_detail_figure(breakdown, navn), args.repeat)
+        record(results, n, 'figure navn_detail', times)
+        stats = ol_statistics(calendar().load_data())
+        times, _ = timed(lambda: stats_figure(stats, 'bayes'), args.repeat)
+        record(results, n, f'figure {STATS_CHART}', times)
+        timeline = calendar().timeline()
+        times, _ = timed(lambda: timeline_figure(timeline), args.repeat)
+        record(results, n, f'figure {TIMELINE_CHART}', times)
+
+        # add_row: the browser shows the version right before the write
+        rows = iter(extra.to_dict('records'))
+        times, (_, size) = timed(lambda: post(client, add_row_body(
+            next(rows), calendar().data_version(), navn)), args.repeat)
+        record(results, n, 'add_row patch', times, size)
+        times, (_, size) = timed(lambda: post(client, add_row_body(
+            next(rows), 'stale')), args.repeat)
+        record(results, n, 'add_row refresh', times, size)
+
+        # Bulk: export everything, import it again (nothing to store), then
+        # files that change every rating's Smag, alternately
+        times, body = timed(lambda: b''.join(export_chunks(calendar().store, 'csv')),
+                            args.repeat)
+        record(results, n, 'export csv', times, len(body))
+        times, _ = timed(lambda: import_ratings(calendar().store, io.BytesIO(body), domains),
+                         args.repeat)
+        record(results, n, 'import unchanged', times, len(body))
+        smag = domains['Smag']
+        rotated = df.assign(Smag=df['Smag'].map(dict(zip(smag, smag[1:] + smag[:1]))))
+        files = itertools.cycle([d.to_csv(index=False).encode('utf-8') for d in (rotated, df)])
+        times, _ = timed(lambda: import_ratings(calendar().store, io.BytesIO(next(files)),
+                                                domains), args.repeat)
+        record(results, n, 'import', times)
+
+
+def startup(args, results):
+    """Process start: import app and build the first figure in a fresh interpreter."""
+    print('--- startup ---')
+    runs = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        runs.append([float(v) for v in out.split()])
+    record(results, 0, 'startup import app', [r[0] for r in runs])
+    record(results, 0, 'startup first figure', [r[1] for r in runs])
+
+
+# ---------- Results ----------
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(old_path, new):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    before = {(r['rows'], r['name']): r for r in old['results']}
+    print(f'--- {old["commit"]} -> {new["commit"]} (median) ---')
+    for r in new['results']:
+        o = before.get((r['rows'], r['name']))
+        if o:
+            print(f'{r["rows"]:>8} {r["name"]:28s} {o["median_s"] * 1e3:10.2f} ms '
+                  f'-> {r["median_s"] * 1e3:10.2f} ms  ({r["median_s"] / o["median_s"]:5.2f}x)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--beers', type=int, default=len(app.Øl))
+    parser.add_argument('--raters', type=int, default=len(app.Navn))
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='results file (default: benchmarks/results/'
+                                      'bench_app-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    results = []
+    startup(args, results)
+    for n in args.rows:
+        run(n, args, results)
+
+    commit = git_commit()
+    report = {
+        'benchmark': 'bench_app',
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'chart_mode': app.CHART_MODE,
+        'params': {k: v for k, v in vars(args).items() if k not in ('out', 'compare')},
+        'results': results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f'bench_app-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Results written to {out}')
+
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Fused chart update vs the old per-chart callbacks.
+
+The old app had one callback per chart (update_bar_chart_1..4 and
+update_navn_detail), each turning the table rows into a DataFrame and
+regrouping them. They are reproduced below as the baseline and timed
+against figures.build_figures, both from a cold aggregate index (rows ->
+index -> figures) and from a warm one (steady state in the app).
+
+Usage:
+    python benchmarks/bench_fused.py --rows 100 1000 10000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aggregates import AggregateIndex  # noqa: E402
+from figures import build_figures  # noqa: E402
+
+OL = ['Øl1', 'Øl2', 'Øl3', 'Øl4']
+NAVN = ['Tejl', 'Stein', 'Ems', 'Miks']
+
+
+def make_rows(n, seed=0):
+    rnd = random.Random(seed)
+    return [{
+        'Dato': rnd.randint(1, 24),
+        'Øl': rnd.choice(OL),
+        'Navn': rnd.choice(NAVN),
+        'Smag': rnd.randint(1, 10),
+        'Duft': rnd.randint(1, 5),
+        'Helhedsoplevelse': rnd.randint(1, 5),
+        'Booster': rnd.choice([0, 2]),
+    } for _ in range(n)]
+
+
+# ---------- Baseline: one callback per chart ----------
+def legacy_leaderboard(rows, metric, title):
+    df = pd.DataFrame(rows)
+    if metric == 'TotalScore':
+        df['TotalScore'] = df[['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']].sum(axis=1)
+    grouped = df.groupby(['Øl', 'Navn'], as_index=False)[metric].sum()
+    total = grouped.groupby('Øl', as_index=False)[metric].sum()
+    ol_order = total.sort_values(metric, ascending=False)['Øl'].tolist()
+    fig = px.bar(grouped, x='Øl', y=metric, color='Navn', barmode='stack',
+                 category_orders={'Øl': ol_order},
+                 color_discrete_sequence=px.colors.qualitative.Pastel1)
+    fig.update_layout(title=title, template='simple_white',
+                      margin=dict(t=60, l=40, r=20, b=60), legend_title_text='')
+    return fig
+
+
+def legacy_navn_detail(rows, selected_navn):
+    components = ['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+    df = pd.DataFrame(rows)
+    df = df[df['Navn'] == selected_navn]
+    grouped = df.groupby('Øl', as_index=False)[components].sum()
+    grouped['Total'] = grouped[components].sum(axis=1)
+    grouped = grouped.sort_values('Total', ascending=False)
+    plot_df = grouped.melt(id_vars='Øl', value_vars=components,
+                           var_name='Kategori', value_name='Score')
+    fig = px.bar(plot_df, x='Øl', y='Score', color='Kategori', barmode='stack',
+                 category_orders={'Øl': grouped['Øl'].tolist()},
+                 color_discrete_sequence=px.colors.qualitative.Pastel1)
+    fig.update_layout(title=f'Vurderinger fra øl connoisseur {selected_navn}',
+                      template='simple_white',
+                      margin=dict(t=60, l=40, r=20, b=60), legend_title_text='')
+    return fig
+
+
+def legacy_all(rows, selected_navn):
+    return [
+        legacy_leaderboard(rows, 'TotalScore', 'Den samlede vurdering'),
+        legacy_leaderboard(rows, 'Smag', 'Smags-vurdering'),
+        legacy_leaderboard(rows, 'Duft', 'Duft-vurdering'),
+        legacy_leaderboard(rows, 'Helhedsoplevelse', 'Helhedsvurdering'),
+        legacy_navn_detail(rows, selected_navn),
+    ]
+
+
+# ---------- Fused ----------
+def fused_cold(rows, selected_navn):
+    index = AggregateIndex()
+    index.add_frame(pd.DataFrame(rows))
+    return build_figures(index.frame(), selected_navn)
+
+
+def best_of(fn, repeat, number=3):
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'per-chart ms':>13} {'fused cold ms':>14} {'fused warm ms':>14}")
+    for n in args.rows:
+        rows = make_rows(n)
+        index = AggregateIndex()
+        index.add_frame(pd.DataFrame(rows))
+
+        legacy = best_of(lambda: legacy_all(rows, 'Ems'), args.repeat)
+        cold = best_of(lambda: fused_cold(rows, 'Ems'), args.repeat)
+        warm = best_of(lambda: build_figures(index.frame(), 'Ems'), args.repeat)
+        print(f"{n:>8} {legacy * 1e3:>13.1f} {cold * 1e3:>14.1f} {warm * 1e3:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Cold start with and without the binary snapshot.
+
+For N synthetic ratings, times a cold full read of the CSV store:
+- csv:       parse the whole log (Øl/Navn as categories) + ratings.to_typed
+- snapshot:  map the snapshot written by a previous start
+- snap+tail: snapshot plus parsing ratings appended after it
+
+Usage:
+    python benchmarks/bench_snapshot.py --rows 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from bench_app import make_domains, make_ratings, raters_for  # noqa: E402
+from ratings import COLUMNS  # noqa: E402
+from storage import SNAPSHOT_MAX_TAIL, CsvLogStore  # noqa: E402
+
+
+def best_of(fn, repeat=5):
+    return min(timeit.repeat(fn, repeat=repeat, number=1))
+
+
+def cold_load(path, domains, snapshot):
+    return CsvLogStore(path, COLUMNS, domains=domains, snapshot=snapshot).load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for n in args.rows:
+        # Distinct (Dato, Øl, Navn) keys, so every row is a current rating
+        domains = make_domains(4, raters_for(n + SNAPSHOT_MAX_TAIL, 4, 4))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ratings.csv')
+            make_ratings(n, domains).to_csv(path, index=False)
+
+            t_csv = best_of(lambda: cold_load(path, domains, False))
+            cold_load(path, domains, True)  # writes the snapshot
+            t_snap = best_of(lambda: cold_load(path, domains, True))
+
+            # A tail just below the rewrite threshold, so every run parses it
+            store = CsvLogStore(path, COLUMNS, domains=domains)
+            for row in make_ratings(SNAPSHOT_MAX_TAIL, domains, offset=n).to_dict('records'):
+                store.upsert(row)
+            t_tail = best_of(lambda: cold_load(path, domains, True))
+
+            csv_mb = os.path.getsize(path) / 1e6
+            snap_mb = os.path.getsize(f"{path}.snap") / 1e6
+
+        print(f"--- {n} ratings (csv {csv_mb:.1f} MB, snapshot {snap_mb:.1f} MB) ---")
+        print(f"csv        {t_csv * 1e3:8.1f} ms")
+        print(f"snapshot   {t_snap * 1e3:8.1f} ms   ({t_csv / t_snap:.0f}x)")
+        print(f"snap+tail  {t_tail * 1e3:8.1f} ms   ({SNAPSHOT_MAX_TAIL} appended ratings)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Memory and parse time of the typed rating representation.
+
+Compares, for N synthetic ratings:
+- parse: pd.read_csv as load_data did it vs. reading Øl/Navn straight
+  into categories + ratings.to_typed
+- memory: untyped DataFrame vs. typed DataFrame, list of dicts (the old
+  table.data) vs. list of __slots__ Rating objects
+- validation: per-row Python checks vs. vectorized ratings.validate
+
+Usage:
+    python benchmarks/bench_typed.py --rows 10000 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from bench_fused import make_rows  # noqa: E402
+from ratings import READ_DTYPES, Rating, to_typed, validate  # noqa: E402
+
+DOMAINS = {
+    'Dato': list(range(1, 25)),
+    'Øl': ['Øl1', 'Øl2', 'Øl3', 'Øl4'],
+    'Navn': ['Tejl', 'Stein', 'Ems', 'Miks'],
+    'Smag': list(range(1, 11)),
+    'Duft': [1, 2, 3, 4, 5],
+    'Helhedsoplevelse': [1, 2, 3, 4, 5],
+    'Booster': [0, 2],
+}
+
+
+def allocated(build):
+    """Bytes still allocated by the object build() returns."""
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def best_of(fn, repeat=5, number=1):
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    for n in args.rows:
+        rows = make_rows(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ratings.csv')
+            pd.DataFrame(rows).to_csv(path, index=False)
+
+            plain = pd.read_csv(path)
+            typed = to_typed(plain, DOMAINS)
+            t_plain = best_of(lambda: pd.read_csv(path))
+            t_typed = best_of(
+                lambda: to_typed(pd.read_csv(path, dtype=READ_DTYPES), DOMAINS))
+
+        m_plain = plain.memory_usage(deep=True).sum()
+        m_typed = typed.memory_usage(deep=True).sum()
+        m_dicts = allocated(lambda: [dict(r) for r in rows])
+        m_slots = allocated(lambda: [Rating.from_dict(r) for r in rows])
+
+        def per_row():
+            return [all(r[c] in allowed for c, allowed in DOMAINS.items()) for r in rows]
+
+        t_loop = best_of(per_row)
+        t_vec = best_of(lambda: validate(typed, DOMAINS))
+
+        print(f"--- {n} ratings ---")
+        print(f"parse      untyped  {t_plain * 1e3:8.1f} ms   typed      {t_typed * 1e3:8.1f} ms")
+        print(f"frame      untyped  {m_plain / 1e6:8.2f} MB   typed      {m_typed / 1e6:8.2f} MB")
+        print(f"rows       dicts    {m_dicts / 1e6:8.2f} MB   Rating     {m_slots / 1e6:8.2f} MB")
+        print(f"validate   per-row  {t_loop * 1e3:8.1f} ms   vectorized {t_vec * 1e3:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the Dash callback endpoint with many concurrent tasters.
+
+Each simulated taster runs in its own thread and sends the requests a
+browser sends to /_dash-update-component: add_row submits, chart updates
+and table pages, in the proportions given by --mix. Tasters keep their
+own view-version up to date from the add_row responses, like the page
+does. Targets:
+- testclient: the app in this process, through Flask's test client
+- wsgi:       a local werkzeug server on a temporary store, in a separate
+              process; --workers > 1 forks one process per request, so
+              writes really come from several processes
+- --url:      an already running server (e.g. gunicorn -w 4 app:server)
+
+--write-behind off on runs every combination with synchronous writes and
+again with the queued group commits of BEER_WRITE_BEHIND=on (see
+writebehind.py), e.g. for a burst of submits:
+    python benchmarks/loadtest.py --mix add_row:1 --clients 16 64 --write-behind off on
+
+For every (workers, clients) combination it reports throughput, error
+rate and p50/p95/p99 latency per request type, then checks for lost
+updates. Submits use (Dato, Øl, Navn) keys that are not stored yet (taken
+in turn from bench_app.rating_keys after the --rows seeded ones, random
+keys once those run out), so on a local store the number of ratings must
+have grown by exactly the number of new keys acknowledged, and every
+acknowledged key must hold one of the ratings sent for it (checked after
+the queue of a write-behind run has been flushed).
+
+Requests are built from app.callback_map (see bench_app); --payloads
+replays recorded request bodies instead, one JSON body per line (e.g.
+copied from the browser's network tab).
+
+Usage:
+    python benchmarks/loadtest.py --clients 1 4 16 --duration 10
+    python benchmarks/loadtest.py --target wsgi --workers 1 4 --backend sqlite
+    python benchmarks/loadtest.py --url http://127.0.0.1:8050 --clients 8
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import itertools
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import app  # noqa: E402
+from bench_app import (add_row_body, calendar, callback_body, charts_body,  # noqa: E402
+                       make_domains, make_ratings, raters_for, rating_keys, table_body,
+                       use_store)
+from ratings import COLUMNS, KEY, SCORES, frame_keys  # noqa: E402
+from storage import open_store  # noqa: E402
+
+ENDPOINT = '/_dash-update-component'
+
+
+# ---------- Transports ----------
+class TestClientTransport:
+    """Requests to the app in this process."""
+
+    def __init__(self):
+        self.client = app.server.test_client()
+
+    def post(self, body):
+        r = self.client.post(ENDPOINT, json=body)
+        return r.status_code, r.data
+
+
+class HttpTransport:
+    """Requests to a server over HTTP, one connection per request."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+
+    def post(self, body):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request('POST', self.prefix + ENDPOINT, json.dumps(body).encode('utf-8'),
+                         {'Content-Type': 'application/json'})
+            r = conn.getresponse()
+            return r.status, r.read()
+        finally:
+            conn.close()
+
+
+# ---------- Local server ----------
+def _serve(path, backend, domains, port, workers, write_behind):
+    import logging
+
+    from werkzeug.serving import run_simple
+
+    # One log line per request would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Exit normally on terminate(), so atexit flushes a write-behind queue
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    use_store(path, backend, domains, write_behind)
+    if workers > 1:
+        run_simple('127.0.0.1', port, app.server, processes=workers, threaded=False)
+    else:
+        run_simple('127.0.0.1', port, app.server, threaded=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(path, backend, domains, workers, write_behind=None):
+    """werkzeug server process on a free port; (process, url)."""
+    port = free_port()
+    proc = multiprocessing.Process(target=_serve, args=(path, backend, domains, port, workers,
+                                                        write_behind),
+                                   daemon=True)
+    proc.start()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError('local server did not start')
+
+
+# ---------- Tasters ----------
+def parse_mix(text):
+    """'add_row:1,charts:2,table:1' -> {'add_row': 1.0, ...}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        if name not in ('add_row', 'charts', 'table'):
+            raise argparse.ArgumentTypeError(f'unknown request type {name!r}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def stored_total(transport, version):
+    """Number of stored ratings, as update_table reports it (page size 1)."""
+    status, data = transport.post(callback_body('table.data', [0, 1, [], '', version], [None]))
+    if status != 200:
+        raise RuntimeError(f'table request failed: HTTP {status}')
+    return json.loads(data)['response']['table']['page_count']
+
+
+def request_type(body):
+    output = body['output']
+    if 'data-version.data' in output:
+        return 'add_row'
+    if output.startswith('..table.data'):
+        return 'table'
+    return 'charts'
+
+
+class KeySource:
+    """Unused (Dato, Øl, Navn) keys shared by all tasters; random keys once they run out."""
+
+    def __init__(self, keys):
+        self._keys = keys
+        self._next = itertools.count()
+        self.reused = 0
+
+    def take(self, rnd, domains):
+        i = next(self._next)  # atomic, so no two tasters get the same key
+        if i < len(self._keys):
+            return self._keys[i]
+        self.reused += 1
+        return tuple(rnd.choice(domains[c]) for c in KEY)
+
+
+def taster(transport, domains, mix, recorded, keys, deadline, seed, out):
+    """One taster's request loop; fills out with latencies, errors and submitted rows."""
+    rnd = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    version = None
+    while time.monotonic() < deadline:
+        if recorded:
+            body = json.loads(json.dumps(rnd.choice(recorded)))
+            kind, row = request_type(body), None
+            if kind == 'add_row' and version is not None:
+                # The view-version state is the last State before the table ones
+                body['state'][7]['value'] = version
+        else:
+            kind = rnd.choices(kinds, weights)[0]
+            row = None
+            if kind == 'add_row':
+                row = dict(zip(KEY, keys.take(rnd, domains)),
+                           **{c: rnd.choice(domains[c]) for c in SCORES})
+                body = add_row_body(row, version, rnd.choice(domains['Navn'] + [None]))
+            elif kind == 'charts':
+                body = charts_body(version, rnd.choice(domains['Navn'] + [None]))
+            else:
+                body = table_body(version, filter_query=rnd.choice(
+                    ['', '{Smag} >= 5', '{Navn} = ' + rnd.choice(domains['Navn'])]))
+
+        t0 = time.perf_counter()
+        try:
+            status, data = transport.post(body)
+        except OSError as exc:
+            status, data = type(exc).__name__, b''
+        out['latency'][kind].append(time.perf_counter() - t0)
+
+        if status not in (200, 204):
+            out['errors'][kind][str(status)] += 1
+            continue
+        if kind == 'add_row' and status == 200:
+            response = json.loads(data)['response']
+            if response.get('feedback', {}).get('children'):
+                out['errors'][kind]['rejected'] += 1
+                continue
+            # A queued write (write-behind) leaves the view as it is
+            version = response.get('view-version', {}).get('data', version)
+            out['acked'] += 1
+            if row is not None:
+                out['submitted'].setdefault(tuple(row[c] for c in KEY), set()).add(
+                    tuple(row[c] for c in SCORES))
+
+
+def run_level(transport_factory, clients, args, domains, recorded, keys):
+    """Run `clients` tasters for args.duration seconds; merged results."""
+    outs = [{'latency': {k: [] for k in ('add_row', 'charts', 'table')},
+             'errors': {k: Counter() for k in ('add_row', 'charts', 'table')},
+             'acked': 0, 'submitted': {}} for _ in range(clients)]
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=taster, args=(transport_factory(), domains, args.mix,
+                                                     recorded, keys, deadline,
+                                                     args.seed + i, out))
+               for i, out in enumerate(outs)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    merged = {'latency': {}, 'errors': {}, 'acked': 0, 'submitted': {}}
+    for kind in ('add_row', 'charts', 'table'):
+        merged['latency'][kind] = [x for o in outs for x in o['latency'][kind]]
+        merged['errors'][kind] = sum((o['errors'][kind] for o in outs), Counter())
+    for o in outs:
+        merged['acked'] += o['acked']
+        for key, values in o['submitted'].items():
+            merged['submitted'].setdefault(key, set()).update(values)
+    merged['elapsed'] = elapsed
+    return merged
+
+
+def summarize(result):
+    """Per request type: count, throughput, error rate, latency percentiles (ms)."""
+    summary = {}
+    for kind, latencies in result['latency'].items():
+        if not latencies:
+            continue
+        errors = sum(result['errors'][kind].values())
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+        summary[kind] = {
+            'requests': len(latencies),
+            'rps': len(latencies) / result['elapsed'],
+            'error_rate': errors / len(latencies),
+            'errors': dict(result['errors'][kind]),
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        }
+    return summary
+
+
+def check_lost_updates(result, before, after, stored, seeded):
+    """Problems found comparing acknowledged submits with what was stored.
+
+    stored: key -> scores of every stored rating; seeded: the keys stored
+    before the run.
+    """
+    problems = []
+    new_keys = result['submitted'].keys() - seeded
+    if after - before != len(new_keys):
+        problems.append(f'{len(new_keys)} new ratings acknowledged but the store grew by '
+                        f'{after - before}')
+    missing = [k for k in result['submitted'] if k not in stored]
+    wrong = [k for k, values in result['submitted'].items()
+             if k in stored and stored[k] not in values]
+    if missing or wrong:
+        problems.append(f'{len(missing)} submitted ratings missing, '
+                        f'{len(wrong)} stored with scores that were never sent')
+    return problems
+
+
+def stored_rows(path, backend, domains):
+    """key -> scores of every rating in the store at path."""
+    store = open_store(backend, path, COLUMNS, domains=domains)
+    df = store.load()
+    scores = [tuple(int(v) if isinstance(v, (int, np.integer)) else v for v in r)
+              for r in df[SCORES].itertuples(index=False)]
+    return dict(zip(frame_keys(df), scores))
+
+
+def report(label, clients, summary, problems, checked=True):
+    print(f'--- {label}, {clients} taster(s) ---')
+    for kind, s in summary.items():
+        print(f'{kind:8s} {s["requests"]:7d} req {s["rps"]:8.1f}/s  '
+              f'err {s["error_rate"] * 100:5.1f}%  p50 {s["p50_ms"]:8.1f} ms  '
+              f'p95 {s["p95_ms"]:8.1f} ms  p99 {s["p99_ms"]:8.1f} ms')
+    for problem in problems:
+        print(f'LOST UPDATES: {problem}')
+    if not checked:
+        print('lost updates: not checked (only for local stores and generated submits)')
+    elif not problems:
+        print('lost updates: none')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=['testclient', 'wsgi'], default='testclient')
+    parser.add_argument('--url', help='load an already running server instead')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='server processes for --target wsgi')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('add_row:1,charts:2,table:1'))
+    parser.add_argument('--payloads', help='recorded request bodies, one JSON per line')
+    parser.add_argument('--rows', type=int, default=1000, help='ratings stored before each run')
+    parser.add_argument('--beers', type=int, default=len(app.Øl))
+    parser.add_argument('--raters', type=int, default=len(app.Navn))
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--write-behind', choices=['off', 'on'], nargs='+', default=['off'],
+                        help='synchronous writes, queued group commits, or both')
+    parser.add_argument('--flush-seconds', type=float, default=0.05,
+                        help='write-behind flush interval')
+    parser.add_argument('--flush-batch', type=int, default=256,
+                        help='write-behind batch size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results as JSON to this file')
+    args = parser.parse_args()
+    if 'on' in args.write_behind and args.target == 'wsgi' and max(args.workers) > 1:
+        # werkzeug forks a short-lived process per request, which would
+        # exit with its queue unflushed
+        parser.error('--write-behind on needs --workers 1 with --target wsgi')
+
+    recorded = []
+    if args.payloads:
+        with open(args.payloads, encoding='utf-8') as f:
+            recorded = [json.loads(line) for line in f if line.strip()]
+
+    # Enough connoisseurs for as many new keys as seeded ones (a running
+    # server at --url only accepts its own)
+    raters = args.raters if args.url else raters_for(args.rows * 2, args.beers, args.raters)
+    domains = make_domains(args.beers, raters)
+    results = []
+    # A server at --url has its own BEER_WRITE_BEHIND setting
+    modes = ['off'] if args.url else args.write_behind
+    for workers, mode, clients in itertools.product(
+            [0] if args.url else args.workers, modes, args.clients):
+        write_behind = None
+        if mode == 'on':
+            write_behind = {'flush_interval': args.flush_seconds,
+                            'batch_size': args.flush_batch}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = None
+            proc = None
+            keys = KeySource(rating_keys(domains, args.seed)[args.rows:])
+            if args.url:
+                url = args.url
+            else:
+                path = os.path.join(tmp, 'ratings.db' if args.backend == 'sqlite'
+                                    else 'ratings.csv')
+                use_store(path, args.backend, domains)
+                calendar().save_data(make_ratings(args.rows, domains, seed=args.seed))
+                if args.target == 'wsgi':
+                    proc, url = start_server(path, args.backend, domains, workers,
+                                             write_behind)
+                else:
+                    use_store(path, args.backend, domains, write_behind)
+            try:
+                if args.target == 'testclient' and not args.url:
+                    factory = TestClientTransport
+                else:
+                    factory = lambda: HttpTransport(url)  # noqa: E731
+                before = stored_total(factory(), None)
+                result = run_level(factory, clients, args, domains, recorded, keys)
+            finally:
+                # Stopping the server (or closing the in-process store)
+                # commits what is still queued
+                if proc is not None:
+                    proc.terminate()
+                    proc.join()
+                elif path is not None:
+                    use_store(path, args.backend, domains)
+
+            checked = path is not None and not recorded
+            problems = []
+            if checked:
+                stored = stored_rows(path, args.backend, domains)
+                seeded = set(rating_keys(domains, args.seed)[:args.rows])
+                problems = check_lost_updates(result, before, len(stored), stored, seeded)
+            summary = summarize(result)
+            label = (args.url if args.url else 'in-process' if args.target == 'testclient'
+                     else f'{workers} worker process(es)')
+            if mode == 'on':
+                label += ', write-behind'
+            report(label, clients, summary, problems, checked)
+            results.append({'workers': workers, 'write_behind': mode == 'on',
+                            'clients': clients, 'elapsed_s': result['elapsed'],
+                            'acked_submits': result['acked'],
+                            'requests': summary, 'lost_updates': problems})
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'loadtest', 'target': args.url or args.target,
+                       'backend': args.backend, 'rows': args.rows, 'mix': args.mix,
+                       'flush_seconds': args.flush_seconds, 'flush_batch': args.flush_batch,
+                       'results': results}, f, indent=2)
+        print(f'Results written to {args.out}')
+    return 1 if any(r['lost_updates'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk import and streaming export of ratings.
+
+`import_ratings` reads a CSV or JSONL file in chunks of CHUNK_ROWS rows,
+checks every chunk against the calendar's allowed values in one
+vectorized pass per column (ratings.validate), keeps the last row per
+(Dato, Øl, Navn) key, drops ratings that are already stored with the
+same scores and stores the rest with one `upsert_many`: a single append
+and fsync (CSV log) or a single transaction (SQLite).
+
+`export_chunks` streams the current ratings as CSV (the columns of
+beer_ratings.csv, so an export can be imported again or used as the
+data file) or JSONL, one encoded chunk at a time from the store's
+`iter_ratings`, so a backup never builds the whole file in memory.
+
+HTTP (`blueprint`), for the default calendar and under /<calendar>/:
+    GET  /api/export.csv | /api/export.jsonl   download all ratings
+    POST /api/import                          upload a file ("file" form
+                                              field or the request body)
+Imports need BEER_IMPORT_TOKEN as a bearer token and are off without it.
+
+Command line (same calendars and storage settings as the app):
+    python bulk.py import ratings.csv [--calendar jul2025]
+    python bulk.py export backup.jsonl [--calendar jul2025]
+"""
+import argparse
+import hmac
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from ratings import CATEGORICAL, COLUMNS, KEY, SCORES, SMALL_INTS, invalid_counts, validate
+
+# Rows read, validated and encoded at a time
+CHUNK_ROWS = 10_000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def file_format(name, default='csv'):
+    """'csv' or 'jsonl' from a file name's extension (.json and .ndjson are JSONL)."""
+    ext = os.path.splitext(name or '')[1].lower().lstrip('.')
+    return 'jsonl' if ext in ('jsonl', 'ndjson', 'json') else ('csv' if ext == 'csv' else default)
+
+
+# ---------- Import ----------
+def read_chunks(source, fmt='csv', chunksize=CHUNK_ROWS):
+    """DataFrames of up to chunksize rows from a CSV or JSONL file or binary stream."""
+    if fmt == 'csv':
+        return pd.read_csv(source, chunksize=chunksize, dtype={c: str for c in CATEGORICAL})
+    if fmt == 'jsonl':
+        if not isinstance(source, str):
+            source = io.TextIOWrapper(source, encoding='utf-8')
+        return pd.read_json(source, lines=True, chunksize=chunksize, dtype=False)
+    raise ValueError(f'Unknown format {fmt!r}, expected one of {sorted(FORMATS)}')
+
+
+def valid_rows(df: pd.DataFrame, domains):
+    """(rows of df within the domains, as COLUMNS with int scores; invalid values per column)."""
+    missing = [c for c in COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Mangler kolonner: {', '.join(missing)}")
+    df = df[COLUMNS].assign(**{c: pd.to_numeric(df[c], errors='coerce') for c in SMALL_INTS})
+    # Non-integers (3.5) are not among the allowed values, so they fail here too
+    valid = validate(df, domains).to_numpy()
+    invalid = invalid_counts(df.loc[~valid], domains) if not valid.all() else {}
+    df = df.loc[valid].astype({c: 'int64' for c in SMALL_INTS})
+    return df, {c: n for c, n in invalid.items() if n}
+
+
+def unchanged(df: pd.DataFrame, current: pd.DataFrame):
+    """Boolean mask of the rows of df that are stored with exactly these scores."""
+    if current.empty or df.empty:
+        return np.zeros(len(df), dtype=bool)
+    current = current[COLUMNS].astype({c: object for c in CATEGORICAL})
+    merged = df[COLUMNS].astype({c: object for c in CATEGORICAL}).merge(
+        current, on=KEY, how='left', suffixes=('', '_stored'))
+    same = pd.Series(True, index=merged.index)
+    for c in SCORES:
+        same &= merged[c] == merged[f'{c}_stored']
+    return same.to_numpy()
+
+
+def import_ratings(store, source, domains, fmt='csv', chunksize=CHUNK_ROWS) -> dict:
+    """Validate, dedupe and store every rating in source with one group commit.
+
+    Returns counts: rows read, invalid rows (and invalid values per
+    column), duplicates (an earlier row with the same key in the file),
+    unchanged (already stored like this) and imported. Raises ValueError
+    if the file cannot be read or lacks columns; nothing is stored then.
+    """
+    parts, read, invalid, by_column = [], 0, 0, {}
+    try:
+        with read_chunks(source, fmt, chunksize) as reader:
+            for chunk in reader:
+                read += len(chunk)
+                rows, bad = valid_rows(chunk, domains)
+                invalid += len(chunk) - len(rows)
+                for c, n in bad.items():
+                    by_column[c] = by_column.get(c, 0) + n
+                parts.append(rows)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as exc:
+        raise ValueError(f'Kan ikke læse filen: {exc}') from exc
+
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+    # The last row per key wins, as it would with one submit per row
+    last = ~df.duplicated(KEY, keep='last').to_numpy()
+    duplicates = int((~last).sum())
+    df = df.loc[last]
+
+    flush = getattr(store, 'flush', None)  # queued writes first (writebehind.py)
+    if flush is not None:
+        flush()
+    same = unchanged(df, store.load_cached())
+    df = df.loc[~same]
+    if len(df):
+        store.upsert_many(df.to_dict('records'))
+    return {'read': read, 'invalid': invalid, 'invalid_by_column': by_column,
+            'duplicates': duplicates, 'unchanged': int(same.sum()), 'imported': len(df)}
+
+
+# ---------- Export ----------
+def export_chunks(store, fmt='csv', chunksize=CHUNK_ROWS):
+    """The current ratings as encoded bytes, chunksize rows at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {sorted(FORMATS)}')
+    header = fmt == 'csv'
+    for df in store.iter_ratings(chunksize):
+        if fmt == 'csv':
+            yield df.to_csv(index=False, header=header, lineterminator='\n').encode('utf-8')
+            header = False
+        else:
+            yield df.to_json(orient='records', lines=True, force_ascii=False).encode('utf-8')
+    if header:  # no ratings: still a valid CSV file
+        yield (','.join(COLUMNS) + '\n').encode('utf-8')
+
+
+# ---------- HTTP ----------
+def blueprint(calendar_for, token=None):
+    """Flask blueprint for the export and import of calendar_for(calendar slug or None).
+
+    calendar_for returns the open calendars.Calendar, or None if there is
+    no such calendar. Imports are only accepted with token as bearer token.
+    """
+    bp = Blueprint('bulk', __name__)
+
+    @bp.route('/api/export.<fmt>', defaults={'calendar': None})
+    @bp.route('/<calendar>/api/export.<fmt>')
+    def export(calendar, fmt):
+        cal = calendar_for(calendar)
+        if cal is None or fmt not in FORMATS:
+            return _error('Ukendt kalender eller format', 404)
+        # The request (and its hold on the calendar) lasts until the last chunk
+        response = Response(stream_with_context(export_chunks(cal.store, fmt)),
+                            content_type=FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="{cal.slug}.{fmt}"'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @bp.route('/api/import', methods=['POST'], defaults={'calendar': None})
+    @bp.route('/<calendar>/api/import', methods=['POST'])
+    def upload(calendar):
+        if not token:
+            return _error('Import er slået fra (BEER_IMPORT_TOKEN)', 403)
+        given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+            return _error('Forkert token', 401)
+        cal = calendar_for(calendar)
+        if cal is None:
+            return _error('Ukendt kalender', 404)
+        upload = request.files.get('file')
+        source = upload.stream if upload is not None else request.stream
+        name = upload.filename if upload is not None else ''
+        fmt = request.args.get('format') or file_format(
+            name, 'jsonl' if 'json' in (request.mimetype or '') else 'csv')
+        try:
+            with cal.timing.time('import'):
+                summary = import_ratings(cal.store, source, cal.domains, fmt)
+        except ValueError as exc:
+            return _error(str(exc), 400)
+        return jsonify(summary)
+
+    return bp
+
+
+def _error(message, status):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+
+# ---------- Command line ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import and export of ratings.')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('file', help="file to read or write ('-': stdin/stdout)")
+    parser.add_argument('--calendar', help='calendar name (default: the default calendar)')
+    parser.add_argument('--format', choices=sorted(FORMATS),
+                        help='default: from the file extension, else csv')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    import app  # the app's calendars and storage settings (BEER_* variables)
+
+    cal = app.CALENDARS.get(args.calendar)
+    if cal is None:
+        parser.error(f'unknown calendar {args.calendar!r}')
+    fmt = args.format or file_format(args.file)
+    try:
+        if args.command == 'import':
+            source = sys.stdin.buffer if args.file == '-' else args.file
+            try:
+                summary = import_ratings(cal.store, source, cal.domains, fmt, args.chunksize)
+            except (ValueError, OSError) as exc:
+                parser.exit(1, f'{exc}\n')
+            print(json.dumps(summary, ensure_ascii=False))
+        else:
+            out = sys.stdout.buffer if args.file == '-' else open(args.file, 'wb')
+            try:
+                for chunk in export_chunks(cal.store, fmt, args.chunksize):
+                    out.write(chunk)
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+    finally:
+        # Commits a write-behind queue before the process exits
+        app.CALENDARS.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Many beer calendars served by one process.
+
+A calendar is its choices (the days, the Øl, the connoisseurs and the
+score scales), a title and a description, and its own storage partition
+(one CSV log or SQLite database per calendar). Calendars are defined in
+a JSON file (see `load_calendars`) and served under /<slug>/.
+
+Every open `Calendar` has its own store, aggregate index, figure cache
+and leaderboard documents. `CalendarRegistry` opens a calendar on its
+first request and evicts the least recently used one once more than
+max_open are open, so a deployment can define hundreds of calendars and
+only keep the busy ones in memory. A request holds its calendar
+(`acquire` / `release`): an evicted calendar is only closed once the
+last request using it is done.
+
+Config file:
+    {
+      "default": "jul2025",                   # served on / (optional)
+      "defaults": {"Dato": 24, "Booster": [0, 2]},   # for every calendar
+      "calendars": {
+        "jul2025": {"title": "Øl Julekalender 2025!", "description": "...",
+                    "Øl": ["Øl1", "Øl2"], "Navn": ["Tejl", "Ems"],
+                    "file": "beer_ratings"}   # storage name (default: slug)
+      }
+    }
+"Dato" is a list of days or the number of days; every other column of
+ratings.COLUMNS is a list of allowed values.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from aggregates import METRICS, AggregateIndex
+from figures import FigureCache
+from instrumentation import Timing
+from leaderboards import LeaderboardAPI
+from ratings import COLUMNS
+from timeline import ol_timeline
+
+# slug: URL name; domains: {column: allowed values}; file: storage path
+# without extension (.csv / .db are added by the backend)
+CalendarConfig = namedtuple('CalendarConfig', 'slug title description domains file')
+
+SLUG = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+# First path segments that belong to the app itself
+RESERVED = {'api', 'assets', 'metrics'}
+
+
+def chart_key(ol, navn):
+    return f"{ol}\t{navn}"
+
+
+def load_calendars(path, data_dir=None, defaults=None):
+    """(slug -> CalendarConfig, default slug or None) from a JSON config file.
+
+    data_dir is where the storage files go (default: next to the config
+    file); defaults are choices used where neither the file's "defaults"
+    nor the calendar sets them.
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    data_dir = data_dir or os.path.dirname(os.path.abspath(path))
+    shared = dict(defaults or {}, **config.get('defaults', {}))
+
+    configs = {}
+    for slug, spec in config.get('calendars', {}).items():
+        if not SLUG.match(slug) or slug in RESERVED:
+            raise ValueError(f'Invalid calendar name {slug!r}')
+        spec = dict(shared, **spec)
+        domains = {}
+        for column in COLUMNS:
+            values = spec.get(column)
+            if isinstance(values, int) and column == 'Dato':
+                values = list(range(1, values + 1))
+            if not values:
+                raise ValueError(f'Calendar {slug!r} has no choices for {column}')
+            domains[column] = list(values)
+        configs[slug] = CalendarConfig(slug, spec.get('title', slug),
+                                       spec.get('description', ''), domains,
+                                       os.path.join(data_dir, spec.get('file', slug)))
+
+    default = config.get('default')
+    if default is not None and default not in configs:
+        raise ValueError(f'Default calendar {default!r} is not defined')
+    return configs, default
+
+
+class Calendar:
+    """One open calendar: its store, aggregate index, figure cache and leaderboards."""
+
+    def __init__(self, config, store, timing=None, figure_cache_size=32):
+        self.config = config
+        self.slug = config.slug
+        self.domains = config.domains
+        self.store = store
+        self.timing = timing or Timing()
+        # Running per-(Øl, Navn) sums that the charts read instead of the raw rows
+        self.agg = AggregateIndex()
+        # Recently drawn figures by (data version, graph id, selected Navn)
+        self.figure_cache = FigureCache(maxsize=figure_cache_size)
+        # JSON leaderboards, rebuilt on every write
+        self.leaderboards = LeaderboardAPI(self.leaderboard_data, navne=self.domains['Navn'],
+                                           timeline=self.timeline)
+
+    def load_data(self):
+        """All ratings (empty DataFrame if none); only re-read when they changed.
+
+        The returned frame is cached and shared, so do not modify it in place.
+        """
+        with self.timing.time('load_data'):
+            return self.store.load_cached()
+
+    def save_data(self, df):
+        """Atomically replace all ratings with df."""
+        with self.timing.time('save_data'):
+            self.store.replace(df)
+
+    def upsert_rating(self, row: dict):
+        """Add a rating, replacing this connoisseur's earlier one for the same beer and day.
+
+        Returns the (before, after) data versions, or None if it was only
+        queued (write-behind).
+        """
+        with self.timing.time('save_data'):
+            return self.store.upsert(row)
+
+    def data_version(self):
+        """Token that changes whenever the stored ratings change."""
+        return self.store.version()
+
+    def aggregate_frame(self):
+        """Per-(Øl, Navn) sums, caught up with ratings written since the last call."""
+        with self.timing.time('sync'):
+            self.agg.sync(self.store)
+        with self.timing.time('frame'):
+            return self.agg.frame()
+
+    def leaderboard_data(self):
+        """(data version, aggregate frame getter) for the leaderboard API."""
+        with self.timing.time('sync'):
+            self.agg.sync(self.store)
+        return self.agg.store_version, self.agg.frame
+
+    def timeline(self):
+        """Day-by-day standings (timeline.ol_timeline) from the index's per-day sums."""
+        with self.timing.time('sync'):
+            self.agg.sync(self.store)
+        with self.timing.time('timeline'):
+            return ol_timeline(self.agg.day_totals(), self.domains['Dato'])
+
+    def chart_data(self):
+        """Aggregates for the clientside charts: {columns, sums: {"Øl\tNavn": [...]}}."""
+        agg = self.aggregate_frame()
+        columns = METRICS + ['Count']
+        return {
+            'columns': columns,
+            'sums': {chart_key(ol, navn): values
+                     for ol, navn, *values in agg[['Øl', 'Navn'] + columns].itertuples(index=False)},
+        }
+
+    def close(self):
+        """Release the store (a write-behind store commits its queue first)."""
+        close = getattr(self.store, 'close', None)
+        if close is not None:
+            close()
+
+
+class CalendarRegistry:
+    """Calendars by slug, opened on first use; at most max_open stay open.
+
+    opener(config) -> Calendar opens one calendar's storage.
+    """
+
+    def __init__(self, configs, opener, default=None, max_open=16):
+        self.configs = dict(configs)
+        self.default = default
+        self.max_open = max(1, max_open)
+        self._opener = opener
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+        # Calendar -> number of requests holding it (acquire / release)
+        self._holders = {}
+        self._stats = {'opened': 0, 'evicted': 0}
+
+    def __contains__(self, slug):
+        return slug in self.configs
+
+    def get(self, slug=None):
+        """The open calendar for slug (None: the default), or None if unknown.
+
+        Without acquire, the calendar may be closed as soon as it is
+        evicted; requests use acquire and release instead.
+        """
+        return self._get(slug, hold=False)
+
+    def acquire(self, slug=None):
+        """Like get, but the calendar stays open until release(calendar)."""
+        return self._get(slug, hold=True)
+
+    def release(self, calendar):
+        """Drop one hold on calendar; closes it if it was evicted meanwhile."""
+        with self._lock:
+            holders = self._holders.get(calendar, 0) - 1
+            if holders > 0:
+                self._holders[calendar] = holders
+                return
+            self._holders.pop(calendar, None)
+            evicted = self._open.get(calendar.slug) is not calendar
+        if evicted:
+            calendar.close()
+
+    def _get(self, slug, hold):
+        slug = self.default if slug is None else slug
+        if slug not in self.configs:
+            return None
+        evicted = []
+        with self._lock:
+            calendar = self._open.get(slug)
+            if calendar is not None:
+                self._open.move_to_end(slug)
+            else:
+                calendar = self._open[slug] = self._opener(self.configs[slug])
+                self._stats['opened'] += 1
+                while len(self._open) > self.max_open:
+                    old = self._open.popitem(last=False)[1]
+                    self._stats['evicted'] += 1
+                    # Held ones are closed by the last release
+                    if old not in self._holders:
+                        evicted.append(old)
+            if hold:
+                self._holders[calendar] = self._holders.get(calendar, 0) + 1
+        # Outside the lock: closing may have to commit a write-behind queue
+        for old in evicted:
+            old.close()
+        return calendar
+
+    def open_calendars(self):
+        with self._lock:
+            return list(self._open.values())
+
+    def close(self):
+        """Close every open calendar, and evicted ones that are still held."""
+        with self._lock:
+            calendars = list(dict.fromkeys([*self._open.values(), *self._holders]))
+            self._open, self._holders = OrderedDict(), {}
+        for calendar in calendars:
+            calendar.close()
+
+    def stats(self):
+        """Counters for /metrics: calendars defined, open, opened and evicted."""
+        with self._lock:
+            return dict(self._stats, defined=len(self.configs), open=len(self._open))
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Figure builders for the beer rating charts.
+
+Leaderboards are built from the per-(Øl, Navn) aggregate frame from
+`aggregates.AggregateIndex.frame()`, the per-connoisseur chart from one
+connoisseur's breakdown (`AggregateIndex.breakdown`). `build_figures`
+computes the Øl ordering for every leaderboard in one groupby and returns
+all five figures, so the app can fill every chart from a single callback.
+
+`leaderboard_patch` is the cheap path for a single new rating: it appends
+one small bar segment on top of the existing stack and re-sends only the
+Øl order, instead of the whole figure.
+
+`stats_figure` draws the Bayesian averages and bootstrap intervals of
+stats.py, in one of STATS_MODES; `timeline_figure` the day-by-day
+standings of timeline.py.
+
+Figures are plain plotly JSON dicts built straight from the columns, in
+the same shape plotly.express would produce for these charts (one bar
+trace per colour, category-ordered x axis), without its validation and
+trace-building overhead. All figures share one prebuilt template:
+'simple_white', trimmed to the parts bar and line charts use, loaded on
+first use.
+
+`FigureCache` keeps recently built figures keyed by data version, graph
+id and selected Navn (or chart mode).
+"""
+import threading
+from collections import OrderedDict
+
+from dash import Patch
+
+from aggregates import COMPONENTS, navn_breakdown
+
+# Leaderboard charts: graph id -> (metric, title, axis labels)
+LEADERBOARDS = {
+    'samlede_rating': ('TotalScore', 'Den samlede vurdering',
+                       {'TotalScore': 'Samlet vurdering', 'Øl': 'Øl', 'Navn': 'Navn'}),
+    'smag_rating': ('Smag', 'Smags-vurdering',
+                    {'Smag': 'Smag', 'Øl': 'Øl'}),
+    'duft_rating': ('Duft', 'Duft-vurdering',
+                    {'Duft': 'Duft', 'Øl': 'Øl'}),
+    'helhedsoplevelse_rating': ('Helhedsoplevelse', 'Helhedsvurdering',
+                                {'Helhedsoplevelse': 'Helhedsoplevelse', 'Øl': 'Øl'}),
+}
+
+# Graph id of the per-connoisseur chart
+NAVN_DETAIL = 'navn_detail'
+
+# Statistics chart (see stats.py): graph id, and mode -> (normalize, title, axis label)
+STATS_CHART = 'stats_rating'
+STATS_MODES = {
+    'bayes': (False, 'Bayesiansk gennemsnit af den samlede vurdering',
+              'Gennemsnit (bayesiansk)'),
+    'normaliseret': (True, 'Gennemsnit normaliseret pr. connoisseur',
+                     'Normaliseret score (z)'),
+}
+
+# Day-by-day standings chart (see timeline.py)
+TIMELINE_CHART = 'timeline_rating'
+TIMELINE_TITLE = 'Stillingen dag for dag'
+
+# Output order of build_figures
+FIGURE_IDS = list(LEADERBOARDS) + [NAVN_DETAIL]
+
+# px.colors.qualitative.Pastel1 (also in assets/charts.js)
+PASTEL1 = [
+    'rgb(251,180,174)', 'rgb(179,205,227)', 'rgb(204,235,197)',
+    'rgb(222,203,228)', 'rgb(254,217,166)', 'rgb(255,255,204)',
+    'rgb(229,216,189)', 'rgb(253,218,236)', 'rgb(242,242,242)',
+]
+
+MARGIN = {'t': 60, 'l': 40, 'r': 20, 'b': 60}
+
+# Parts of the template for subplot types these charts never use
+_UNUSED_TEMPLATE_LAYOUT = ('polar', 'ternary', 'scene', 'geo', 'coloraxis', 'colorscale',
+                           'shapedefaults', 'annotationdefaults')
+_template = None
+
+
+def template():
+    """The shared 'simple_white' template (layout, bar and line defaults), built once.
+
+    plotly's template registry is imported here, on the first figure,
+    rather than when the app starts.
+    """
+    global _template
+    if _template is None:
+        import plotly.io as pio
+        full = pio.templates['simple_white'].to_plotly_json()
+        layout = {k: v for k, v in full['layout'].items()
+                  if k not in _UNUSED_TEMPLATE_LAYOUT}
+        _template = {'data': {t: full['data'][t] for t in ('bar', 'scatter')},
+                     'layout': layout}
+    return _template
+
+
+def bar_trace(x, y, name, color, hovertemplate, showlegend=True, **extra):
+    """One vertical bar trace, as px.bar makes it."""
+    return {
+        'hovertemplate': hovertemplate,
+        'legendgroup': name,
+        'marker': {'color': color, 'pattern': {'shape': ''}},
+        'name': name,
+        'orientation': 'v',
+        'showlegend': showlegend,
+        'textposition': 'auto',
+        'x': x,
+        'xaxis': 'x',
+        'y': y,
+        'yaxis': 'y',
+        'type': 'bar',
+        **extra,
+    }
+
+
+def bar_layout(title, x_title, y_title, ol_order, barmode='stack', legend_title=''):
+    """Layout of a bar chart with the Øl in ol_order on the x axis."""
+    legend = {'tracegroupgap': 0}
+    if legend_title is not None:
+        legend['title'] = {'text': legend_title}
+    return {
+        'template': template(),
+        'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_title},
+                  'categoryorder': 'array', 'categoryarray': list(ol_order)},
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_title}},
+        'legend': legend,
+        'margin': MARGIN,
+        'barmode': barmode,
+        'title': {'text': title},
+    }
+
+
+def empty_figure(title):
+    return {
+        'data': [],
+        'layout': {
+            'template': template(),
+            'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0]},
+            'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0]},
+            'legend': {'tracegroupgap': 0},
+            'margin': {'t': 60},
+            'barmode': 'relative',
+            'title': {'text': title},
+        },
+    }
+
+
+def navn_colors(agg):
+    """Bar colour per Navn, assigned in order of first appearance like px does."""
+    navne = dict.fromkeys(agg['Navn'].tolist())
+    return {navn: PASTEL1[i % len(PASTEL1)] for i, navn in enumerate(navne)}
+
+
+def ol_orders(agg):
+    """Øl order (highest total first) for every leaderboard metric, in one pass."""
+    metrics = [metric for metric, _, _ in LEADERBOARDS.values()]
+    totals = agg.groupby('Øl', as_index=False)[metrics].sum()
+    return {
+        metric: totals.sort_values(metric, ascending=False)['Øl'].tolist()
+        for metric in metrics
+    }
+
+
+def leaderboard_figure(agg, graph_id, ol_order=None):
+    """Stacked bar of one metric per Øl, stacked by Navn, best Øl first."""
+    metric, title, labels = LEADERBOARDS[graph_id]
+
+    if agg.empty:
+        return empty_figure(title)
+
+    if ol_order is None:
+        ol_order = ol_orders(agg)[metric]
+
+    # One trace per Navn (in order of first appearance), its Øl in frame order
+    bars = {}
+    for ol, navn, value in zip(agg['Øl'].tolist(), agg['Navn'].tolist(),
+                               agg[metric].tolist()):
+        x, y = bars.setdefault(navn, ([], []))
+        x.append(ol)
+        y.append(value)
+
+    navn_label = labels.get('Navn', 'Navn')
+    data = [bar_trace(x, y, navn, PASTEL1[i % len(PASTEL1)],
+                      f"{navn_label}={navn}<br>{labels['Øl']}=%{{x}}<br>"
+                      f"{labels[metric]}=%{{y}}<extra></extra>")
+            for i, (navn, (x, y)) in enumerate(bars.items())]
+    return {'data': data, 'layout': bar_layout(title, labels['Øl'], labels[metric], ol_order)}
+
+
+def navn_detail_figure(breakdown, selected_navn, has_data=True):
+    """Score components per Øl for one connoisseur, stacked by component.
+
+    breakdown is the connoisseur's aggregates.navn_breakdown (or
+    AggregateIndex.breakdown); has_data tells whether anyone rated yet.
+    """
+    # No name selected -> empty-ish figure
+    if selected_navn is None:
+        return empty_figure('Vælg en øl connoisseur')
+
+    if breakdown.empty:
+        return empty_figure(f'Ingen data for connoisseur {selected_navn}' if has_data
+                            else 'Vælg en øl connoisseur')
+
+    # Already best first; ties keep Øl order (as in assets/charts.js and
+    # the leaderboard API)
+    ol_order = breakdown['Øl'].tolist()
+
+    # One trace per score component, stacked
+    data = [bar_trace(ol_order, breakdown[c].tolist(), c, PASTEL1[i % len(PASTEL1)],
+                      f'Bidrag={c}<br>Øl=%{{x}}<br>Vurdering=%{{y}}<extra></extra>')
+            for i, c in enumerate(COMPONENTS)]
+    return {'data': data,
+            'layout': bar_layout(f'Vurderinger fra øl connoisseur {selected_navn}',
+                                 'Øl', 'Vurdering', ol_order)}
+
+
+def stats_figure(stats, mode):
+    """Bayesian average per Øl with its bootstrap interval, best Øl first.
+
+    stats is a stats.ol_statistics frame, computed for the mode.
+    """
+    _, title, label = STATS_MODES[mode]
+    if stats.empty:
+        return empty_figure(title)
+
+    ol_order = stats['Øl'].tolist()
+    bayes = stats['Bayes'].to_numpy()
+    plus = (stats['High'].to_numpy() - bayes).tolist()
+    minus = (bayes - stats['Low'].to_numpy()).tolist()
+    rang = [f'{lo}-{hi}' if lo != hi else f'{lo}'
+            for lo, hi in zip(stats['RankLow'].tolist(), stats['RankHigh'].tolist())]
+    trace = bar_trace(
+        ol_order, bayes.tolist(), '', PASTEL1[0],
+        f'Øl=%{{x}}<br>{label}=%{{y}}<br>Antal=%{{customdata[0]}}<br>'
+        'Gennemsnit=%{customdata[1]:.2f}<br>Placering (95%)=%{customdata[2]}<extra></extra>',
+        showlegend=False,
+        customdata=[list(r) for r in zip(stats['Count'].tolist(), stats['Mean'].tolist(),
+                                         rang, plus, minus)],
+        error_y={'array': plus, 'arrayminus': minus},
+    )
+    return {'data': [trace],
+            'layout': bar_layout(title, 'Øl', label, ol_order, barmode='relative',
+                                 legend_title=None)}
+
+
+def timeline_figure(timeline):
+    """Cumulative TotalScore of every Øl after each day, one line per Øl.
+
+    timeline is a timeline.Timeline; the hover shows the Øl's rank that day.
+    """
+    if not timeline.ol:
+        return empty_figure(TIMELINE_TITLE)
+
+    data = [{
+        'customdata': timeline.rank[:, i].tolist(),
+        'hovertemplate': (f'Øl={ol}<br>Dato=%{{x}}<br>Samlet vurdering=%{{y}}<br>'
+                          'Placering=%{customdata}<extra></extra>'),
+        'legendgroup': ol,
+        'line': {'color': PASTEL1[i % len(PASTEL1)], 'width': 3},
+        'marker': {'symbol': 'circle'},
+        'mode': 'lines+markers',
+        'name': ol,
+        'showlegend': True,
+        'x': timeline.days,
+        'xaxis': 'x',
+        'y': timeline.cumulative[:, i].tolist(),
+        'yaxis': 'y',
+        'type': 'scatter',
+    } for i, ol in enumerate(timeline.ol)]
+    layout = {
+        'template': template(),
+        'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'Dato'},
+                  'dtick': 1},
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0],
+                  'title': {'text': 'Samlet vurdering (akkumuleret)'}},
+        'legend': {'title': {'text': ''}, 'tracegroupgap': 0},
+        'margin': MARGIN,
+        'title': {'text': TIMELINE_TITLE},
+    }
+    return {'data': data, 'layout': layout}
+
+
+def leaderboard_patch(agg, graph_id, row, ol_order=None):
+    """Patch that adds one new rating to a leaderboard built by leaderboard_figure.
+
+    agg must already include row. The rating is stacked on top of its Øl as
+    an extra segment in its Navn's colour and legend group, and the Øl order
+    is refreshed. Only valid if the rating's (Øl, Navn) pair already has a
+    bar in the figure; otherwise rebuild the figure.
+    """
+    metric, _, labels = LEADERBOARDS[graph_id]
+    if metric == 'TotalScore':
+        value = sum(row[c] for c in COMPONENTS)
+    else:
+        value = row[metric]
+    if ol_order is None:
+        ol_order = ol_orders(agg)[metric]
+
+    ol, navn = row['Øl'], row['Navn']
+    patch = Patch()
+    patch['data'].append({
+        'type': 'bar',
+        'x': [ol],
+        'y': [value],
+        'name': navn,
+        'legendgroup': navn,
+        'showlegend': False,
+        'marker': {'color': navn_colors(agg)[navn]},
+        'hovertemplate': (f"{labels.get('Navn', 'Navn')}={navn}<br>"
+                          f"{labels['Øl']}=%{{x}}<br>"
+                          f"{labels[metric]}=%{{y}}<extra></extra>"),
+    })
+    patch['layout']['xaxis']['categoryarray'] = ol_order
+    return patch
+
+
+def build_patches(agg, row):
+    """Leaderboard patches for one new rating, in LEADERBOARDS order."""
+    orders = ol_orders(agg)
+    return [leaderboard_patch(agg, graph_id, row, orders[LEADERBOARDS[graph_id][0]])
+            for graph_id in LEADERBOARDS]
+
+
+def build_figures(agg, selected_navn):
+    """All five figures, in FIGURE_IDS order, from one aggregate frame."""
+    orders = ol_orders(agg) if not agg.empty else {}
+    figs = [
+        leaderboard_figure(agg, graph_id, orders.get(LEADERBOARDS[graph_id][0]))
+        for graph_id in LEADERBOARDS
+    ]
+    figs.append(navn_detail_figure(navn_breakdown(agg, selected_navn), selected_navn,
+                                   has_data=not agg.empty))
+    return figs
+
+
+class FigureCache:
+    """Bounded LRU cache of figure dicts with hit/miss counters."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._figures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """Cached figure for key, or build() it and cache it.
+
+        key is (data version, graph id, variant): the selected Navn for the
+        detail chart, the mode for the stats chart, None for the others.
+        Cached figures are shared between requests: do not modify them.
+        """
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+
+        fig = build()
+        with self._lock:
+            self._figures[key] = fig
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+        return fig
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._figures), 'maxsize': self.maxsize}
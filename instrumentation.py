@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Timing instrumentation for the Dash callbacks.
+
+`Timing` keeps Prometheus-style histograms of
+- callback latency and request/response payload bytes, per callback
+  (measured around every /_dash-update-component request), and
+- time spent in named stages inside a request (`with TIMING.time('figure')`),
+  e.g. load_data, save_data, building the aggregate frame, building figures.
+
+`install` serves them as Prometheus text on /metrics and adds a
+Server-Timing header with the stage totals of each callback request, so
+the browser's network tab shows where the time went.
+
+When disabled, `time` returns a shared no-op context manager and nothing
+is installed on the server, so the instrumented code costs next to nothing.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from flask import Response, g, has_request_context, request
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CALLBACK_PATH = '/_dash-update-component'
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value."""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label value -> [count per bucket (+Inf last), sum, count]
+        self._series = {}
+
+    def observe(self, label_value, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def exposition(self):
+        """Lines in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for value, (counts, total, count) in items:
+            label = f'{self.label}="{_escape(value)}"'
+            running = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                running += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {running}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class _StageTimer:
+    """Context manager timing one stage into the histogram and Server-Timing."""
+
+    __slots__ = ('timing', 'stage', 'start')
+
+    def __init__(self, timing, stage):
+        self.timing = timing
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.timing.stages.observe(self.stage, elapsed)
+        if has_request_context():
+            totals = g.setdefault('stage_seconds', {})
+            totals[self.stage] = totals.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class Timing:
+    """Per-callback and per-stage timings, exposed on /metrics and in Server-Timing."""
+
+    def __init__(self, enabled=False, prefix='beer'):
+        self.enabled = enabled
+        self.callbacks = Histogram(f'{prefix}_callback_seconds',
+                                   'Time to answer a Dash callback request.',
+                                   'callback', SECONDS_BUCKETS)
+        self.stages = Histogram(f'{prefix}_stage_seconds',
+                                'Time spent in a stage of a callback (load_data, figure, ...).',
+                                'stage', SECONDS_BUCKETS)
+        self.request_bytes = Histogram(f'{prefix}_callback_request_bytes',
+                                       'Size of Dash callback request bodies.',
+                                       'callback', BYTES_BUCKETS)
+        self.response_bytes = Histogram(f'{prefix}_callback_response_bytes',
+                                        'Size of Dash callback response bodies.',
+                                        'callback', BYTES_BUCKETS)
+        # name -> (help, function returning {label value: number}, label)
+        self._gauges = {}
+        self._names = {}
+
+    def time(self, stage):
+        """Context manager timing stage; a no-op when disabled."""
+        if not self.enabled:
+            return _NOOP
+        return _StageTimer(self, stage)
+
+    def gauge(self, name, help_text, label, read):
+        """Report read() ({label value: number}) on /metrics as a gauge."""
+        self._gauges[name] = (help_text, read, label)
+
+    def install(self, dash_app):
+        """Time callback requests of dash_app and serve /metrics (if enabled)."""
+        if not self.enabled:
+            return
+        server = dash_app.server
+
+        @server.before_request
+        def _start():
+            if request.path.endswith(CALLBACK_PATH):
+                g.callback_start = time.perf_counter()
+
+        @server.after_request
+        def _finish(response):
+            start = g.get('callback_start')
+            if start is None:
+                return response
+            elapsed = time.perf_counter() - start
+            name = self._callback_name(dash_app, request.get_json(silent=True))
+            self.callbacks.observe(name, elapsed)
+            self.request_bytes.observe(name, request.content_length or 0)
+            if not response.direct_passthrough:
+                self.response_bytes.observe(name, response.calculate_content_length() or 0)
+            parts = [f'{stage};dur={seconds * 1e3:.2f}'
+                     for stage, seconds in g.get('stage_seconds', {}).items()]
+            parts.append(f'callback;desc="{name}";dur={elapsed * 1e3:.2f}')
+            response.headers['Server-Timing'] = ', '.join(parts)
+            return response
+
+        @server.route('/metrics')
+        def _metrics():
+            return Response(self.exposition(), mimetype='text/plain; version=0.0.4')
+
+    def exposition(self) -> str:
+        lines = []
+        for hist in (self.callbacks, self.stages, self.request_bytes, self.response_bytes):
+            lines += hist.exposition()
+        for name, (help_text, read, label) in self._gauges.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{label}="{_escape(k)}"}} {v}' for k, v in read().items()]
+        return '\n'.join(lines) + '\n'
+
+    def _callback_name(self, dash_app, body):
+        """Function name of the callback a request body is for."""
+        output = (body or {}).get('output', '')
+        name = self._names.get(output)
+        if name is None:
+            spec = dash_app.callback_map.get(output)
+            if spec is None:
+                return 'unknown'
+            name = self._names[output] = getattr(spec['callback'], '__name__', 'unknown')
+        return name
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only JSON leaderboards on the Flask server.
+
+Routes (all GET), for the default calendar and under /<calendar>/:
+    /api/leaderboard                  overall ranking (TotalScore)
+    /api/leaderboard/<category>       smag, duft or helhedsoplevelse
+    /api/leaderboard/navn/<navn>      one connoisseur's ranking, per component
+    /api/timeline                     cumulative score and rank after every day
+
+Rankings use the same ordering as the charts (figures.ol_orders and
+aggregates.navn_breakdown). Every document is built from the aggregate index
+when the data changes (the app calls `refresh` right after a write) and
+kept as JSON and gzip bytes with a content-hash ETag, so a request is a
+version check plus a dict lookup, and a poll with a matching
+If-None-Match is answered with an empty 304.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+from flask import Blueprint, Response, jsonify, request
+
+from aggregates import COMPONENTS, KEYS, METRICS
+from figures import LEADERBOARDS, TIMELINE_TITLE, ol_orders
+
+# URL name -> graph id in figures.LEADERBOARDS
+CATEGORIES = {
+    'samlet': 'samlede_rating',
+    'smag': 'smag_rating',
+    'duft': 'duft_rating',
+    'helhedsoplevelse': 'helhedsoplevelse_rating',
+}
+
+# One precomputed response body
+Encoded = namedtuple('Encoded', 'body gzipped etag')
+
+
+def _number(v):
+    v = float(v)
+    return int(v) if v.is_integer() else v
+
+
+def _records(agg):
+    """Aggregate frame as plain dicts (cheaper than pandas per Øl/Navn)."""
+    return agg[KEYS + METRICS].to_dict('records')
+
+
+def leaderboard_document(records, category, order):
+    """Ranking of every Øl by one metric (in the given order), with each Navn's share."""
+    metric, title, _ = LEADERBOARDS[CATEGORIES[category]]
+    by_ol = {}
+    for r in records:
+        by_ol.setdefault(r['Øl'], {})[r['Navn']] = _number(r[metric])
+    ranking = [{'rank': rank, 'Øl': ol, 'score': _number(sum(by_ol[ol].values())),
+                'by_navn': by_ol[ol]}
+               for rank, ol in enumerate(order, start=1)]
+    return {'leaderboard': category, 'metric': metric, 'title': title, 'ranking': ranking}
+
+
+def navn_document(records, navn):
+    """One connoisseur's Øl, best first, with the score per component."""
+    mine = [r for r in records if r['Navn'] == navn]
+    for r in mine:
+        r['total'] = sum(r[c] for c in COMPONENTS)
+    # Stable, like the sort in aggregates.navn_breakdown
+    mine.sort(key=lambda r: -r['total'])
+    ranking = [{'rank': rank, 'Øl': r['Øl'], 'total': _number(r['total']),
+                **{c: _number(r[c]) for c in COMPONENTS}}
+               for rank, r in enumerate(mine, start=1)]
+    return {'navn': navn, 'title': f'Vurderinger fra øl connoisseur {navn}',
+            'ranking': ranking}
+
+
+def timeline_document(timeline):
+    """Every Øl's daily and cumulative TotalScore and rank (a timeline.Timeline)."""
+    series = [{'Øl': ol,
+               'score': [_number(v) for v in timeline.score[:, i].tolist()],
+               'cumulative': [_number(v) for v in timeline.cumulative[:, i].tolist()],
+               'rank': timeline.rank[:, i].tolist()}
+              for i, ol in enumerate(timeline.ol)]
+    return {'timeline': 'samlet', 'metric': 'TotalScore', 'title': TIMELINE_TITLE,
+            'days': timeline.days, 'series': series}
+
+
+def encode(document) -> Encoded:
+    body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return Encoded(body, gzip.compress(body, mtime=0),
+                   hashlib.sha1(body).hexdigest()[:20])
+
+
+class LeaderboardAPI:
+    """Precomputed leaderboard documents of one calendar (served by `blueprint`).
+
+    current() returns (data version, aggregate frame getter) and is called
+    on every request, so writes from other processes are picked up too.
+    navne are the connoisseurs that always have a document, even before
+    their first rating. timeline() returns the timeline.Timeline of the
+    same data, for /api/timeline.
+    """
+
+    def __init__(self, current, navne=(), timeline=None):
+        self._current = current
+        self._timeline = timeline
+        self.navne = list(navne)
+        self._lock = threading.Lock()
+        self.version = None
+        self._documents = {}
+
+    def refresh(self, version, agg):
+        """Build every document for the data at version (agg: aggregate frame)."""
+        orders = ol_orders(agg) if not agg.empty else {}
+        records = _records(agg)
+        documents = {
+            ('leaderboard', category): encode(leaderboard_document(
+                records, category, orders.get(LEADERBOARDS[graph_id][0], [])))
+            for category, graph_id in CATEGORIES.items()
+        }
+        navne = self.navne + [n for n in dict.fromkeys(r['Navn'] for r in records)
+                              if n not in self.navne]
+        for navn in navne:
+            documents[('navn', str(navn))] = encode(navn_document(records, navn))
+        if self._timeline is not None:
+            documents[('timeline', 'samlet')] = encode(timeline_document(self._timeline()))
+        with self._lock:
+            self._documents = documents
+            self.version = version
+
+    def document(self, key):
+        """Encoded document for key, rebuilt first if the data changed."""
+        version, frame = self._current()
+        if version != self.version:
+            self.refresh(version, frame())
+        with self._lock:
+            return self._documents.get(key)
+
+
+def blueprint(api_for):
+    """Flask blueprint serving the leaderboards of api_for(calendar slug or None).
+
+    api_for returns the calendar's LeaderboardAPI, or None if there is no
+    such calendar.
+    """
+    bp = Blueprint('leaderboards', __name__)
+
+    def serve(calendar, key):
+        api = api_for(calendar)
+        return respond(api.document(key) if api is not None else None)
+
+    @bp.route('/api/leaderboard', defaults={'calendar': None})
+    @bp.route('/<calendar>/api/leaderboard')
+    def overall(calendar):
+        return serve(calendar, ('leaderboard', 'samlet'))
+
+    @bp.route('/api/leaderboard/<category>', defaults={'calendar': None})
+    @bp.route('/<calendar>/api/leaderboard/<category>')
+    def category(calendar, category):
+        return serve(calendar, ('leaderboard', category.lower()))
+
+    @bp.route('/api/leaderboard/navn/<navn>', defaults={'calendar': None})
+    @bp.route('/<calendar>/api/leaderboard/navn/<navn>')
+    def navn(calendar, navn):
+        return serve(calendar, ('navn', navn))
+
+    @bp.route('/api/timeline', defaults={'calendar': None})
+    @bp.route('/<calendar>/api/timeline')
+    def timeline(calendar):
+        return serve(calendar, ('timeline', 'samlet'))
+
+    return bp
+
+
+def respond(doc):
+    """Response for an encoded document: gzip if accepted, ETag, 304 if unchanged."""
+    if doc is None:
+        response = jsonify(error='Ukendt leaderboard')
+        response.status_code = 404
+        return response
+    gzipped = request.accept_encodings['gzip'] > 0
+    response = Response(doc.gzipped if gzipped else doc.body,
+                        mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Cache, but check back (cheaply, with If-None-Match) every time
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(doc.etag + ('-gz' if gzipped else ''))
+    return response.make_conditional(request)
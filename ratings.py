@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Typed representation and validation of ratings.
+
+`to_typed` turns a ratings DataFrame into its compact form: Øl and Navn
+as categoricals (codes instead of one Python string per row) and the
+score columns as int8. `validate` checks every column against its
+allowed values in one vectorized `isin` per column. `Rating` is a
+__slots__ row object for the places that handle one rating at a time.
+
+Domains are passed in as {column: allowed values}, e.g. the hard-coded
+choices in app.py.
+
+A rating is identified by its natural key (Dato, Øl, Navn): a newer row
+with the same key replaces the older one, and a row with the key but no
+scores (`tombstone`) deletes it. Stores may keep the older rows around
+(the CSV log does); `latest` reduces such a log to the current ratings.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Dato', 'Øl', 'Navn', 'Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+
+# Stored as category codes / as int8
+CATEGORICAL = ['Øl', 'Navn']
+SMALL_INTS = ['Dato', 'Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+
+# dtype= for pd.read_csv, so strings are parsed straight into categories
+READ_DTYPES = {c: 'category' for c in CATEGORICAL}
+
+# One rating per connoisseur, beer and day
+KEY = ['Dato', 'Øl', 'Navn']
+SCORES = ['Smag', 'Duft', 'Helhedsoplevelse', 'Booster']
+
+_INT8 = np.iinfo(np.int8)
+
+
+class Rating:
+    """One rating, without a per-instance __dict__."""
+
+    __slots__ = ('dato', 'ol', 'navn', 'smag', 'duft', 'helhedsoplevelse', 'booster')
+
+    def __init__(self, dato, ol, navn, smag, duft, helhedsoplevelse, booster):
+        self.dato = dato
+        self.ol = ol
+        self.navn = navn
+        self.smag = smag
+        self.duft = duft
+        self.helhedsoplevelse = helhedsoplevelse
+        self.booster = booster
+
+    @classmethod
+    def from_dict(cls, row: dict):
+        return cls(*(row.get(c) for c in COLUMNS))
+
+    def as_dict(self) -> dict:
+        return dict(zip(COLUMNS, (getattr(self, s) for s in self.__slots__)))
+
+    def invalid_fields(self, domains) -> list:
+        """Columns whose value is missing or not among the allowed values."""
+        return [c for c, v in self.as_dict().items()
+                if c in domains and (v is None or v not in domains[c])]
+
+    def __repr__(self):
+        return f"Rating({', '.join(f'{c}={v!r}' for c, v in self.as_dict().items())})"
+
+
+def rating_key(row: dict) -> tuple:
+    return tuple(row.get(c) for c in KEY)
+
+
+def frame_keys(df: pd.DataFrame) -> list:
+    """Key tuple of every row, as plain Python values."""
+    return list(zip(*(df[c].tolist() for c in KEY)))
+
+
+def tombstone(key) -> dict:
+    """Row that deletes the rating with this key."""
+    return {**dict(zip(KEY, key)), **{c: None for c in SCORES}}
+
+
+def is_tombstone(df: pd.DataFrame) -> np.ndarray:
+    """Boolean mask of deletion rows (no scores at all)."""
+    scores = [c for c in SCORES if c in df.columns]
+    if not scores:
+        return np.zeros(len(df), dtype=bool)
+    return df[scores].isna().all(axis=1).to_numpy()
+
+
+def latest(df: pd.DataFrame) -> pd.DataFrame:
+    """Current ratings of a log: the last row per key, deleted keys dropped."""
+    if df.empty:
+        return df
+    live = ~df.duplicated(KEY, keep='last').to_numpy() & ~is_tombstone(df)
+    if live.all():
+        return df
+    return restore_ints(df.loc[live].reset_index(drop=True))
+
+
+def restore_ints(df: pd.DataFrame) -> pd.DataFrame:
+    """Integer columns that only turned float because of deletion rows, as int again."""
+    for c in SMALL_INTS:
+        if c in df.columns and df[c].dtype.kind == 'f':
+            values = df[c].to_numpy()
+            if not np.isnan(values).any() and (values == np.round(values)).all():
+                df = df.assign(**{c: values.astype(np.int64)})
+    return df
+
+
+def to_typed(df: pd.DataFrame, domains=None) -> pd.DataFrame:
+    """Compact copy of df: categorical Øl/Navn, int8 score columns.
+
+    Categories are the allowed values followed by any other observed
+    values, so nothing is lost. Score columns with missing or out-of-range
+    values keep their original dtype.
+    """
+    domains = domains or {}
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in CATEGORICAL:
+            is_cat = isinstance(s.dtype, pd.CategoricalDtype)
+            # Parsing straight to 'category' (READ_DTYPES) is the fast path
+            observed = s.cat.categories if is_cat else pd.unique(s.dropna())
+            categories = list(domains.get(c, []))
+            known = set(categories)
+            categories += [v for v in observed if v not in known]
+            out[c] = (s.cat.set_categories(categories) if is_cat
+                      else pd.Categorical(s, categories=categories))
+        elif c in SMALL_INTS and _fits_int8(s):
+            out[c] = s.to_numpy().astype(np.int8)
+        else:
+            out[c] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def concat_typed(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Append typed frame b to typed frame a, keeping the compact dtypes."""
+    if a.empty:
+        return b
+    if b.empty:
+        return a
+    a, b = a.copy(), b.copy()
+    for c in CATEGORICAL:
+        if c in a.columns and isinstance(a[c].dtype, pd.CategoricalDtype):
+            new = (b[c].cat.categories if isinstance(b[c].dtype, pd.CategoricalDtype)
+                   else pd.unique(b[c].dropna()))
+            categories = a[c].cat.categories.union(pd.Index(new), sort=False)
+            a[c] = a[c].cat.set_categories(categories)
+            b[c] = pd.Categorical(b[c], categories=categories)
+    df = pd.concat([a, b], ignore_index=True)
+    for c in SMALL_INTS:
+        if c in df.columns and df[c].dtype != np.int8 and _fits_int8(df[c]):
+            df[c] = df[c].to_numpy().astype(np.int8)
+    return df
+
+
+def validate(df: pd.DataFrame, domains) -> pd.Series:
+    """Boolean mask of rows whose every column is within its domain."""
+    valid = pd.Series(True, index=df.index)
+    for c, allowed in domains.items():
+        if c in df.columns:
+            valid &= df[c].isin(list(allowed))
+    return valid
+
+
+def invalid_counts(df: pd.DataFrame, domains) -> dict:
+    """Number of out-of-domain (or missing) values per column."""
+    return {c: int((~df[c].isin(list(allowed))).sum())
+            for c, allowed in domains.items() if c in df.columns}
+
+
+def _fits_int8(s: pd.Series) -> bool:
+    if not (pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)):
+        return False
+    values = s.to_numpy()
+    if len(values) == 0:
+        return True
+    if np.isnan(values.astype(float)).any():
+        return False
+    return (bool((values == np.round(values)).all())
+            and values.min() >= _INT8.min and values.max() <= _INT8.max)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Binary columnar snapshots of the ratings log.
+
+Parsing the CSV log is the slow part of a cold start. A snapshot stores
+the typed frame (see ratings.to_typed) one column after another as raw
+arrays, so loading it is a few np.memmap calls instead of a text parse.
+
+File layout:
+    MAGIC
+    8 bytes little-endian header length
+    JSON header: rows, source, and per column name/dtype/offset
+                 (plus categories for categorical columns)
+    column data, each column aligned to ALIGN bytes
+
+`source` describes the part of the CSV log the snapshot was built from;
+the caller uses it to decide whether the snapshot is still valid and which
+tail of the log still has to be parsed.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"BEERSNAP1\n"
+ALIGN = 64
+
+# Keep the mapping open (zero-copy) where the file can still be replaced
+# while mapped; Windows cannot replace a mapped file, so read it instead.
+USE_MMAP = os.name != "nt"
+
+
+def write_snapshot(path, df: pd.DataFrame, source: dict):
+    """Atomically write df (typed) as a snapshot built from source."""
+    columns, blobs, offset = [], [], 0
+    for name in df.columns:
+        s = df[name]
+        meta = {"name": name}
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            values = s.cat.codes.to_numpy()
+            meta["categories"] = [str(c) for c in s.cat.categories]
+        else:
+            values = s.to_numpy()
+            if values.dtype == object:
+                raise TypeError(f"Column {name!r} must be numeric or categorical")
+        values = np.ascontiguousarray(values)
+        offset = -(-offset // ALIGN) * ALIGN
+        meta.update(dtype=values.dtype.str, offset=offset)
+        columns.append(meta)
+        blobs.append((offset, values.tobytes()))
+        offset += values.nbytes
+
+    header = json.dumps({"rows": len(df), "source": source,
+                         "columns": columns}).encode("utf-8")
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for col_offset, blob in blobs:
+            f.seek(start + col_offset)
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    """(typed DataFrame, source) from a snapshot, or None if missing/unreadable."""
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    rows = header["rows"]
+    data = {}
+    for meta in header["columns"]:
+        dtype = np.dtype(meta["dtype"])
+        if rows == 0:
+            values = np.empty(0, dtype=dtype)
+        elif USE_MMAP:
+            values = np.memmap(path, mode="r", dtype=dtype,
+                               offset=start + meta["offset"], shape=(rows,))
+        else:
+            values = np.fromfile(path, dtype=dtype, count=rows,
+                                 offset=start + meta["offset"])
+        if "categories" in meta:
+            data[meta["name"]] = pd.Categorical.from_codes(
+                values, categories=meta["categories"], validate=False)
+        else:
+            data[meta["name"]] = values
+    return pd.DataFrame(data, copy=False), header["source"]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Rating statistics beyond the raw sums, vectorized with NumPy.
+
+Summed scores favour beers that got more ratings and connoisseurs who
+score generously. Per Øl, `ol_statistics` computes
+- the mean TotalScore, optionally of rater-normalized scores (every
+  connoisseur's ratings as z-scores of their own mean and spread),
+- a Bayesian average: the mean shrunk towards the overall mean by
+  prior_weight pseudo-ratings, so two great ratings do not beat twenty
+  good ones,
+- bootstrap intervals for that average and for the beer's rank. Ratings
+  are resampled within each Øl (a stratified bootstrap), all draws at
+  once; an Øl with hundreds of ratings uses the normal limit of its
+  resampled sum instead, so the cost stays bounded as the data grows.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import COMPONENTS
+
+# Bootstrap resamples per chart
+DRAWS = 1000
+# Øl with up to this many ratings are resampled rating by rating; the
+# resampled sums of larger ones are drawn from their normal limit
+GROUP_RESAMPLE_MAX = 200
+# Values per chunk of index resampling, to bound memory
+CHUNK_VALUES = 4_000_000
+
+STATS_COLUMNS = ['Øl', 'Count', 'Mean', 'Bayes', 'Low', 'High', 'RankLow', 'RankHigh']
+
+
+def rating_scores(df: pd.DataFrame):
+    """(Øl labels, Øl code, Navn code, TotalScore) of every rating with an Øl and a Navn."""
+    df = df.loc[df['Øl'].notna() & df['Navn'].notna()]
+    ol = pd.Categorical(df['Øl']).remove_unused_categories()
+    navn = pd.Categorical(df['Navn']).remove_unused_categories()
+    scores = np.zeros(len(df))
+    for c in COMPONENTS:
+        scores += pd.to_numeric(df[c], errors='coerce').fillna(0).to_numpy(dtype=float)
+    return list(ol.categories), ol.codes.astype(np.intp), navn.codes.astype(np.intp), scores
+
+
+def zscores(values, groups, n_groups):
+    """values as z-scores within their group (0 where a group has no spread)."""
+    counts = np.maximum(np.bincount(groups, minlength=n_groups), 1)
+    mean = np.bincount(groups, values, n_groups) / counts
+    dev = values - mean[groups]
+    std = np.sqrt(np.bincount(groups, dev * dev, n_groups) / counts)
+    std = std[groups]
+    return np.divide(dev, std, out=np.zeros_like(dev), where=std > 0)
+
+
+def bayesian_average(sums, counts, prior_mean, prior_weight):
+    """Means shrunk towards prior_mean by prior_weight pseudo-ratings."""
+    return (sums + prior_weight * prior_mean) / (counts + prior_weight)
+
+
+def bootstrap_sums(values, groups, n_groups, draws, rng):
+    """Per-group sums of stratified bootstrap resamples: array (draws, n_groups).
+
+    Every resample draws, within each group, as many values as the group
+    has (with replacement). Groups of up to GROUP_RESAMPLE_MAX values are
+    resampled by index; for larger ones the resampled sum is drawn from
+    its normal limit (n * mean, n * variance), which the bootstrap
+    distribution matches closely at that size. Every group must have at
+    least one value.
+    """
+    counts = np.bincount(groups, minlength=n_groups)
+    mean = np.bincount(groups, values, n_groups) / counts
+    var = np.bincount(groups, (values - mean[groups]) ** 2, n_groups) / counts
+    sums = rng.normal(counts * mean, np.sqrt(counts * var), size=(draws, n_groups))
+
+    small = counts <= GROUP_RESAMPLE_MAX
+    if not small.any():
+        return sums
+    keep = small[groups]
+    order = np.argsort(groups[keep], kind='stable')
+    values, groups = values[keep][order], groups[keep][order]
+    # Offset of every small group's first value in the sorted values
+    kept = counts * small
+    starts = (np.cumsum(kept) - kept)[groups]
+    sizes = counts[groups]
+    step = max(1, CHUNK_VALUES // len(values))
+    for first in range(0, draws, step):
+        n = min(step, draws - first)
+        picks = starts + (rng.random((n, len(values))) * sizes).astype(np.intp)
+        # One bincount for the whole chunk: slot = draw * n_groups + group
+        slots = (np.arange(n)[:, None] * n_groups + groups).ravel()
+        chunk = np.bincount(slots, values[picks].ravel(), n * n_groups).reshape(n, n_groups)
+        sums[first:first + n, small] = chunk[:, small]
+    return sums
+
+
+def ol_statistics(df: pd.DataFrame, normalize=False, prior_weight=None, draws=DRAWS,
+                  level=0.95, seed=0) -> pd.DataFrame:
+    """Per rated Øl, best Bayesian average first (columns STATS_COLUMNS).
+
+    Count and Mean of the (normalized, if asked) TotalScore, Bayes the
+    Bayesian average, Low/High its bootstrap interval at level and
+    RankLow/RankHigh the interval of the Øl's rank (1 = best).
+    prior_weight defaults to the mean number of ratings per Øl; the seed
+    is fixed, so the same data always gives the same intervals.
+    """
+    labels, ol, navn, scores = rating_scores(df)
+    if not len(scores):
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    if normalize:
+        scores = zscores(scores, navn, navn.max() + 1)
+
+    n_ol = len(labels)
+    counts = np.bincount(ol, minlength=n_ol)
+    sums = np.bincount(ol, scores, n_ol)
+    prior_mean = scores.mean()
+    if prior_weight is None:
+        prior_weight = counts.mean()
+    bayes = bayesian_average(sums, counts, prior_mean, prior_weight)
+
+    rng = np.random.default_rng(seed)
+    boot = bayesian_average(bootstrap_sums(scores, ol, n_ol, draws, rng),
+                            counts, prior_mean, prior_weight)
+    tail = (1 - level) / 2 * 100
+    low, high = np.percentile(boot, [tail, 100 - tail], axis=0)
+    ranks = (-boot).argsort(axis=1).argsort(axis=1) + 1
+    rank_low = np.percentile(ranks, tail, axis=0, method='lower')
+    rank_high = np.percentile(ranks, 100 - tail, axis=0, method='higher')
+
+    result = pd.DataFrame({'Øl': labels, 'Count': counts, 'Mean': sums / counts,
+                           'Bayes': bayes, 'Low': low, 'High': high,
+                           'RankLow': rank_low, 'RankHigh': rank_high})
+    return result.sort_values('Bayes', ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,766 @@
+# -*- coding: utf-8 -*-
+"""
+Rating storage for the beer rating app.
+
+Two backends share the `RatingStore` interface and are picked by name
+through `open_store`:
+
+- "csv": an append-only CSV log. A submit appends a single line and
+  fsyncs it instead of rewriting the whole file. A crash in the middle of
+  an append can only leave a torn last line, which is cut off again the
+  next time the file is opened. `compact` rewrites the log as a clean
+  snapshot through a temp file and an atomic rename, and then gives the
+  log a new generation (a random token in `<path>.gen`). Appends and
+  compaction hold an advisory lock on the log, so several processes can
+  share it.
+- "sqlite": a SQLite database in WAL mode. Every insert is its own
+  transaction on the server side, so several worker processes and threads
+  can write at the same time without losing ratings.
+
+Ratings are keyed by (Dato, Øl, Navn) (see ratings.KEY): `upsert` adds or
+replaces the rating for a key, `delete` removes it and `lookup` finds it.
+The CSV log appends the new row (or a tombstone) and readers keep the
+last row per key; SQLite keeps one row per key under a unique index.
+Either way the new row is what changes_since() reports next, so
+incremental readers see every edit. `upsert_many` stores a batch with a
+single append and fsync, or a single transaction (see writebehind.py
+and bulk.py). `iter_ratings` reads the current ratings in chunks, for
+streaming exports.
+"""
+import csv
+import io
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from ratings import (KEY, READ_DTYPES, SCORES, concat_typed, frame_keys, is_tombstone,
+                     latest, rating_key, restore_ints, to_typed, tombstone)
+from snapshot import read_snapshot, write_snapshot
+from tablequery import parse_filter, parse_sort, query_frame
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock is used
+    fcntl = None
+
+# Raw byte I/O on Windows needs O_BINARY, elsewhere it is a no-op
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+# Rewrite the CSV store's snapshot once a cold read has to parse more than
+# this many rows of log after it
+SNAPSHOT_MAX_TAIL = 1000
+
+
+@contextmanager
+def _file_lock(fd):
+    """Hold an exclusive advisory lock on fd (no-op where fcntl is missing)."""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _write_all(fd, data):
+    """os.write until all of data is written (it may write less in one call)."""
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view)
+        if n <= 0:
+            raise OSError(f"short write: {len(view)} bytes left")
+        view = view[n:]
+
+
+def _read_at(fd, n, offset):
+    """Read n bytes at offset (os.pread is not available on Windows)."""
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, n)
+
+
+def _fsync_dir(path):
+    """Make a rename in the directory of path durable (POSIX only)."""
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# DataTable filter operators as SQL (values are bound, column names are
+# checked against the known columns by parse_filter)
+_SQL_FILTERS = {
+    'eq': '{col} = ?',
+    'ne': '{col} != ?',
+    'lt': '{col} < ?',
+    'le': '{col} <= ?',
+    'gt': '{col} > ?',
+    'ge': '{col} >= ?',
+    'contains': 'instr(CAST({col} AS TEXT), CAST(? AS TEXT)) > 0',
+    'datestartswith': 'substr(CAST({col} AS TEXT), 1, length(CAST(? AS TEXT))) = CAST(? AS TEXT)',
+}
+
+
+def _sql_value(v):
+    """Convert NaN to NULL and numpy scalars to the Python types sqlite3 binds."""
+    if v is None or pd.isna(v):
+        return None
+    return v.item() if hasattr(v, "item") else v
+
+
+class RatingStore:
+    """Interface shared by the storage backends."""
+
+    def __init__(self, columns, domains=None):
+        self.columns = list(columns)
+        # Allowed values per column; load_cached() keeps a typed frame
+        self.domains = domains
+        # load_cached(): every row read so far (typed), which of them are
+        # current, and the cursor this reflects
+        self._cache_lock = threading.Lock()
+        self._cache_cursor = None
+        self._log = pd.DataFrame(columns=self.columns)
+        self._alive = np.zeros(0, dtype=bool)
+        # Hash index: key -> position of its current row in _log (built on demand)
+        self._positions = None
+        self._cache_frame = pd.DataFrame(columns=self.columns)
+
+    def load(self) -> pd.DataFrame:
+        """Return all current ratings as a DataFrame with the store's columns."""
+        raise NotImplementedError
+
+    def upsert(self, row: dict):
+        """Durably add one rating, replacing any rating with the same key.
+
+        Returns the (before, after) version tokens of this write, taken
+        atomically with it, so callers can tell whether anything else was
+        written in between.
+        """
+        raise NotImplementedError
+
+    def upsert_many(self, rows):
+        """Upsert rows, in order, as one group commit: one write and one sync.
+
+        Returns the (before, after) versions like upsert, or None for no rows.
+        """
+        raise NotImplementedError
+
+    def delete(self, dato, ol, navn):
+        """Remove the rating with this key; (before, after) versions, or None if absent."""
+        raise NotImplementedError
+
+    def lookup(self, dato, ol, navn):
+        """The current rating with this key as a dict, or None."""
+        with self._cache_lock:
+            self._sync_cache()
+            pos = self._key_positions().get((dato, ol, navn))
+            if pos is None:
+                return None
+            return {c: _plain(v) for c, v in self._log.iloc[pos].items()}
+
+    def replace(self, df: pd.DataFrame):
+        """Atomically replace all ratings with df."""
+        raise NotImplementedError
+
+    def changes_since(self, cursor):
+        """Return (new_rows, cursor, reset) for rows written after cursor.
+
+        Pass cursor=None to read everything. reset is True when the store
+        was rewritten since cursor was taken (or cursor was None); new_rows
+        then holds all ratings instead of only the new ones.
+        """
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """Opaque token that changes whenever the stored ratings change."""
+        raise NotImplementedError
+
+    def version_of(self, cursor) -> str:
+        """The version() token of the data a changes_since cursor has seen."""
+        raise NotImplementedError
+
+    def load_cached(self) -> pd.DataFrame:
+        """Like load(), but only reads what was written since the last call.
+
+        Unchanged data costs a version check; new rows are read and added
+        to the cached log, marking the rows they replace through the key
+        index; a rewrite of the store is read in full. The frame uses the
+        compact dtypes of ratings.to_typed and is shared between callers,
+        so treat it as read-only.
+        """
+        with self._cache_lock:
+            self._sync_cache()
+            return self._cache_frame
+
+    def _sync_cache(self):
+        df, cursor, reset = self.changes_since(self._cache_cursor)
+        self._cache_cursor = cursor
+        if not reset and df.empty:
+            return
+        df = to_typed(df, self.domains)
+        if reset:
+            self._log = df.reset_index(drop=True)
+            self._alive = ~self._log.duplicated(KEY, keep='last').to_numpy()
+            self._alive &= ~is_tombstone(self._log)
+            self._positions = None
+        else:
+            positions = self._key_positions()
+            start = len(self._log)
+            self._log = concat_typed(self._log, df)
+            alive = np.ones(len(df), dtype=bool)
+            deleted = is_tombstone(df)
+            self._alive = np.concatenate([self._alive, alive])
+            for i, key in enumerate(frame_keys(df), start):
+                old = positions.pop(key, None)
+                if old is not None:
+                    self._alive[old] = False
+                if deleted[i - start]:
+                    self._alive[i] = False
+                else:
+                    positions[key] = i
+        live = self._log if self._alive.all() else self._log.loc[self._alive]
+        self._cache_frame = to_typed(restore_ints(live.reset_index(drop=True)), self.domains)
+
+    def _key_positions(self) -> dict:
+        if self._positions is None:
+            rows = np.flatnonzero(self._alive)
+            self._positions = dict(zip(frame_keys(self._log.iloc[rows]), rows.tolist()))
+        return self._positions
+
+    def query(self, page_current, page_size, sort_by=None, filter_query=None):
+        """One page of ratings for the DataTable: (rows, number of matches)."""
+        return query_frame(self.load_cached(), page_current, page_size,
+                           sort_by, filter_query)
+
+    def iter_ratings(self, chunksize):
+        """The current ratings as DataFrames of up to chunksize rows.
+
+        Slices of the cached frame: nothing is copied beyond one chunk.
+        """
+        df = self.load_cached()
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def _plain(v):
+    """numpy scalar -> Python value, NaN -> None.
+
+    Whole floats become ints: score columns of a log with tombstones are float.
+    """
+    v = v.item() if hasattr(v, "item") else v
+    if isinstance(v, float):
+        if np.isnan(v):
+            return None
+        if v.is_integer():
+            return int(v)
+    return v
+
+
+class CsvLogStore(RatingStore):
+    """Append-only CSV log of ratings (the last row per key counts)."""
+
+    def __init__(self, path, columns, domains=None, snapshot=False):
+        super().__init__(columns, domains)
+        self.path = path
+        # Binary snapshot next to the log for fast full reads (typed stores only)
+        self.snapshot_path = f"{path}.snap" if snapshot and domains is not None else None
+        # Changed by every rewrite: the file system may give the new log
+        # the inode number of an earlier one
+        self.generation_path = f"{path}.gen"
+        self._lock = threading.Lock()
+        self._recover()
+
+    # ---------- Reading ----------
+    def load(self) -> pd.DataFrame:
+        """Load all ratings, or an empty DataFrame if the log does not exist."""
+        if self.snapshot_path:
+            return to_typed(latest(self.changes_since(None)[0]), self.domains)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return pd.DataFrame(columns=self.columns)
+        return latest(self._with_columns(self._read_csv(self.path)))
+
+    def changes_since(self, cursor):
+        # cursor = (generation, inode, byte offset); compaction replaces the
+        # inode and the generation
+        try:
+            fd = os.open(self.path, os.O_RDONLY | _O_BINARY)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=self.columns), (None, None, 0), cursor is not None
+        try:
+            st = os.fstat(fd)
+            # Read after opening the log: a rewrite since then changes the
+            # generation again (compact writes it after the rename)
+            gen = self._generation()
+            reset = cursor is None or cursor[:2] != (gen, st.st_ino) or cursor[2] > st.st_size
+            start = 0 if reset else cursor[2]
+            base = None
+            if reset and self.snapshot_path:
+                # Start from the snapshot and only parse the log after it
+                base, start = self._read_snapshot(fd, st, gen)
+            chunk = _read_at(fd, st.st_size - start, start)
+            # Leave a line that is still being appended for the next call
+            chunk = chunk[:chunk.rfind(b"\n") + 1]
+            end = start + len(chunk)
+            if start > 0:
+                chunk = self._encode_header() + chunk
+            if chunk.count(b"\n") <= 1:
+                df = pd.DataFrame(columns=self.columns)
+            else:
+                df = self._with_columns(self._read_csv(io.BytesIO(chunk)))
+            if reset and self.snapshot_path:
+                tail = len(df)
+                df = to_typed(df, self.domains)
+                if base is not None:
+                    df = concat_typed(base, df)
+                if tail > SNAPSHOT_MAX_TAIL or (base is None and len(df)):
+                    self._write_snapshot(fd, df, gen, st.st_ino, end)
+        finally:
+            os.close(fd)
+        return df, (gen, st.st_ino, end), reset
+
+    def version(self) -> str:
+        # Appends grow the file, compaction replaces the inode and generation
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return "0:0"
+        return self._token(self._generation(), st.st_ino, st.st_size)
+
+    def version_of(self, cursor) -> str:
+        return self._token(*(cursor or (None, None, 0)))
+
+    @staticmethod
+    def _token(gen, ino, size) -> str:
+        return f"{gen}:{ino}:{size}" if size else "0:0"
+
+    # ---------- Writing ----------
+    def upsert(self, row: dict):
+        """Append one rating as a single fsynced line; it replaces older ones with its key."""
+        return self._append([row])
+
+    def upsert_many(self, rows):
+        """Append all rows with one write and one fsync."""
+        return self._append(rows) if rows else None
+
+    def delete(self, dato, ol, navn):
+        """Append a tombstone for the key, if it has a rating."""
+        if self.lookup(dato, ol, navn) is None:
+            return None
+        return self._append([tombstone((dato, ol, navn))])
+
+    def _append(self, rows):
+        line = b"".join(self._encode(row) for row in rows)
+        with self._lock, self._locked_log() as fd:
+            self._repair_tail(fd)
+            st = os.fstat(fd)
+            if st.st_size == 0:
+                line = self._encode_header() + line
+            try:
+                _write_all(fd, line)
+                os.fsync(fd)
+            except BaseException:
+                # Nothing of a failed write may be read as stored
+                os.ftruncate(fd, st.st_size)
+                raise
+            gen = self._generation()
+        return (self._token(gen, st.st_ino, st.st_size),
+                self._token(gen, st.st_ino, st.st_size + len(line)))
+
+    def compact(self, df: pd.DataFrame = None):
+        """Atomically rewrite the log as a snapshot of df (default: current data).
+
+        Holds the log's file lock throughout, so an append from another
+        process waits and then goes to the new log instead of getting lost.
+        """
+        with self._lock, self._locked_log():
+            # Superseded rows and tombstones are dropped here
+            df = self.load() if df is None else latest(df)
+            df = df.reindex(columns=self.columns)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                df.to_csv(f, index=False, lineterminator="\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            # After the rename, so a cursor never pairs the new generation
+            # with the old file once it is gone
+            self._write_generation(os.urandom(8).hex())
+            _fsync_dir(self.path)
+
+    def replace(self, df: pd.DataFrame):
+        self.compact(df)
+
+    # ---------- Internals ----------
+    @contextmanager
+    def _locked_log(self):
+        """The log, opened for appending (created if missing) and file-locked.
+
+        A compaction in another process may replace the log while we wait
+        for the lock; then the lock is on the old file, so try again.
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT | _O_BINARY,
+                         0o644)
+            try:
+                with _file_lock(fd):
+                    try:
+                        current = os.stat(self.path).st_ino == os.fstat(fd).st_ino
+                    except FileNotFoundError:
+                        current = False
+                    if current:
+                        yield fd
+                        return
+            finally:
+                os.close(fd)
+
+    def _read_csv(self, source) -> pd.DataFrame:
+        # With domains, Øl/Navn are parsed straight into categories
+        if self.domains is None:
+            return pd.read_csv(source)
+        return pd.read_csv(source, dtype=READ_DTYPES)
+
+    def _generation(self) -> str:
+        """The log's generation token; "0" for a log that was never rewritten."""
+        try:
+            with open(self.generation_path, encoding="ascii") as f:
+                return f.read().strip() or "0"
+        except FileNotFoundError:
+            return "0"
+
+    def _write_generation(self, gen):
+        tmp = f"{self.generation_path}.tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(gen)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.generation_path)
+
+    def _fingerprint(self, fd, offset) -> dict:
+        """First and last bytes of the log up to offset, to spot rewrites."""
+        return {"head": _read_at(fd, min(offset, 64), 0).hex(),
+                "tail": _read_at(fd, min(offset, 64), max(0, offset - 64)).hex()}
+
+    def _read_snapshot(self, fd, st, gen):
+        """(typed frame, log offset it covers), or (None, 0) if stale or missing."""
+        snap = read_snapshot(self.snapshot_path)
+        if snap is None:
+            return None, 0
+        df, source = snap
+        offset = source.get("offset", 0)
+        if (source.get("generation") != gen or source.get("ino") != st.st_ino
+                or offset > st.st_size
+                or source.get("fingerprint") != self._fingerprint(fd, offset)
+                or list(df.columns) != self.columns):
+            return None, 0
+        return df, offset
+
+    def _write_snapshot(self, fd, df, gen, ino, offset):
+        source = {"generation": gen, "ino": ino, "offset": offset,
+                  "fingerprint": self._fingerprint(fd, offset)}
+        try:
+            write_snapshot(self.snapshot_path, df, source)
+        except (OSError, TypeError):
+            # Only a cache: a column that cannot be stored or a full disk
+            # just means the next cold start parses the CSV again
+            pass
+
+    def _with_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Make sure all expected columns exist, in the expected order."""
+        for c in self.columns:
+            if c not in df.columns:
+                df[c] = None
+        return df[self.columns]
+
+    def _encode_header(self) -> bytes:
+        return self._encode_fields(self.columns)
+
+    def _encode(self, row: dict) -> bytes:
+        return self._encode_fields([row.get(c) for c in self.columns])
+
+    @staticmethod
+    def _encode_fields(fields) -> bytes:
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(
+            ["" if v is None else v for v in fields])
+        return buf.getvalue().encode("utf-8")
+
+    def _recover(self):
+        """Cut off a torn last line and bring an old-style file up to date."""
+        if not os.path.exists(self.path):
+            return
+        with self._locked_log() as fd:
+            self._repair_tail(fd)
+        if os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, encoding="utf-8", newline="") as f:
+            header = next(csv.reader(f), [])
+        if header != self.columns:
+            # Appends are written in COLUMNS order, so rewrite the header first
+            self.compact()
+
+    @staticmethod
+    def _repair_tail(fd):
+        """Truncate fd back to its last complete line."""
+        size = os.fstat(fd).st_size
+        if size == 0 or _read_at(fd, 1, size - 1) == b"\n":
+            return
+        # Walk back to the last newline; everything after it is a torn append
+        pos = size
+        while pos > 0:
+            start = max(0, pos - 4096)
+            chunk = _read_at(fd, pos - start, start)
+            idx = chunk.rfind(b"\n")
+            if idx != -1:
+                os.ftruncate(fd, start + idx + 1)
+                os.fsync(fd)
+                return
+            pos = start
+        os.ftruncate(fd, 0)
+        os.fsync(fd)
+
+
+class SqliteStore(RatingStore):
+    """Ratings in a SQLite database (WAL mode), one row per key.
+
+    An upsert or delete removes the key's row and inserts a new one (a
+    tombstone without scores for a delete), so the change gets a new id
+    and shows up in changes_since(); tombstones are hidden from readers.
+    """
+
+    def __init__(self, path, columns, seed_csv=None, domains=None):
+        super().__init__(columns, domains)
+        self.path = path
+        self._local = threading.local()
+        self._cols_sql = ", ".join(f'"{c}"' for c in self.columns)
+        self._insert_sql = (f"INSERT INTO ratings ({self._cols_sql}) "
+                            f"VALUES ({', '.join('?' for _ in self.columns)})")
+        self._key_sql = " AND ".join(f'"{c}" = ?' for c in KEY)
+        # Rows that are ratings, not tombstones
+        score_cols = ", ".join(f'"{c}"' for c in SCORES)
+        self._live_sql = f"COALESCE({score_cols}) IS NOT NULL"
+        conn = self._conn()
+        conn.execute(f"CREATE TABLE IF NOT EXISTS ratings "
+                     f"(id INTEGER PRIMARY KEY AUTOINCREMENT, {self._cols_sql})")
+        # Bumped by replace() so readers of changes_since() know to start over
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO meta VALUES ('generation', 0)")
+        self._create_key_index()
+        if seed_csv and os.path.exists(seed_csv):
+            self._seed(seed_csv)
+
+    # ---------- Reading ----------
+    def load(self) -> pd.DataFrame:
+        return pd.read_sql_query(
+            f"SELECT {self._cols_sql} FROM ratings WHERE {self._live_sql} ORDER BY id",
+            self._conn())
+
+    def lookup(self, dato, ol, navn):
+        cur = self._conn().execute(
+            f"SELECT {self._cols_sql} FROM ratings WHERE {self._key_sql} AND {self._live_sql}",
+            [_sql_value(v) for v in (dato, ol, navn)])
+        row = cur.fetchone()
+        return dict(zip(self.columns, row)) if row else None
+
+    def changes_since(self, cursor):
+        # cursor = (generation, last id seen); one read transaction for both
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            generation = conn.execute(
+                "SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+            reset = cursor is None or cursor[0] != generation
+            last_id = 0 if reset else cursor[1]
+            df = pd.read_sql_query(
+                f"SELECT id, {self._cols_sql} FROM ratings WHERE id > ? ORDER BY id",
+                conn, params=(last_id,))
+        finally:
+            conn.execute("COMMIT")
+        if len(df):
+            last_id = int(df['id'].iloc[-1])
+        return df[self.columns], (generation, last_id), reset
+
+    def version(self) -> str:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            return self._version(conn)
+        finally:
+            conn.execute("COMMIT")
+
+    def version_of(self, cursor) -> str:
+        generation, last_id = cursor or (0, 0)
+        return f"{generation}:{last_id}"
+
+    def query(self, page_current, page_size, sort_by=None, filter_query=None):
+        # Filter, sort and page in SQL so only the visible page is read
+        where, params = [self._live_sql], []
+        for col, op, value in parse_filter(filter_query, self.columns):
+            where.append(_SQL_FILTERS[op].format(col=f'"{col}"'))
+            params.extend([value] * _SQL_FILTERS[op].count("?"))
+            if op in ('lt', 'le', 'gt', 'ge'):
+                # Like pandas: numbers and text are never ordered against each other
+                types = "'text'" if isinstance(value, str) else "'integer', 'real'"
+                where.append(f'typeof("{col}") IN ({types})')
+        where_sql = f" WHERE {' AND '.join(where)}"
+        order = [f'"{col}" {"ASC" if asc else "DESC"}'
+                 for col, asc in parse_sort(sort_by, self.columns)]
+        order_sql = f" ORDER BY {', '.join(order + ['id'])}"
+
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM ratings{where_sql}", params).fetchone()[0]
+            page = pd.read_sql_query(
+                f"SELECT {self._cols_sql} FROM ratings{where_sql}{order_sql} "
+                f"LIMIT ? OFFSET ?", conn,
+                params=params + [page_size, (page_current or 0) * page_size])
+        finally:
+            conn.execute("COMMIT")
+        return page.to_dict("records"), total
+
+    def iter_ratings(self, chunksize):
+        """The current ratings in chunks, from one read transaction on its own connection.
+
+        Only one chunk is in memory at a time, and writers are not blocked (WAL).
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cur = conn.execute(
+                f"SELECT {self._cols_sql} FROM ratings WHERE {self._live_sql} ORDER BY id")
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=self.columns)
+        finally:
+            conn.close()
+
+    # ---------- Writing ----------
+    def upsert(self, row: dict):
+        return self._write([row])
+
+    def upsert_many(self, rows):
+        """Replace the rows for all keys in one transaction."""
+        return self._write(rows) if rows else None
+
+    def delete(self, dato, ol, navn):
+        return self._write([tombstone((dato, ol, navn))], only_existing=True)
+
+    def _write(self, rows, only_existing=False):
+        """Replace the row for each row's key in one transaction; (before, after) versions."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if only_existing and conn.execute(
+                    f"SELECT 1 FROM ratings WHERE {self._key_sql} AND {self._live_sql}",
+                    [_sql_value(v) for v in rating_key(rows[0])]).fetchone() is None:
+                conn.execute("ROLLBACK")
+                return None
+            before = self._version(conn)
+            for row in rows:
+                conn.execute(f"DELETE FROM ratings WHERE {self._key_sql}",
+                             [_sql_value(v) for v in rating_key(row)])
+                row_id = conn.execute(self._insert_sql, self._values(row)).lastrowid
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return before, f"{before.split(':')[0]}:{row_id}"
+
+    def replace(self, df: pd.DataFrame):
+        rows = latest(df.reindex(columns=self.columns)).to_dict("records")
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM ratings")
+            conn.executemany(self._insert_sql, [self._values(r) for r in rows])
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def compact(self):
+        """Fold the write-ahead log back into the database file."""
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # ---------- Internals ----------
+    @staticmethod
+    def _version(conn) -> str:
+        generation = conn.execute(
+            "SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+        last_id = conn.execute("SELECT MAX(id) FROM ratings").fetchone()[0] or 0
+        return f"{generation}:{last_id}"
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not thread-safe."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _values(self, row: dict):
+        return [_sql_value(row.get(c)) for c in self.columns]
+
+    def _create_key_index(self):
+        """Unique index on the key; older duplicate rows are dropped first."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' "
+                            "AND name = 'ratings_key'").fetchone() is None:
+                key_cols = ", ".join(f'"{c}"' for c in KEY)
+                dropped = conn.execute(
+                    f"DELETE FROM ratings WHERE id NOT IN "
+                    f"(SELECT MAX(id) FROM ratings GROUP BY {key_cols})").rowcount
+                conn.execute(f"CREATE UNIQUE INDEX ratings_key ON ratings ({key_cols})")
+                if dropped:
+                    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _seed(self, csv_path):
+        """Import an existing CSV log the first time the database is used."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            empty = conn.execute("SELECT 1 FROM ratings LIMIT 1").fetchone() is None
+            if empty:
+                rows = CsvLogStore(csv_path, self.columns).load().to_dict("records")
+                conn.executemany(self._insert_sql, [self._values(r) for r in rows])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+# Backends by name, e.g. for the BEER_STORAGE environment variable
+BACKENDS = {
+    "csv": CsvLogStore,
+    "sqlite": SqliteStore,
+}
+
+
+def open_store(kind, path, columns, **kwargs) -> RatingStore:
+    """Open the storage backend registered under kind."""
+    try:
+        backend = BACKENDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend {kind!r}, "
+                         f"expected one of {sorted(BACKENDS)}") from None
+    return backend(path, columns, **kwargs)
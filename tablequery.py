@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Server-side paging, sorting and filtering for the ratings DataTable.
+
+With page_action/sort_action/filter_action set to 'custom', the table
+sends page_current, page_size, sort_by and filter_query to the server.
+`parse_filter` turns the filter query into (column, operator, value)
+triples that the storage backends apply, and `query_frame` runs a whole
+query against an in-memory DataFrame.
+"""
+import math
+import operator
+
+import pandas as pd
+
+# Longest first, so '>=' is not read as '>'
+OPERATORS = [
+    ('ge', ['>=', 'ge ']),
+    ('le', ['<=', 'le ']),
+    ('lt', ['<', 'lt ']),
+    ('gt', ['>', 'gt ']),
+    ('ne', ['!=', 'ne ']),
+    ('eq', ['=', 'eq ']),
+    ('contains', ['contains ']),
+    ('datestartswith', ['datestartswith ']),
+]
+
+_COMPARE = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+}
+
+
+def split_filter_part(filter_part):
+    """Parse '{col} op value' into (col, op, value), or (None, None, None)."""
+    for op, spellings in OPERATORS:
+        for spelling in spellings:
+            if spelling in filter_part:
+                name_part, value_part = filter_part.split(spelling, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                value_part = value_part.strip()
+                if not value_part:
+                    return None, None, None
+                v0 = value_part[0]
+                if v0 == value_part[-1] and v0 in ("'", '"', '`') and len(value_part) > 1:
+                    value = value_part[1:-1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                        if value.is_integer():
+                            value = int(value)
+                    except ValueError:
+                        value = value_part
+                return name, op, value
+    return None, None, None
+
+
+def parse_filter(filter_query, columns):
+    """All (col, op, value) triples in a DataTable filter_query on known columns."""
+    filters = []
+    for part in (filter_query or '').split(' && '):
+        col, op, value = split_filter_part(part)
+        if col in columns:
+            filters.append((col, op, value))
+    return filters
+
+
+def parse_sort(sort_by, columns):
+    """[(col, ascending)] from a DataTable sort_by, ignoring unknown columns."""
+    return [(s['column_id'], s.get('direction', 'asc') == 'asc')
+            for s in (sort_by or []) if s.get('column_id') in columns]
+
+
+def page_count(total, page_size):
+    return max(1, math.ceil(total / page_size)) if page_size else 1
+
+
+def _labels(s):
+    """Categorical Øl/Navn (ratings.to_typed) as their values, so they compare and
+    sort like in SQLite instead of in category (domain) order."""
+    return s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s
+
+
+def query_frame(df, page_current, page_size, sort_by=None, filter_query=None):
+    """Apply filter, sort and paging to df; returns (page rows, total matches)."""
+    for col, op, value in parse_filter(filter_query, df.columns):
+        s = df[col]
+        if op in ('contains', 'datestartswith'):
+            text = s.astype(str)
+            mask = (text.str.contains(str(value), regex=False) if op == 'contains'
+                    else text.str.startswith(str(value)))
+        else:
+            try:
+                mask = _COMPARE[op](_labels(s), value)
+            except TypeError:
+                # e.g. {Navn} > 3: nothing matches
+                df = df.iloc[:0]
+                continue
+        df = df.loc[mask]
+
+    sort = parse_sort(sort_by, df.columns)
+    if sort:
+        df = df.sort_values([c for c, _ in sort], ascending=[a for _, a in sort],
+                            kind='stable', key=_labels)
+
+    start = (page_current or 0) * page_size
+    return df.iloc[start:start + page_size].to_dict('records'), len(df)
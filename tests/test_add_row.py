@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""add_row: patches when the browser is up to date, a full refresh otherwise."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import app  # noqa: E402
+from calendars import Calendar, CalendarConfig, CalendarRegistry  # noqa: E402
+from ratings import COLUMNS  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DOMAINS = {'Dato': list(range(1, 25)), 'Øl': ['Øl1', 'Øl2'], 'Navn': ['Tejl', 'Ems'],
+           'Smag': [1, 2, 3], 'Duft': [1, 2, 3], 'Helhedsoplevelse': [1, 2, 3],
+           'Booster': [0, 1, 2]}
+
+INPUT_IDS = {'Dato': 'dato-input', 'Øl': 'ol-input', 'Navn': 'navn-input',
+             'Smag': 'smag-input', 'Duft': 'duft-input',
+             'Helhedsoplevelse': 'helhedsoplevelse-input', 'Booster': 'booster-input'}
+
+
+def rating(dato, ol='Øl1', navn='Tejl', score=2):
+    return {'Dato': dato, 'Øl': ol, 'Navn': navn, 'Smag': score, 'Duft': score,
+            'Helhedsoplevelse': score, 'Booster': 1}
+
+
+@pytest.fixture
+def calendar(tmp_path, monkeypatch):
+    config = CalendarConfig('test', 'Test', '', DOMAINS, str(tmp_path / 'ratings'))
+    store = open_store('csv', f'{config.file}.csv', COLUMNS, domains=DOMAINS)
+    registry = CalendarRegistry({'test': config}, lambda c: Calendar(c, store), default='test')
+    monkeypatch.setattr(app, 'CALENDARS', registry)
+    monkeypatch.setattr(app, 'WRITE_BEHIND', False)
+    monkeypatch.setattr(app, 'CHART_MODE', 'server')
+    yield registry.get()
+    registry.close()
+
+
+def add_row(row, view_version, page_current=0, page_size=10, n_pages=1, sort_by=()):
+    """The add_row callback's outputs that changed, by component id."""
+    key = next(k for k in app.app.callback_map if k.startswith('..data-version.data...'))
+    spec = app.app.callback_map[key]
+    state = {INPUT_IDS[c]: row[c] for c in COLUMNS}
+    state.update({'view-version': view_version, 'navn-filter': None, 'calendar': None})
+    table = {'page_current': page_current, 'page_size': page_size, 'page_count': n_pages,
+             'sort_by': list(sort_by), 'filter_query': ''}
+    body = {
+        'output': key,
+        'outputs': [dict(zip(('id', 'property'), o.split('.', 1)))
+                    for o in key.strip('.').split('...')],
+        'inputs': [dict(spec['inputs'][0], value=1)],
+        'state': [dict(s, value=table[s['property']] if s['id'] == 'table' else state[s['id']])
+                  for s in spec['state']],
+        'changedPropIds': ['add-row.n_clicks'],
+    }
+    r = app.server.test_client().post('/_dash-update-component', json=body)
+    assert r.status_code == 200, r.data
+    return r.get_json()['response']
+
+
+def is_patch(value):
+    return isinstance(value, dict) and value.get('__dash_patch_update')
+
+
+def test_new_bar_refreshes(calendar):
+    out = add_row(rating(1), calendar.data_version())
+    assert 'data-version' in out
+    assert 'samlede_rating' not in out
+
+
+def test_current_view_gets_patches(calendar):
+    calendar.store.upsert(rating(1))
+    calendar.aggregate_frame()
+    out = add_row(rating(2), calendar.data_version())
+    assert 'data-version' not in out
+    assert is_patch(out['samlede_rating']['figure'])
+    # Two rows on a page of ten: the new one is appended to it
+    assert is_patch(out['table']['data'])
+    assert 'page_count' not in out['table']
+
+
+def test_stale_view_refreshes(calendar):
+    calendar.store.upsert(rating(1))
+    out = add_row(rating(2), 'stale')
+    assert 'data-version' in out
+    assert 'samlede_rating' not in out
+
+
+def test_correction_refreshes(calendar):
+    calendar.store.upsert(rating(1))
+    calendar.store.upsert(rating(2))
+    out = add_row(rating(2, score=3), calendar.data_version())
+    assert 'data-version' in out
+
+
+@pytest.mark.parametrize('page_current, appended', [(0, False), (1, True)])
+def test_table_patch_only_on_the_page_the_row_lands_on(calendar, page_current, appended):
+    calendar.store.upsert_many([rating(1), rating(2)])
+    calendar.aggregate_frame()
+    # Pages of two: the third row starts page 1
+    out = add_row(rating(3), calendar.data_version(), page_current, page_size=2,
+                  n_pages=1)
+    assert 'data-version' not in out
+    assert bool(is_patch(out['table'].get('data'))) == appended
+    assert out['table']['page_count'] == 2
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""The aggregate index gives the same sums however the ratings reach it."""
+import os
+import sys
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aggregates import METRICS, AggregateIndex  # noqa: E402
+from ratings import COLUMNS  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DOMAINS = {'Dato': list(range(1, 25)), 'Øl': ['Øl1', 'Øl2', 'Øl3'], 'Navn': ['Tejl', 'Ems'],
+           'Smag': [1, 2, 3], 'Duft': [1, 2, 3], 'Helhedsoplevelse': [1, 2, 3],
+           'Booster': [0, 1, 2]}
+
+
+def rating(dato, ol, navn, score):
+    return {'Dato': dato, 'Øl': ol, 'Navn': navn, 'Smag': score, 'Duft': score,
+            'Helhedsoplevelse': score, 'Booster': score - 1}
+
+
+def write_history(store, index=None):
+    """Ratings, a correction, a delete and a re-add; sync index after every write."""
+    writes = [
+        lambda: store.upsert(rating(1, 'Øl1', 'Tejl', 3)),
+        lambda: store.upsert(rating(1, 'Øl1', 'Ems', 2)),
+        lambda: store.upsert(rating(2, 'Øl2', 'Tejl', 1)),
+        lambda: store.upsert(rating(1, 'Øl1', 'Ems', 3)),      # correction
+        lambda: store.delete(2, 'Øl2', 'Tejl'),
+        lambda: store.upsert(rating(3, 'Øl3', 'Ems', 2)),
+        lambda: store.delete(3, 'Øl3', 'Ems'),
+        lambda: store.upsert(rating(3, 'Øl3', 'Ems', 1)),      # re-added
+        lambda: store.upsert_many([rating(4, 'Øl2', 'Ems', 2), rating(4, 'Øl2', 'Tejl', 3)]),
+    ]
+    for write in writes:
+        write()
+        if index is not None:
+            index.sync(store)
+
+
+def assert_int_sums(index):
+    frame = index.frame()
+    for c in METRICS + ['Count']:
+        assert frame[c].dtype.kind == 'i', c
+    assert index.day_totals()[['TotalScore', 'Count']].dtypes.map(lambda d: d.kind).eq('i').all()
+
+
+def test_cold_and_incremental_sync_agree(tmp_path):
+    for kind, name in (('csv', 'ratings.csv'), ('sqlite', 'ratings.db')):
+        path = str(tmp_path / name)
+        store = open_store(kind, path, COLUMNS, domains=DOMAINS)
+        incremental = AggregateIndex()
+        write_history(store, incremental)
+
+        cold = AggregateIndex()
+        cold.sync(open_store(kind, path, COLUMNS, domains=DOMAINS))
+        assert_int_sums(incremental)
+        assert_int_sums(cold)
+        assert_frame_equal(cold.frame(), incremental.frame())
+        assert_frame_equal(cold.day_totals(), incremental.day_totals())
+        assert cold.rows == incremental.rows == 5
+
+        # Øl1: Tejl's 3 and Ems's corrected 3; Øl2: only the batch; Øl3: the re-add
+        by_ol = cold.frame().groupby('Øl', observed=True)['TotalScore'].sum()
+        assert by_ol.to_dict() == {'Øl1': 22, 'Øl2': 18, 'Øl3': 3}
+
+
+def test_add_matches_sync(tmp_path):
+    store = open_store('csv', str(tmp_path / 'ratings.csv'), COLUMNS, domains=DOMAINS)
+    write_history(store)
+    synced = AggregateIndex()
+    synced.sync(store)
+
+    added = AggregateIndex()
+    log = pd.read_csv(store.path)
+    for row in log.to_dict('records'):
+        added.add(row)
+    assert_frame_equal(added.frame(), synced.frame(), check_dtype=False)
+    assert added.rows == synced.rows
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Evicting calendars that requests are still using."""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from calendars import Calendar, CalendarConfig, CalendarRegistry  # noqa: E402
+from ratings import COLUMNS  # noqa: E402
+from storage import open_store  # noqa: E402
+from writebehind import WriteBehindStore  # noqa: E402
+
+DOMAINS = {'Dato': list(range(1, 25)), 'Øl': ['Øl1', 'Øl2'], 'Navn': ['Tejl', 'Ems'],
+           'Smag': [1, 2, 3], 'Duft': [1, 2, 3], 'Helhedsoplevelse': [1, 2, 3],
+           'Booster': [0, 1, 2]}
+
+RATING = {'Dato': 1, 'Øl': 'Øl1', 'Navn': 'Tejl', 'Smag': 3, 'Duft': 2,
+          'Helhedsoplevelse': 1, 'Booster': 0}
+
+
+def write_behind_registry(tmp_path, max_open=1):
+    configs = {slug: CalendarConfig(slug, slug, '', DOMAINS, str(tmp_path / slug))
+               for slug in ('a', 'b')}
+
+    def opener(config):
+        store = open_store('csv', f'{config.file}.csv', COLUMNS, domains=DOMAINS)
+        return Calendar(config, WriteBehindStore(store, flush_interval=60))
+
+    return CalendarRegistry(configs, opener, default='a', max_open=max_open)
+
+
+def stored(tmp_path, slug):
+    return len(open_store('csv', str(tmp_path / f'{slug}.csv'), COLUMNS).load())
+
+
+def test_evicted_calendar_stays_open_while_held(tmp_path):
+    registry = write_behind_registry(tmp_path)
+    held = registry.acquire('a')
+    started, evicted = threading.Event(), threading.Event()
+    errors = []
+
+    def add_row():
+        # A request that picked up its calendar before the eviction
+        started.set()
+        evicted.wait(5)
+        try:
+            held.upsert_rating(RATING)
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+        finally:
+            registry.release(held)
+
+    writer = threading.Thread(target=add_row)
+    writer.start()
+    started.wait(5)
+    registry.get('b')  # evicts 'a'
+    assert registry.stats()['evicted'] == 1
+    evicted.set()
+    writer.join(5)
+
+    assert errors == []
+    # The last release closed it, which committed the queued rating
+    assert stored(tmp_path, 'a') == 1
+    with pytest.raises(RuntimeError):
+        held.upsert_rating(RATING)
+    assert registry.get('a') is not held
+    registry.close()
+
+
+def test_unheld_calendar_closes_on_eviction(tmp_path):
+    registry = write_behind_registry(tmp_path)
+    a = registry.get('a')
+    a.upsert_rating(RATING)
+    registry.get('b')
+    assert stored(tmp_path, 'a') == 1
+    with pytest.raises(RuntimeError):
+        a.upsert_rating(RATING)
+    registry.close()
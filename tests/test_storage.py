@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Rating stores: crash recovery, rewrites under live readers, deletes."""
+import errno
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import storage  # noqa: E402
+from aggregates import AggregateIndex  # noqa: E402
+from ratings import COLUMNS  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DOMAINS = {'Dato': list(range(1, 25)), 'Øl': [f'Øl{i}' for i in range(1, 25)],
+           'Navn': ['Tejl', 'Ems'], 'Smag': [1, 2, 3], 'Duft': [1, 2, 3],
+           'Helhedsoplevelse': [1, 2, 3], 'Booster': [0, 1, 2]}
+
+
+def rating(i, smag):
+    return {'Dato': i + 1, 'Øl': f'Øl{i + 1}', 'Navn': 'Tejl', 'Smag': smag, 'Duft': 1,
+            'Helhedsoplevelse': 1, 'Booster': 0}
+
+
+def open_csv(path, snapshot=False):
+    return open_store('csv', path, COLUMNS, domains=DOMAINS, snapshot=snapshot)
+
+
+def test_compact_twice_then_incremental_read(tmp_path):
+    # Two rewrites can put the log back on the inode a reader's cursor has
+    for snapshot in (False, True):
+        path = str(tmp_path / f'ratings-{snapshot}.csv')
+        writer = open_csv(path, snapshot)
+        for smag in (1, 2):
+            for i in range(5):
+                writer.upsert(rating(i, smag))
+        reader = open_csv(path, snapshot)
+        index = AggregateIndex()
+        index.sync(reader)
+        assert len(reader.load_cached()) == 5
+
+        writer.compact()
+        writer.compact()
+        for i in range(5, 13):
+            writer.upsert(rating(i, 3))
+        index.sync(reader)
+        assert len(writer.load()) == 13
+        assert len(reader.load_cached()) == 13
+        assert int(index.frame()['Count'].sum()) == 13
+
+
+def test_rewrite_on_same_inode_resets_cursor(tmp_path):
+    path = str(tmp_path / 'ratings.csv')
+    store = open_csv(path)
+    for i in range(3):
+        store.upsert(rating(i, 1))
+    _, cursor, _ = store.changes_since(None)
+    before = store.version()
+
+    store.replace(store.load().iloc[:1])
+    store.upsert(rating(3, 2))
+    # As if the file system had reused the inode number and the log grew back
+    stale = (cursor[0], os.stat(path).st_ino, cursor[2])
+    df, _, reset = store.changes_since(stale)
+    assert reset
+    assert sorted(df['Dato'].tolist()) == [1, 4]
+    assert store.version() != before
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = str(tmp_path / 'ratings.csv')
+    store = open_csv(path)
+    store.upsert(rating(0, 1))
+    store.upsert(rating(1, 2))
+    with open(path, 'ab') as f:
+        f.write(b'3,\xc3\x98l3,Tejl,2')  # a crash in the middle of an append
+    reader = open_csv(path)
+    assert len(reader.load()) == 2
+    with open(path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+    reader.upsert(rating(2, 3))
+    assert sorted(reader.load()['Dato'].tolist()) == [1, 2, 3]
+
+
+def test_torn_line_during_read_waits_for_the_rest(tmp_path):
+    path = str(tmp_path / 'ratings.csv')
+    store = open_csv(path)
+    store.upsert(rating(0, 1))
+    _, cursor, _ = store.changes_since(None)
+    line = store._encode(rating(1, 2))
+    with open(path, 'ab') as f:
+        f.write(line[:5])
+    df, cursor, reset = store.changes_since(cursor)
+    assert df.empty and not reset
+    with open(path, 'ab') as f:
+        f.write(line[5:])
+    df, _, reset = store.changes_since(cursor)
+    assert df['Dato'].tolist() == [2] and not reset
+
+
+def test_short_writes_are_completed(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ratings.csv')
+    store = open_csv(path)
+    write = os.write
+    monkeypatch.setattr(storage.os, 'write', lambda fd, data: write(fd, bytes(data[:7])))
+    _, after = store.upsert_many([rating(i, 1) for i in range(3)])
+    monkeypatch.undo()
+    assert after.rsplit(':', 1)[1] == str(os.path.getsize(path))
+    assert len(open_csv(path).load()) == 3
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path, monkeypatch):
+    path = str(tmp_path / 'ratings.csv')
+    store = open_csv(path)
+    store.upsert(rating(0, 1))
+    size = os.path.getsize(path)
+    write, calls = os.write, []
+
+    def full_disk(fd, data):
+        calls.append(fd)
+        if len(calls) > 1:
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return write(fd, bytes(data[:len(data) // 2]))
+
+    monkeypatch.setattr(storage.os, 'write', full_disk)
+    with pytest.raises(OSError):
+        store.upsert_many([rating(i, 2) for i in range(1, 4)])
+    monkeypatch.undo()
+    assert os.path.getsize(path) == size
+    assert len(open_csv(path).load()) == 1
+
+
+def test_compaction_keeps_live_readers_in_step(tmp_path):
+    for snapshot in (False, True):
+        path = str(tmp_path / f'ratings-{snapshot}.csv')
+        writer = open_csv(path, snapshot)
+        reader = open_csv(path, snapshot)
+        index = AggregateIndex()
+        for i in range(20):
+            writer.upsert(rating(i % 8, i % 3 + 1))
+            if i % 5 == 4:
+                writer.compact()
+            if i % 3 == 0:
+                writer.delete(i % 8 + 1, f'Øl{i % 8 + 1}', 'Tejl')
+            index.sync(reader)
+            expected = writer.load()
+            assert len(reader.load_cached()) == len(expected)
+            assert index.rows == len(expected)
+            assert reader.version() == writer.version()
+
+
+def append_ratings(path, first, n):
+    store = open_store('csv', path, COLUMNS)
+    for i in range(first, first + n):
+        store.upsert({'Dato': i, 'Øl': 'Øl1', 'Navn': 'Tejl', 'Smag': 1, 'Duft': 1,
+                      'Helhedsoplevelse': 1, 'Booster': 0})
+
+
+def compact_until(path, stop):
+    store = open_store('csv', path, COLUMNS)
+    while not stop.is_set():
+        store.compact()
+
+
+def test_compaction_in_another_process_loses_no_appends(tmp_path):
+    path = str(tmp_path / 'ratings.csv')
+    stop = multiprocessing.Event()
+    compactor = multiprocessing.Process(target=compact_until, args=(path, stop))
+    compactor.start()
+    writers = [multiprocessing.Process(target=append_ratings, args=(path, w * 100, 60))
+               for w in range(3)]
+    for w in writers:
+        w.start()
+    for w in writers:
+        w.join(60)
+    stop.set()
+    compactor.join(60)
+    assert len(open_store('csv', path, COLUMNS).load()) == 180
+
+
+def test_sqlite_delete_and_re_add(tmp_path):
+    path = str(tmp_path / 'ratings.db')
+    store = open_store('sqlite', path, COLUMNS, domains=DOMAINS)
+    reader = open_store('sqlite', path, COLUMNS, domains=DOMAINS)
+    store.upsert_many([rating(0, 1), rating(1, 2)])
+    _, cursor, _ = reader.changes_since(None)
+    assert len(reader.load_cached()) == 2
+
+    assert store.delete(1, 'Øl1', 'Tejl') is not None
+    assert store.delete(1, 'Øl1', 'Tejl') is None  # already gone
+    assert store.lookup(1, 'Øl1', 'Tejl') is None
+    df, cursor, reset = reader.changes_since(cursor)
+    assert not reset and len(df) == 1 and df['Smag'].isna().all()  # the tombstone
+    assert reader.load_cached()['Dato'].tolist() == [2]
+    assert len(store.load()) == 1
+    assert store.query(0, 10)[1] == 1
+
+    store.upsert(rating(0, 3))
+    df, _, _ = reader.changes_since(cursor)
+    assert df['Smag'].tolist() == [3]
+    assert reader.lookup(1, 'Øl1', 'Tejl')['Smag'] == 3
+    assert sorted(reader.load_cached()['Dato'].tolist()) == [1, 2]
+    assert sorted(open_store('sqlite', path, COLUMNS).load()['Dato'].tolist()) == [1, 2]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Table sorting and filtering agree between the storage backends."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ratings import COLUMNS  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DOMAINS = {'Dato': list(range(1, 25)), 'Øl': ['Øl2', 'Øl1'],
+           'Navn': ['Tejl', 'Stein', 'Ems', 'Miks'], 'Smag': [1, 2, 3], 'Duft': [1, 2, 3],
+           'Helhedsoplevelse': [1, 2, 3], 'Booster': [0, 1, 2]}
+
+
+def test_categorical_columns_sort_and_filter_by_value(tmp_path):
+    for kind, name in (('csv', 'ratings.csv'), ('sqlite', 'ratings.db')):
+        store = open_store(kind, str(tmp_path / name), COLUMNS, domains=DOMAINS)
+        for i, navn in enumerate(DOMAINS['Navn']):
+            store.upsert({'Dato': i + 1, 'Øl': 'Øl1', 'Navn': navn, 'Smag': 1, 'Duft': 1,
+                          'Helhedsoplevelse': 1, 'Booster': 0})
+        rows, _ = store.query(0, 10, [{'column_id': 'Navn', 'direction': 'asc'}])
+        assert [r['Navn'] for r in rows] == ['Ems', 'Miks', 'Stein', 'Tejl'], kind
+        rows, total = store.query(0, 10, [{'column_id': 'Navn', 'direction': 'desc'}],
+                                  '{Navn} > M')
+        assert [r['Navn'] for r in rows] == ['Tejl', 'Stein', 'Miks'], kind
+        assert total == 3
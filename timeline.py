@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Day-by-day standings over the calendar, vectorized with NumPy.
+
+`ol_timeline` lays the per-(Dato, Øl) TotalScore sums of the aggregate
+index (AggregateIndex.day_totals) out as a (Dato x Øl) matrix and takes
+its prefix sums down the days, which gives every Øl's cumulative score
+after each day; the ranks of all days come from one argsort of that
+matrix. A new rating only changes one (Dato, Øl) cell of the index, and
+building the timeline costs O(days x beers), however many ratings there
+are.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# days: the days up to the last rated one; ol: the rated Øl, best at the
+# last day first; score, cumulative and rank: (days x ol) arrays, rank 1
+# is best and ties keep the Øl in alphabetical order
+Timeline = namedtuple('Timeline', 'days ol score cumulative rank')
+
+
+def ol_timeline(day_totals, days=()) -> Timeline:
+    """Every rated Øl's score, cumulative score and rank after each day.
+
+    day_totals is AggregateIndex.day_totals(); days are the calendar's
+    days, so days without ratings are included too (up to the last day
+    that has ratings).
+    """
+    if day_totals.empty:
+        empty = np.zeros((0, 0), dtype=np.int64)
+        return Timeline([], [], empty, empty, empty)
+
+    dato = day_totals['Dato'].to_numpy()
+    all_days = np.union1d(np.asarray(list(days), dtype=dato.dtype), dato)
+    all_days = all_days[all_days <= dato.max()]
+    labels, ol = np.unique(day_totals['Øl'].to_numpy(dtype=object), return_inverse=True)
+    totals = day_totals['TotalScore'].to_numpy()
+
+    score = np.zeros((len(all_days), len(labels)), dtype=np.result_type(totals, np.int64))
+    np.add.at(score, (np.searchsorted(all_days, dato), ol), totals)
+    cumulative = score.cumsum(axis=0)
+
+    order = np.argsort(-cumulative, axis=1, kind='stable')
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(1, len(labels) + 1)[None, :], axis=1)
+
+    final = order[-1]
+    return Timeline(all_days.tolist(), labels[final].tolist(),
+                    score[:, final], cumulative[:, final], rank[:, final])
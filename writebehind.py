@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind buffering for a rating store.
+
+When every taster submits the day's beer at the same moment, each submit
+pays for its own fsync (CSV) or transaction (SQLite) and waits for the
+others. `WriteBehindStore` wraps a store so that `upsert` only puts the
+rating on an in-memory queue and returns at once; a background thread
+stores the queue with `upsert_many`, i.e. one group commit per batch.
+
+A batch is committed flush_interval seconds after the first rating
+arrived in an empty queue, or as soon as batch_size ratings are waiting.
+Reads (load, lookup, changes_since, ...) go to the wrapped store, so a
+queued rating shows up once it has been committed.
+
+The queue lives in this process: a crash loses at most the ratings of
+the last flush_interval. On a normal exit (atexit, or close()) the queue
+is committed when on_shutdown is "flush" and discarded when it is "drop".
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+log = logging.getLogger(__name__)
+
+SHUTDOWN_MODES = ("flush", "drop")
+
+
+class WriteBehindStore:
+    """A rating store whose upserts are queued and group committed in the background."""
+
+    def __init__(self, store, flush_interval=0.05, batch_size=256, on_shutdown="flush",
+                 timer=None):
+        if on_shutdown not in SHUTDOWN_MODES:
+            raise ValueError(f"on_shutdown must be one of {SHUTDOWN_MODES}, "
+                             f"not {on_shutdown!r}")
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.on_shutdown = on_shutdown
+        # timer(stage) -> context manager, to time the commits (see instrumentation)
+        self._timer = timer or (lambda stage: nullcontext())
+        self._pending = deque()
+        self._cond = threading.Condition()
+        # One group commit at a time, so batches are stored in queue order
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._stats = {"queued": 0, "committed": 0, "batches": 0, "failures": 0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- Writing ----------
+    def upsert(self, row: dict):
+        """Queue one rating; returns None, as the versions are not known yet."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind store is closed")
+            self._pending.append(dict(row))
+            self._stats["queued"] += 1
+            self._cond.notify()
+        return None
+
+    def upsert_many(self, rows):
+        """Commit rows right away as one group commit (after the queue, to keep the order)."""
+        self.flush()
+        return self.store.upsert_many(rows)
+
+    def delete(self, dato, ol, navn):
+        """Delete right away (after committing the queue, to keep the order)."""
+        self.flush()
+        return self.store.delete(dato, ol, navn)
+
+    def replace(self, df):
+        self.flush()
+        self.store.replace(df)
+
+    def compact(self, *args):
+        self.flush()
+        self.store.compact(*args)
+
+    def flush(self):
+        """Commit everything queued so far, in batches of batch_size."""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    n = min(self.batch_size, len(self._pending))
+                    batch = [self._pending.popleft() for _ in range(n)]
+                if not batch:
+                    return
+                try:
+                    with self._timer("flush"):
+                        self.store.upsert_many(batch)
+                except BaseException:
+                    # Back to the front of the queue for the next attempt
+                    with self._cond:
+                        self._pending.extendleft(reversed(batch))
+                        self._stats["failures"] += 1
+                    raise
+                with self._cond:
+                    self._stats["committed"] += len(batch)
+                    self._stats["batches"] += 1
+
+    def close(self):
+        """Stop the background thread and flush or drop the queue (see on_shutdown)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        atexit.unregister(self.close)
+        self._thread.join()
+        if self.on_shutdown == "flush":
+            self.flush()
+        else:
+            with self._cond:
+                dropped = len(self._pending)
+                self._pending.clear()
+            if dropped:
+                log.warning("write-behind: dropped %d queued rating(s) on shutdown", dropped)
+
+    def stats(self) -> dict:
+        """Counters for /metrics, plus the number of ratings still queued."""
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                # Give the rest of the burst flush_interval to join this batch
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size
+                                    or self._closed, self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                log.exception("write-behind: group commit failed, retrying")
+                time.sleep(max(self.flush_interval, 0.1))
+
+    # ---------- Reading (from the wrapped store) ----------
+    def load(self):
+        return self.store.load()
+
+    def load_cached(self):
+        return self.store.load_cached()
+
+    def lookup(self, dato, ol, navn):
+        return self.store.lookup(dato, ol, navn)
+
+    def query(self, page_current, page_size, sort_by=None, filter_query=None):
+        return self.store.query(page_current, page_size, sort_by, filter_query)
+
+    def changes_since(self, cursor):
+        return self.store.changes_since(cursor)
+
+    def iter_ratings(self, chunksize):
+        return self.store.iter_ratings(chunksize)
+
+    def version(self) -> str:
+        return self.store.version()
+
+    def version_of(self, cursor) -> str:
+        return self.store.version_of(cursor)
+
+    @property
+    def columns(self):
+        return self.store.columns